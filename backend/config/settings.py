@@ -181,13 +181,50 @@ LOGGING = {
     },
 }
 
-CELERY_BROKER_URL = "redis://localhost:6379/0"  # or your RabbitMQ URL
-CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
+# Run tasks in-process (no worker needed), e.g. for tests:
+#   CELERY_TASK_ALWAYS_EAGER=1 python manage.py runserver
+# or use a local broker without Redis:
+#   CELERY_BROKER_URL=filesystem:// celery -A config worker
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER") == "1"
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BROKER_URL = os.environ.get(
+    "CELERY_BROKER_URL",
+    "memory://" if CELERY_TASK_ALWAYS_EAGER else "redis://localhost:6379/0",
+)  # or your RabbitMQ URL
+# Upload jobs keep their state in the DB, so results only go to Redis when it's the broker
+CELERY_RESULT_BACKEND = os.environ.get(
+    "CELERY_RESULT_BACKEND",
+    "redis://localhost:6379/0"
+    if CELERY_BROKER_URL.startswith("redis")
+    else "cache+memory://",
+)
+if CELERY_BROKER_URL.startswith("filesystem://"):
+    CELERY_BROKER_FOLDER = os.path.join(BASE_DIR, "celery_broker")
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        "data_folder_in": CELERY_BROKER_FOLDER,
+        "data_folder_out": CELERY_BROKER_FOLDER,
+        "control_folder": os.path.join(CELERY_BROKER_FOLDER, "control"),
+    }
+    os.makedirs(CELERY_BROKER_FOLDER, exist_ok=True)
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Africa/Algiers"
 
+# Uploaded CSVs wait here until their ingestion job picks them up
+UPLOAD_STAGING_DIR = os.environ.get(
+    "UPLOAD_STAGING_DIR", os.path.join(BASE_DIR, "upload_staging")
+)
+# Package files above this size are cleaned and loaded chunk by chunk
+UPLOAD_STREAMING_THRESHOLD_BYTES = int(
+    os.environ.get("UPLOAD_STREAMING_THRESHOLD_BYTES", 200 * 1024 * 1024)
+)
+UPLOAD_STREAMING_CHUNK_ROWS = int(
+    os.environ.get("UPLOAD_STREAMING_CHUNK_ROWS", 200_000)
+)
+# Rows per executemany batch of the upload bulk loader
+BULK_LOAD_BATCH_SIZE = int(os.environ.get("BULK_LOAD_BATCH_SIZE", 5000))
+
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
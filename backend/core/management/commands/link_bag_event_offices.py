@@ -0,0 +1,75 @@
+import logging
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from core.models import BagEvent
+from core.utils.office_resolver import office_directory, resolve_office_names
+
+logger = logging.getLogger(__name__)
+
+# établissement column → (office FK, state FK) it resolves to
+OFFICE_FIELDS = {
+    "etablissement_postal": ("office_id", "state_id"),
+    "nextetablissement_postal": ("next_office_id", "next_state_id"),
+}
+
+
+class Command(BaseCommand):
+    help = "Resolve the office / state of historical BagEvents from their établissement names."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50_000,
+            help="Event ids covered by each batch of UPDATE statements",
+        )
+
+    def link(self, name_field, office_field, state_field, directory, batch_size):
+        """Fill one office / state pair, one UPDATE per office and id range."""
+        unlinked = BagEvent.objects.filter(
+            **{f"{office_field}__isnull": True, f"{name_field}__isnull": False}
+        )
+        bounds = unlinked.aggregate(first=Min("id"), last=Max("id"))
+        if bounds["first"] is None:
+            return 0
+
+        linked = 0
+        for start in range(bounds["first"], bounds["last"] + 1, batch_size):
+            batch = unlinked.filter(id__gte=start, id__lt=start + batch_size)
+            names = batch.values_list(name_field, flat=True).distinct()
+            # Names of the same office are updated together
+            names_by_ids = defaultdict(list)
+            for name, ids in resolve_office_names(names, directory).items():
+                if ids is not None:
+                    names_by_ids[ids].append(name)
+            for (office_id, state_id), names in names_by_ids.items():
+                linked += batch.filter(**{f"{name_field}__in": names}).update(
+                    **{office_field: office_id, state_field: state_id}
+                )
+            self.stdout.write(
+                f"→ {office_field}: {linked} events linked (ids < {start + batch_size})"
+            )
+
+        remaining = unlinked.count()
+        logger.info(
+            f"🏤 {office_field}: linked {linked} events, {remaining} names matched no office"
+        )
+        return linked
+
+    def handle(self, *args, **options):
+        directory = office_directory()
+        linked = {
+            office_field: self.link(
+                name_field, office_field, state_field, directory, options["batch_size"]
+            )
+            for name_field, (office_field, state_field) in OFFICE_FIELDS.items()
+        }
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n🎉 Completed! {linked['office_id']} offices and "
+                f"{linked['next_office_id']} next offices linked"
+            )
+        )
@@ -0,0 +1,46 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, Max, Min, OuterRef, Subquery
+
+from core.models import Package, PackageEvent
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Link historical PackageEvents without a package to the Package of their mailitm_fid."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50_000,
+            help="Event ids covered by each UPDATE statement",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        unlinked = PackageEvent.objects.filter(package__isnull=True)
+        bounds = unlinked.aggregate(first=Min("id"), last=Max("id"))
+        if bounds["first"] is None:
+            self.stdout.write(self.style.SUCCESS("✅ No unlinked events"))
+            return
+
+        package = Package.objects.filter(mailitm_fid=OuterRef("mailitm_fid"))
+        linked = 0
+        # One set-based UPDATE ... SET package_id = (SELECT ...) per id range
+        for start in range(bounds["first"], bounds["last"] + 1, batch_size):
+            linked += unlinked.filter(
+                Exists(package), id__gte=start, id__lt=start + batch_size
+            ).update(package_id=Subquery(package.values("id")[:1]))
+            self.stdout.write(f"→ {linked} events linked (ids < {start + batch_size})")
+
+        remaining = unlinked.count()
+        logger.info(f"🔗 Linked {linked} events, {remaining} have no package")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n🎉 Completed! {linked} events linked, "
+                f"{remaining} still without a package"
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.utils.kpi_rollups import ROLLUP_SOURCES, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily KPI rollups behind the dashboard / major center charts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=list(ROLLUP_SOURCES),
+            help="Only rebuild the rollups of this snapshot model",
+        )
+
+    def handle(self, *args, **options):
+        rebuild_rollups(options["source"])
+        self.stdout.write(self.style.SUCCESS("✅ KPI rollups rebuilt"))
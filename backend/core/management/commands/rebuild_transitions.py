@@ -0,0 +1,42 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from core.models import Package, PackageTransition
+from core.utils.transitions_helper import rebuild_transitions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the PackageTransition rows of every package from its events "
+        "(drops the duplicates left by earlier re-uploads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Packages rebuilt per pass",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        before = PackageTransition.objects.count()
+        package_ids = list(Package.objects.order_by("id").values_list("id", flat=True))
+
+        written = 0
+        for i in range(0, len(package_ids), batch_size):
+            written += rebuild_transitions(package_ids[i : i + batch_size])
+            self.stdout.write(
+                f"→ {min(i + batch_size, len(package_ids))}/{len(package_ids)} packages"
+            )
+
+        logger.info(f"🔁 Rebuilt {written} transitions ({before} before)")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n🎉 Completed! {written} transitions ({before} before)"
+            )
+        )
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0024_remove_airportstats_airport_consolidation_time_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("package", "Package events"), ("bag", "Bag events")],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("success", "Success"),
+                            ("failure", "Failure"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                ("phase", models.CharField(blank=True, default="", max_length=50)),
+                ("filename", models.CharField(max_length=255)),
+                ("file_size_bytes", models.BigIntegerField(default=0)),
+                ("file_path", models.CharField(max_length=500)),
+                ("rows_total", models.IntegerField(blank=True, null=True)),
+                ("rows_processed", models.IntegerField(default=0)),
+                ("phase_timings", models.JSONField(blank=True, default=dict)),
+                ("result", models.JSONField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0025_uploadjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadmetadata",
+            name="bad_lines_count",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0026_uploadmetadata_bad_lines_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PackageKPIContribution",
+            fields=[
+                (
+                    "package",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="kpi_contribution",
+                        serialize=False,
+                        to="core.package",
+                    ),
+                ),
+                ("total_packages", models.SmallIntegerField(default=1)),
+                ("success_count", models.SmallIntegerField(default=0)),
+                ("failure_count", models.SmallIntegerField(default=0)),
+                ("in_process_count", models.SmallIntegerField(default=0)),
+                ("on_time_count", models.SmallIntegerField(default=0)),
+                ("delivery_duration_count", models.SmallIntegerField(default=0)),
+                ("delivery_duration_us", models.BigIntegerField(default=0)),
+                ("recovered_count", models.SmallIntegerField(default=0)),
+                ("recovered_failures", models.IntegerField(default=0)),
+                ("failed_cities", models.IntegerField(default=0)),
+                ("failed_with_movement_count", models.SmallIntegerField(default=0)),
+                ("in_customs_count", models.SmallIntegerField(default=0)),
+                ("exited_customs_count", models.SmallIntegerField(default=0)),
+                ("customs_alert_count", models.SmallIntegerField(default=0)),
+                ("hold_duration_count", models.SmallIntegerField(default=0)),
+                ("hold_duration_us", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RunningKPI",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=64, unique=True)),
+                (
+                    "value",
+                    models.DecimalField(decimal_places=0, default=0, max_digits=30),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="KPIDirtyEntity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("package", "Package"), ("bag", "Bag")], max_length=16
+                    ),
+                ),
+                ("entity_id", models.BigIntegerField()),
+                ("marked_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("kind", "entity_id")},
+            },
+        ),
+    ]
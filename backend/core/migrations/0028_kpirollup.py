@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0027_kpi_tracking"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KPIRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=32)),
+                ("kpi_name", models.CharField(max_length=64)),
+                ("day", models.DateField()),
+                ("total", models.FloatField(default=0)),
+                ("value_count", models.IntegerField(default=0)),
+                ("snapshot_count", models.IntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("source", "kpi_name", "day")},
+            },
+        ),
+    ]
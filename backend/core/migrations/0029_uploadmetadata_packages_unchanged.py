@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0028_kpirollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadmetadata",
+            name="packages_unchanged",
+            field=models.IntegerField(default=0),
+        ),
+    ]
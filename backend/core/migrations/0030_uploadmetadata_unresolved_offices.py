@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0029_uploadmetadata_packages_unchanged"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadmetadata",
+            name="unresolved_offices",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0030_uploadmetadata_unresolved_offices"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="baguploadmetadata",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadmetadata",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name="UploadChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("package", "Package events"), ("bag", "Bag events")],
+                        max_length=20,
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("chunk_index", models.IntegerField()),
+                ("chunk_hash", models.CharField(max_length=64)),
+                ("counts", models.JSONField(blank=True, default=dict)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["chunk_index"],
+                "unique_together": {("kind", "content_hash", "chunk_index")},
+            },
+        ),
+    ]
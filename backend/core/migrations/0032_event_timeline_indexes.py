@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0031_upload_content_hash_uploadchunk"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="bagevent",
+            name="core_bageve_recepta_7d3ad1_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="packageevent",
+            name="core_packag_mailitm_93a35a_idx",
+        ),
+        migrations.AddIndex(
+            model_name="bagevent",
+            index=models.Index(
+                fields=["receptacle_fid", "date"], name="core_bageve_recepta_70927a_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="packageevent",
+            index=models.Index(
+                fields=["mailitm_fid", "date"], name="core_packag_mailitm_0ff254_idx"
+            ),
+        ),
+    ]
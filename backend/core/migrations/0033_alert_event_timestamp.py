@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0032_event_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alert",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
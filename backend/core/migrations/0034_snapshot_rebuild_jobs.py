@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0033_alert_event_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadjob",
+            name="params",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name="uploadchunk",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("package", "Package events"),
+                    ("bag", "Bag events"),
+                    ("snapshots", "Dashboard snapshots rebuild"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uploadjob",
+            name="file_path",
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AlterField(
+            model_name="uploadjob",
+            name="filename",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="uploadjob",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("package", "Package events"),
+                    ("bag", "Bag events"),
+                    ("snapshots", "Dashboard snapshots rebuild"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,12 +1,13 @@
 from .bag import Bag, BagEvent
 from .dashboard import Dashboard
 from .history import KPIHistory
+from .kpi import KPIDirtyEntity, RunningKPI, PackageKPIContribution, KPIRollup
 from .major_center import CPXStats, CTNIStats, AirportStats
 from .map import OfficeStats, StateStats, Alert
 from .package import Package, PackageEvent
 from .states_offices import State, PostalOffice
 from .transition import PackageTransition
-from .upload import UploadMetaData, BagUploadMetaData
+from .upload import UploadMetaData, BagUploadMetaData, UploadJob, UploadChunk
 
 
 __all__ = [
@@ -15,6 +16,10 @@ __all__ = [
     "Dashboard",
     "PackageEvent",
     "KPIHistory",
+    "KPIDirtyEntity",
+    "RunningKPI",
+    "PackageKPIContribution",
+    "KPIRollup",
     "CPXStats",
     "CTNIStats",
     "AirportStats",
@@ -27,4 +32,6 @@ __all__ = [
     "PackageTransition",
     "UploadMetaData",
     "BagUploadMetaData",
+    "UploadJob",
+    "UploadChunk",
 ]
@@ -41,7 +41,8 @@ class BagEvent(models.Model):
             "etablissement_postal",
         )
         indexes = [
-            models.Index(fields=["receptacle_fid"]),
+            # Timelines: one bag's events in date order
+            models.Index(fields=["receptacle_fid", "date"]),
             models.Index(fields=["date"]),
             models.Index(fields=["country"]),
         ]
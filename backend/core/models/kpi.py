@@ -0,0 +1,87 @@
+from django.db import models
+
+from .package import Package
+
+
+class KPIDirtyEntity(models.Model):
+    """
+    Entities changed by an upload since the last incremental KPI refresh.
+    Offices and states are derived from the events of the dirty packages.
+    """
+
+    class Kind(models.TextChoices):
+        PACKAGE = "package", "Package"
+        BAG = "bag", "Bag"
+
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    entity_id = models.BigIntegerField()
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("kind", "entity_id")
+
+    def __str__(self):
+        return f"dirty {self.kind} #{self.entity_id}"
+
+
+class RunningKPI(models.Model):
+    """Running count / sum behind the dashboard KPIs (sums of durations in µs)."""
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.DecimalField(max_digits=30, decimal_places=0, default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class PackageKPIContribution(models.Model):
+    """
+    What a package currently adds to the RunningKPI totals, so that its old
+    contribution can be taken out when the package changes.
+    """
+
+    package = models.OneToOneField(
+        Package,
+        related_name="kpi_contribution",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    total_packages = models.SmallIntegerField(default=1)
+    success_count = models.SmallIntegerField(default=0)
+    failure_count = models.SmallIntegerField(default=0)
+    in_process_count = models.SmallIntegerField(default=0)
+    on_time_count = models.SmallIntegerField(default=0)
+    delivery_duration_count = models.SmallIntegerField(default=0)
+    delivery_duration_us = models.BigIntegerField(default=0)
+    recovered_count = models.SmallIntegerField(default=0)
+    recovered_failures = models.IntegerField(default=0)
+    failed_cities = models.IntegerField(default=0)
+    failed_with_movement_count = models.SmallIntegerField(default=0)
+    in_customs_count = models.SmallIntegerField(default=0)
+    exited_customs_count = models.SmallIntegerField(default=0)
+    customs_alert_count = models.SmallIntegerField(default=0)
+    hold_duration_count = models.SmallIntegerField(default=0)
+    hold_duration_us = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"KPI contribution of package #{self.package_id}"
+
+
+class KPIRollup(models.Model):
+    """
+    Daily sum / count of one KPI of a snapshot model (Dashboard, hub and
+    airport stats), so that time series never scan the snapshots.
+    """
+
+    source = models.CharField(max_length=32)
+    kpi_name = models.CharField(max_length=64)
+    day = models.DateField()
+    total = models.FloatField(default=0)
+    value_count = models.IntegerField(default=0)
+    snapshot_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("source", "kpi_name", "day")
+
+    def __str__(self):
+        return f"{self.source}.{self.kpi_name} on {self.day}"
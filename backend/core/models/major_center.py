@@ -2,7 +2,7 @@ from core.models.bag import Bag
 from core.models.package import Package, PackageEvent
 from django.db import models
 from django.utils import timezone
-from django.db.models import F, Avg, Count, Q, Max
+from django.db.models import F, Avg, Count, Exists, Max, Min, OuterRef, Q
 import pandas as pd
 
 
@@ -64,54 +64,78 @@ class HubStatsBase(models.Model):
         `hub_name` is now only for logging.
         """
 
-        # Use provided querysets or default to all
-        packages = packages_queryset or Package.objects.all()
-        events = events_queryset or PackageEvent.objects.all()
-        bags = bag_queryset or Bag.objects.all()
+        # Use provided querysets or default to all (an `or` would evaluate them)
+        packages = (
+            Package.objects.all() if packages_queryset is None else packages_queryset
+        )
+        events = (
+            PackageEvent.objects.all() if events_queryset is None else events_queryset
+        )
+        bags = Bag.objects.all() if bag_queryset is None else bag_queryset
 
         # -------------------------------
         # Volumes
         # -------------------------------
-
-        # Count all bags that have at least one package
-        incoming_bags_count = bags.filter(packages__isnull=False).distinct().count()
-
-        # Outgoing bags: any bag that has a DISPATCHED event
-        outgoing_bags_count = (
-            bags.filter(packages__events__event_type_cd__icontains="DISPATCHED")
-            .distinct()
-            .count()
+        bag_counts = bags.aggregate(
+            # Count all bags that have at least one package
+            incoming=Count("pk", filter=Q(packages__isnull=False), distinct=True),
+            # Outgoing bags: any bag that has a DISPATCHED event
+            outgoing=Count(
+                "pk",
+                filter=Q(packages__events__event_type_cd__icontains="DISPATCHED"),
+                distinct=True,
+            ),
         )
+        incoming_bags_count = bag_counts["incoming"]
+        outgoing_bags_count = bag_counts["outgoing"]
 
         # Delayed arrivals: any event with type ARRIVAL where date > expected_arrival
         delayed_arrivals_count = events.filter(
             event_type_cd__icontains="ARRIVAL",
         ).count()
 
-        # Unprocessed items: packages with no events
-        unprocessed_items_count = packages.filter(events__isnull=True).count()
+        package_counts = packages.aggregate(
+            total=Count("pk"),
+            # Unprocessed items: packages with no events
+            without_events=Count(
+                "pk",
+                filter=~Exists(PackageEvent.objects.filter(package=OuterRef("pk"))),
+            ),
+            alerts=Count("pk", filter=Q(alert_after_success=True)),
+            seized=Count("pk", filter=Q(flag_seized=True)),
+            exceeding_holding_time=Count(
+                "pk", filter=Q(hold_duration__gt=pd.Timedelta(hours=24))
+            ),
+        )
+        packages_count = package_counts["total"]
+        unprocessed_items_count = package_counts["without_events"]
 
         # -------------------------------
         # Efficiency / Throughput
         # -------------------------------
 
         # Sorting time per bag = time between first ARRIVAL and last DISPATCHED
-        sorting_times = []
-        for bag in bags.filter(packages__isnull=False).distinct():
-            bag_events = PackageEvent.objects.filter(
-                package__in=bag.packages.all(),
+        bag_windows = (
+            PackageEvent.objects.filter(
+                package__bag__in=bags.filter(packages__isnull=False),
                 event_type_cd__in=["ARRIVAL", "DISPATCHED"],
-            ).order_by("date")
-            first_arrival = bag_events.filter(event_type_cd="ARRIVAL").first()
-            last_dispatch = bag_events.filter(event_type_cd="DISPATCHED").last()
-            if first_arrival and last_dispatch:
-                sorting_times.append(last_dispatch.date - first_arrival.date)
+            )
+            .values("package__bag_id")
+            .annotate(
+                first_arrival=Min("date", filter=Q(event_type_cd="ARRIVAL")),
+                last_dispatch=Max("date", filter=Q(event_type_cd="DISPATCHED")),
+            )
+            .filter(first_arrival__isnull=False, last_dispatch__isnull=False)
+        )
+        sorting_times = [
+            window["last_dispatch"] - window["first_arrival"] for window in bag_windows
+        ]
 
         if sorting_times:
             durations_series = pd.Series(sorting_times)
             avg_sorting_time = durations_series.mean()
             max_sorting_time = durations_series.max()
-            throughput_rate = packages.count() / max(
+            throughput_rate = packages_count / max(
                 1, sum([t.total_seconds() for t in sorting_times]) / 3600
             )
         else:
@@ -119,37 +143,41 @@ class HubStatsBase(models.Model):
             throughput_rate = 0
 
         avg_items_per_bag = (
-            packages.count() / incoming_bags_count if incoming_bags_count else 0
+            packages_count / incoming_bags_count if incoming_bags_count else 0
         )
 
         # -------------------------------
         # Exceptions / Traceability
         # -------------------------------
-        unscanned_items_count = packages.filter(events__isnull=True).count()
-        misrouted_items_count = packages.filter(
-            events__next_office__isnull=True
-        ).count()
+        unscanned_items_count = unprocessed_items_count
+        # One per event without next office, plus one per package without events
+        misrouted_items_count = (
+            PackageEvent.objects.filter(
+                package__in=packages, next_office__isnull=True
+            ).count()
+            + unprocessed_items_count
+        )
         damaged_items_count = (
             getattr(packages.model, "flag_damaged", False)
             and packages.filter(flag_damaged=True).count()
             or 0
         )
-        alerts_triggered_count = packages.filter(alert_after_success=True).count()
-        seized_items_count = packages.filter(flag_seized=True).count()
+        alerts_triggered_count = package_counts["alerts"]
+        seized_items_count = package_counts["seized"]
 
         # -------------------------------
         # Transit / Holding
         # -------------------------------
-        holding_durations = packages.filter(hold_duration__isnull=False).values_list(
-            "hold_duration", flat=True
+        holding_durations = list(
+            packages.filter(hold_duration__isnull=False).values_list(
+                "hold_duration", flat=True
+            )
         )
         if holding_durations:
             durations_series = pd.Series(holding_durations)
             avg_holding_time = durations_series.mean()
             median_holding_time = durations_series.median()
-            items_exceeding_holding_time = packages.filter(
-                hold_duration__gt=pd.Timedelta(hours=24)
-            ).count()
+            items_exceeding_holding_time = package_counts["exceeding_holding_time"]
         else:
             avg_holding_time = median_holding_time = None
             items_exceeding_holding_time = 0
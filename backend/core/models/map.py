@@ -1,4 +1,6 @@
 from django.db import models
+from django.utils import timezone
+
 from .states_offices import State, PostalOffice
 
 
@@ -13,7 +15,8 @@ class Alert(models.Model):
         ALR007 = "ALR007", "Incident d’exploitation – Absence d’événements"
         ALR008 = "ALR008", "Délais de concentration excessifs"
 
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Time of the event that raised the alert (alerts are deduplicated on it)
+    timestamp = models.DateTimeField(default=timezone.now)
     alarm_code = models.CharField(max_length=10, choices=AlarmType.choices)
     title = models.CharField(max_length=255)
     trigger_condition = models.TextField()
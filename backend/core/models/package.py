@@ -115,7 +115,8 @@ class PackageEvent(models.Model):
             "etablissement_postal",
         )
         indexes = [
-            models.Index(fields=["mailitm_fid"]),
+            # Timelines: one package's events in date order
+            models.Index(fields=["mailitm_fid", "date"]),
             models.Index(fields=["date"]),
         ]
 
@@ -6,6 +6,8 @@ class UploadMetaData(models.Model):
     filename = models.CharField(max_length=255)
     file_size_bytes = models.BigIntegerField()
     file_type = models.CharField(max_length=20)
+    # sha256 of the file content, identical re-uploads are skipped
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     upload_timestamp = models.DateTimeField(default=timezone.now)
     processing_duration_seconds = models.FloatField(null=True, blank=True)
 
@@ -28,7 +30,10 @@ class UploadMetaData(models.Model):
     events_inserted = models.IntegerField()
     packages_created = models.IntegerField()
     packages_updated = models.IntegerField()
+    packages_unchanged = models.IntegerField(default=0)
     alerts_created = models.IntegerField()
+    # Office names of the upload that matched no PostalOffice
+    unresolved_offices = models.JSONField(blank=True, null=True)
 
     # Cleaning summary
     cleaning_time_seconds = models.FloatField(null=True, blank=True)
@@ -36,6 +41,7 @@ class UploadMetaData(models.Model):
     avg_total_duration_seconds = models.FloatField(null=True, blank=True)
     rows_removed_duplicates = models.IntegerField(null=True, blank=True)
     rows_removed_invalid = models.IntegerField(null=True, blank=True)
+    bad_lines_count = models.IntegerField(null=True, blank=True)
 
     # Optional remarks
     notes = models.TextField(blank=True, null=True)
@@ -48,6 +54,8 @@ class BagUploadMetaData(models.Model):
     filename = models.CharField(max_length=255)
     file_size_bytes = models.BigIntegerField()
     file_type = models.CharField(max_length=20)
+    # sha256 of the file content, identical re-uploads are skipped
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     upload_timestamp = models.DateTimeField(default=timezone.now)
     processing_duration_seconds = models.FloatField(null=True, blank=True)
 
@@ -82,3 +90,75 @@ class BagUploadMetaData(models.Model):
 
     def __str__(self):
         return f"BAG: {self.filename} ({self.upload_timestamp:%Y-%m-%d})"
+
+
+class UploadJob(models.Model):
+    """
+    A background job: the ingestion of a staged upload, or a rebuild of the
+    dashboard snapshots (no file, its arguments in `params`).
+    """
+
+    class Kind(models.TextChoices):
+        PACKAGE = "package", "Package events"
+        BAG = "bag", "Bag events"
+        SNAPSHOTS = "snapshots", "Dashboard snapshots rebuild"
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCESS = "success", "Success"
+        FAILURE = "failure", "Failure"
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.QUEUED
+    )
+    phase = models.CharField(max_length=50, blank=True, default="")
+
+    # Staged file
+    filename = models.CharField(max_length=255, blank=True)
+    file_size_bytes = models.BigIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+
+    # Snapshots rebuild: start, end, granularity
+    params = models.JSONField(default=dict, blank=True)
+
+    # Progress
+    rows_total = models.IntegerField(null=True, blank=True)
+    rows_processed = models.IntegerField(default=0)
+    phase_timings = models.JSONField(default=dict, blank=True)  # phase -> seconds
+
+    # Outcome
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.kind} job #{self.pk}: {self.filename} [{self.status}]"
+
+
+class UploadChunk(models.Model):
+    """
+    Ledger of the chunks of a streamed upload that were loaded and committed,
+    so that a crashed upload of the same file resumes after the last one.
+    """
+
+    kind = models.CharField(max_length=20, choices=UploadJob.Kind.choices)
+    content_hash = models.CharField(max_length=64)  # whole file
+    chunk_index = models.IntegerField()
+    chunk_hash = models.CharField(max_length=64)  # cleaned chunk rows
+    counts = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("kind", "content_hash", "chunk_index")
+        ordering = ["chunk_index"]
+
+    def __str__(self):
+        return f"{self.kind} {self.content_hash[:12]} chunk #{self.chunk_index}"
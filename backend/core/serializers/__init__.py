@@ -8,7 +8,11 @@ from .major_centers import (
 from .office import StateStatsSerializer, OfficeStatsSerializer
 from .package import PackageSerializer, PackageEventSerializer
 from .transition import PackageTransitionSerializer
-from .upload import UploadMetaDataSerializer, BagUploadMetaDataSerializer
+from .upload import (
+    UploadMetaDataSerializer,
+    BagUploadMetaDataSerializer,
+    UploadJobSerializer,
+)
 from .state_and_office import StateSerializer, PostalOfficeSerializer
 
 __all__ = [
@@ -24,6 +28,7 @@ __all__ = [
     "PackageTransitionSerializer",
     "UploadMetaDataSerializer",
     "BagUploadMetaDataSerializer",
+    "UploadJobSerializer",
     "StateSerializer",
     "PostalOfficeSerializer",
 ]
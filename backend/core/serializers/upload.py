@@ -1,5 +1,5 @@
 from rest_framework.serializers import ModelSerializer
-from core.models import UploadMetaData, BagUploadMetaData
+from core.models import UploadMetaData, BagUploadMetaData, UploadJob
 
 
 class UploadMetaDataSerializer(ModelSerializer):
@@ -12,3 +12,9 @@ class BagUploadMetaDataSerializer(ModelSerializer):
     class Meta:
         model = BagUploadMetaData
         fields = "__all__"
+
+
+class UploadJobSerializer(ModelSerializer):
+    class Meta:
+        model = UploadJob
+        exclude = ["file_path"]
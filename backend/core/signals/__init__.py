@@ -1,3 +1,5 @@
 from .fill_states_and_postal_offices import seed_algeria_data
+from .kpi_rollups import update_kpi_rollups
+from .office_directory import reset_office_directory
 
-__all__ = ["seed_algeria_data"]
+__all__ = ["seed_algeria_data", "update_kpi_rollups", "reset_office_directory"]
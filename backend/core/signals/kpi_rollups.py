@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+
+from core.utils.kpi_rollups import ROLLUP_SOURCES, refresh_rollups
+
+SOURCE_BY_MODEL = {model: source for source, model in ROLLUP_SOURCES.items()}
+
+
+def update_kpi_rollups(sender, instance, **kwargs):
+    """Keep the daily KPI rollups in step with every snapshot written."""
+    refresh_rollups(SOURCE_BY_MODEL[sender], [instance.timestamp])
+
+
+for model in ROLLUP_SOURCES.values():
+    post_save.connect(update_kpi_rollups, sender=model)
+    post_delete.connect(update_kpi_rollups, sender=model)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+
+from core.models import PostalOffice
+from core.utils.office_resolver import invalidate_office_directory
+
+
+def reset_office_directory(sender, instance, **kwargs):
+    """Drop the cached office name → id directory when an office changes."""
+    invalidate_office_directory()
+
+
+post_save.connect(reset_office_directory, sender=PostalOffice)
+post_delete.connect(reset_office_directory, sender=PostalOffice)
@@ -0,0 +1,4 @@
+from .ingestion import run_upload_job
+from .snapshots import run_snapshot_rebuild_job
+
+__all__ = ["run_upload_job", "run_snapshot_rebuild_job"]
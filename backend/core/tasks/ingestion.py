@@ -0,0 +1,44 @@
+import logging
+
+from celery import shared_task
+from celery.signals import worker_init
+from django.core.files import File
+
+from core.models import UploadJob
+from core.utils.bag_ingestion import ingest_bag_file
+from core.utils.package_ingestion import ingest_package_file
+from core.utils.reference_data import warm_up_reference_data
+from core.utils.upload_jobs import discard_staged_file, mark_finished, mark_running
+
+logger = logging.getLogger(__name__)
+
+INGESTERS = {
+    UploadJob.Kind.PACKAGE: ingest_package_file,
+    UploadJob.Kind.BAG: ingest_bag_file,
+}
+
+
+@worker_init.connect
+def warm_up_worker(**kwargs):
+    """Load the reference data before the pool starts (inherited by forks)."""
+    warm_up_reference_data()
+
+
+@shared_task(ignore_result=True)
+def run_upload_job(job_id):
+    """Ingest the staged file of an UploadJob, recording progress on the job."""
+    job = UploadJob.objects.get(pk=job_id)
+    logger.info(f"🚚 Running {job.kind} upload job #{job.id} ({job.filename})")
+    mark_running(job)
+
+    try:
+        with open(job.file_path, "rb") as fh:
+            result = INGESTERS[job.kind](File(fh, name=job.filename), job=job)
+    except Exception as e:
+        logger.exception(f"❌ Upload job #{job.id} failed")
+        mark_finished(job, error=str(e))
+        return
+
+    mark_finished(job, result=result)
+    discard_staged_file(job)
+    logger.info(f"✅ Upload job #{job.id} completed: {result}")
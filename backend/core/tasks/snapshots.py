@@ -0,0 +1,42 @@
+import logging
+
+from celery import shared_task
+from django.utils.dateparse import parse_datetime
+
+from core.models import UploadJob
+from core.utils.snapshot_rebuild import rebuild_snapshots
+from core.utils.upload_jobs import mark_finished, mark_running
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def run_snapshot_rebuild_job(job_id):
+    """Rebuild the dashboard snapshots described by the params of an UploadJob."""
+    job = UploadJob.objects.get(pk=job_id)
+    params = job.params
+    logger.info(f"🧱 Running snapshots rebuild job #{job.id} ({params})")
+    mark_running(job)
+
+    try:
+        periods = rebuild_snapshots(
+            parse_datetime(params["start"]),
+            parse_datetime(params["end"]),
+            granularity=params["granularity"],
+            job=job,
+        )
+    except Exception as e:
+        logger.exception(f"❌ Snapshots rebuild job #{job.id} failed")
+        mark_finished(job, error=str(e))
+        return
+
+    mark_finished(
+        job,
+        result={
+            "total_snapshots": len(periods),
+            "details": [{**period, "status": "success"} for period in periods],
+        },
+    )
+    logger.info(
+        f"✅ Snapshots rebuild job #{job.id} completed: {len(periods)} snapshots"
+    )
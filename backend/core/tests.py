@@ -1,3 +1,796 @@
-from django.test import TestCase
+import warnings
 
-# Create your tests here.
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+
+from core.models import (
+    Alert,
+    Bag,
+    BagEvent,
+    KPIDirtyEntity,
+    Package,
+    PackageEvent,
+    UploadMetaData,
+)
+from core.utils.alert_engine import evaluate_alerts
+from core.utils.bag_ingestion import ingest_bag_file
+from core.utils.cleaning import clean_package_data
+from core.utils.kpi_tracking import (
+    clear_dirty_entities,
+    mark_dirty,
+    pending_dirty_entities,
+)
+from core.utils.office_resolver import resolve_office_names, resolve_offices
+from core.utils.package_ingestion import ingest_package_file
+from core.utils.package_state import derive_package_states, package_state_records
+from core.utils.transitions_helper import transitions_frame
+
+DAY = pd.Timedelta(days=1)
+NAT = pd.NaT
+
+
+def _records(frame):
+    """Rows of a frame as tuples, with NaN / NaT / <NA> as None."""
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+# ----------------------------
+# Package state derivation
+# ----------------------------
+def package_event(fid, code, day, office, hour=0, bag=None):
+    return {
+        "MAILITM_FID": fid,
+        "RECPTCL_FID": bag,
+        "EVENT_TYPE_CD": code,
+        "date": pd.Timestamp(2025, 1, day, hour),
+        "établissement_postal": office,
+        "country": fid[-2:],
+        "total_duration": 3 * DAY,
+    }
+
+
+class DerivePackageStatesTests(SimpleTestCase):
+    """derive_package_states() against the fields the per-package loop set."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        events = [
+            # Delivered, shipped in a bag (receptacle id with padding)
+            package_event("EA000000001FR", "30", 1, "ALGER", bag=" DZALGA001 "),
+            package_event("EA000000001FR", "32", 2, "BLIDA", bag=" DZALGA001 "),
+            package_event("EA000000001FR", "37", 3, "BLIDA", bag=" DZALGA001 "),
+            # Failed, then transmitted twice
+            package_event("EA000000002FR", "30", 1, "ALGER"),
+            package_event("EA000000002FR", "36", 2, "ORAN"),
+            package_event("EA000000002FR", "32", 3, "TLEMCEN"),
+            package_event("EA000000002FR", "32", 4, "MAGHNIA"),
+            # Delivered after two failures, then scanned again
+            package_event("EA000000003US", "36", 1, "ORAN"),
+            package_event("EA000000003US", "36", 2, "ORAN"),
+            package_event("EA000000003US", "37", 3, "ORAN"),
+            package_event("EA000000003US", "32", 4, "ALGER"),
+            # Seized, released, seized again and moved without a customs exit
+            package_event("EA000000004CN", "4", 1, "CTNI"),
+            package_event("EA000000004CN", "7", 2, "CTNI"),
+            package_event("EA000000004CN", "6", 3, "CTNI"),
+            package_event("EA000000004CN", "32", 4, "ALGER"),
+            # Seized then released
+            package_event("EA000000005CN", "31", 1, "CTNI"),
+            package_event("EA000000005CN", "38", 2, "CTNI", hour=12),
+        ]
+        # Uploads are not sorted
+        df_clean = pd.DataFrame(events).sample(frac=1, random_state=3)
+        cls.states = {
+            state["mailitm_fid"]: state
+            for state in package_state_records(derive_package_states(df_clean))
+        }
+
+    def assertState(self, fid, **expected):
+        state = self.states[fid]
+        self.assertEqual({field: state[field] for field in expected}, expected)
+
+    def test_one_row_per_package(self):
+        self.assertEqual(
+            sorted(self.states),
+            [
+                "EA000000001FR",
+                "EA000000002FR",
+                "EA000000003US",
+                "EA000000004CN",
+                "EA000000005CN",
+            ],
+        )
+
+    def test_delivered(self):
+        self.assertState(
+            "EA000000001FR",
+            bag_fid="DZALGA001",
+            country="FR",
+            total_duration=3 * DAY,
+            status="success",
+            delivered_at=pd.Timestamp(2025, 1, 3),
+            failed_at=None,
+            alert_after_success=False,
+            failure_before_success_count=0,
+            recovered_after_failure=False,
+            cities_after_failure_count=0,
+            last_known_location="BLIDA",
+            last_event_type_cd="37",
+            last_event_timestamp=pd.Timestamp(2025, 1, 3),
+        )
+
+    def test_failed_counts_transmissions_after_failure(self):
+        # The per-package loop sliced with the frame's labels and got 0 here
+        self.assertState(
+            "EA000000002FR",
+            bag_fid=None,
+            status="failure",
+            delivered_at=None,
+            failed_at=pd.Timestamp(2025, 1, 2),
+            cities_after_failure_count=2,
+            last_known_location="MAGHNIA",
+        )
+
+    def test_recovered_after_failures(self):
+        self.assertState(
+            "EA000000003US",
+            status="success",
+            delivered_at=pd.Timestamp(2025, 1, 3),
+            failed_at=None,
+            alert_after_success=True,
+            failure_before_success_count=2,
+            recovered_after_failure=True,
+            cities_after_failure_count=0,
+        )
+
+    def test_seized_and_moving(self):
+        self.assertState(
+            "EA000000004CN",
+            status="in_process",
+            flag_seized=True,
+            seized_at=pd.Timestamp(2025, 1, 3),
+            exited_at=None,
+            hold_duration=None,
+            alert_after_seizure=True,
+            last_event_type_cd="32",
+        )
+
+    def test_released_from_customs(self):
+        self.assertState(
+            "EA000000005CN",
+            status="in_process",
+            flag_seized=False,
+            seized_at=pd.Timestamp(2025, 1, 1),
+            exited_at=pd.Timestamp(2025, 1, 2, 12),
+            hold_duration=pd.Timedelta(days=1, hours=12),
+            alert_after_seizure=False,
+        )
+
+
+# ----------------------------
+# Transitions
+# ----------------------------
+ESTABLISHMENTS = pd.DataFrame(
+    {
+        "bp_nm": ["ALGER", "BLIDA", "ORAN", "MEDEA", "GHARDAIA"],
+        # MEDEA has a new wilaya code (49 → 1), GHARDAIA is outside the matrix
+        "code_upw": [16, 9, 31, 49, 47],
+    }
+)
+# Allowed durations, origin wilaya (rows) → destination wilaya (columns)
+SLA_MATRIX = pd.DataFrame(
+    [
+        [NAT, DAY / 2, DAY, NAT],
+        [NAT, NAT, DAY, 3 * DAY],
+        [NAT, DAY, NAT, 2 * DAY],
+        [2 * DAY, NAT, 2 * DAY, NAT],
+    ],
+    index=[1, 9, 16, 31],
+    columns=[1, 9, 16, 31],
+)
+
+
+def package_events(*rows):
+    return pd.DataFrame(
+        [
+            (package_id, pd.Timestamp(2025, 1, day, hour) if day else NAT, office)
+            for package_id, day, hour, office in rows
+        ],
+        columns=["package_id", "date", "etablissement_postal"],
+    )
+
+
+class TransitionsFrameTests(SimpleTestCase):
+    """PackageTransition rows built by transitions_frame()."""
+
+    def transitions(self, *rows):
+        return _records(
+            transitions_frame(package_events(*rows), ESTABLISHMENTS, SLA_MATRIX)
+        )
+
+    def test_block_to_block_with_sla(self):
+        self.assertEqual(
+            self.transitions(
+                (1, 1, 8, "ALGER"),
+                (1, 1, 10, "ALGER"),
+                (1, 4, 10, "BLIDA"),
+                (1, 4, 20, "ORAN"),
+            ),
+            [
+                (1, 16, 9, 3 * DAY, DAY, True),
+                (1, 9, 31, pd.Timedelta(hours=10), 3 * DAY, False),
+            ],
+        )
+
+    def test_revisited_upw_is_one_block(self):
+        # BLIDA → ORAN → BLIDA: one BLIDA block spanning both visits
+        self.assertEqual(
+            self.transitions(
+                (2, 1, 0, "BLIDA"),
+                (2, 2, 0, "ORAN"),
+                (2, 3, 0, "BLIDA"),
+            ),
+            [(2, 9, 31, -DAY, 3 * DAY, False)],
+        )
+
+    def test_shuffled_rows_and_missing_date(self):
+        # Blocks follow the packages' first rows; a missing date is the
+        # block's last timestamp; unknown offices are left out
+        self.assertEqual(
+            self.transitions(
+                (3, 5, 0, "ORAN"),
+                (3, 2, 0, "MEDEA"),
+                (3, None, 0, "ORAN"),
+                (3, 1, 0, "MEDEA"),
+                (3, 3, 0, "UNKNOWN OFFICE"),
+            ),
+            [(3, 31, 1, None, 2 * DAY, False)],
+        )
+
+    def test_unknown_sla_pairs(self):
+        self.assertEqual(
+            self.transitions(
+                (4, 1, 0, "ALGER"),
+                (4, 2, 0, "ORAN"),
+                (4, 3, 0, "BLIDA"),
+                (4, 4, 0, "GHARDAIA"),
+            ),
+            [
+                (4, 16, 31, DAY, 2 * DAY, False),
+                # No baseline in the matrix
+                (4, 31, 9, DAY, None, False),
+                # Wilaya outside the matrix
+                (4, 9, 47, DAY, None, False),
+            ],
+        )
+
+    def test_interleaved_packages(self):
+        rows = [
+            (6, 1, 0, "BLIDA"),
+            (5, 1, 0, "ALGER"),
+            (6, 2, 0, "ALGER"),
+            (5, 3, 0, "BLIDA"),
+        ]
+        self.assertEqual(
+            self.transitions(*rows),
+            [
+                (5, 16, 9, 2 * DAY, DAY, True),
+                (6, 9, 16, DAY, DAY, False),
+            ],
+        )
+
+
+# ----------------------------
+# Bag uploads
+# ----------------------------
+BAG_CSV_HEADER = (
+    "RECPTCL_FID;date;EVENT_TYPECD;LOCAL_EVENT_TYPE_NM;"
+    "etablissement_postal;nextetablissement_postal"
+)
+
+
+def bag_csv(name, *rows):
+    content = "\n".join([BAG_CSV_HEADER, *(";".join(row) for row in rows)])
+    return SimpleUploadedFile(name, content.encode(), content_type="text/csv")
+
+
+class BagUploadMergeTests(TestCase):
+    """Bags and their events after uploads holding parts of the same bag."""
+
+    FID = "FRPARA0000001DZALGA"
+
+    def upload(self, name, *rows):
+        ingest_bag_file(bag_csv(name, *((self.FID, *row) for row in rows)))
+
+    def test_later_upload_extends_durations(self):
+        self.upload(
+            "first.csv",
+            ("2025-01-01 08:00:00", "101", "Closed", "ALGER", "BLIDA"),
+            ("2025-01-02 08:00:00", "103", "Sent", "BLIDA", "ORAN"),
+        )
+        self.upload(
+            "second.csv",
+            # Already stored
+            ("2025-01-02 08:00:00", "103", "Sent", "BLIDA", "ORAN"),
+            ("2025-01-23 08:00:00", "104", "Received", "ORAN", "ORAN"),
+            ("2025-01-24 09:00:00", "105", "Modified", "ORAN", "ORAN"),
+        )
+
+        span = pd.Timedelta(days=23, hours=1)
+        bag = Bag.objects.get(receptacle_fid=self.FID)
+        self.assertEqual(bag.events_count, 4)
+        self.assertEqual(bag.total_duration, span)
+        self.assertEqual(bag.total_duration, bag.last_event_date - bag.first_event_date)
+
+        events = list(
+            BagEvent.objects.filter(receptacle_fid=self.FID)
+            .order_by("date")
+            .values_list("duration_to_next_step", "total_duration")
+        )
+        self.assertEqual(
+            events,
+            [
+                (pd.Timedelta(days=1), span),
+                # Last event of the first upload
+                (pd.Timedelta(days=21), span),
+                (pd.Timedelta(days=1, hours=1), span),
+                (None, span),
+            ],
+        )
+
+
+# ----------------------------
+# Dirty entities
+# ----------------------------
+class DirtyEntitiesTests(TestCase):
+    """The ledger of entities changed by uploads since the last KPI refresh."""
+
+    PACKAGE = KPIDirtyEntity.Kind.PACKAGE
+
+    def test_marked_during_refresh_stays_pending(self):
+        mark_dirty(self.PACKAGE, [1, 2])
+        dirty, last_id = pending_dirty_entities()
+        self.assertEqual(dirty[self.PACKAGE], {1, 2})
+
+        # An upload changes package 2 again while the refresh runs
+        mark_dirty(self.PACKAGE, [2, 3])
+        clear_dirty_entities(last_id)
+
+        dirty, _ = pending_dirty_entities()
+        self.assertEqual(dirty[self.PACKAGE], {2, 3})
+        self.assertEqual(dirty[KPIDirtyEntity.Kind.BAG], set())
+
+
+# ----------------------------
+# Package cleaning
+# ----------------------------
+PACKAGE_CSV_HEADER = (
+    "MAILITM_FID;date;EVENT_TYPE_CD;établissement_postal;"
+    "next_établissement_postal;RECPTCL_FID"
+)
+
+
+def package_csv(name, *rows, header=PACKAGE_CSV_HEADER):
+    content = "\n".join([header, *(";".join(row) for row in rows)])
+    return SimpleUploadedFile(name, content.encode(), content_type="text/csv")
+
+
+class CleanPackageDataTests(SimpleTestCase):
+    """clean_package_data() on files with an empty or missing office column."""
+
+    def assertCleaned(self, file_obj):
+        df_clean, metadata = clean_package_data(file_obj)
+        self.assertEqual(metadata["errors"], [])
+        self.assertEqual(len(df_clean), 2)
+        self.assertTrue(df_clean["next_établissement_postal"].isna().all())
+        self.assertEqual(list(df_clean["établissement_postal"]), ["ALGER", "BLIDA"])
+        return metadata
+
+    def test_blank_next_office_column(self):
+        self.assertCleaned(
+            package_csv(
+                "blank.csv",
+                ("EA000000001FR", "2025-01-01 08:00:00", "30", " ALGER ", "", ""),
+                ("EA000000001FR", "2025-01-02 08:00:00", "37", "BLIDA", "", ""),
+            )
+        )
+
+    def test_missing_next_office_column(self):
+        metadata = self.assertCleaned(
+            package_csv(
+                "missing.csv",
+                ("EA000000001FR", "2025-01-01 08:00:00", "30", "ALGER", ""),
+                ("EA000000001FR", "2025-01-02 08:00:00", "37", "BLIDA", ""),
+                header="MAILITM_FID;date;EVENT_TYPE_CD;établissement_postal;RECPTCL_FID",
+            )
+        )
+        self.assertIn(
+            "Added missing column 'next_établissement_postal'", metadata["warnings"]
+        )
+
+
+# ----------------------------
+# Package uploads
+# ----------------------------
+PACKAGE_FIELDS = [
+    "mailitm_fid",
+    "bag__receptacle_fid",
+    "total_duration",
+    "status",
+    "delivered_at",
+    "failed_at",
+    "alert_after_success",
+    "failure_before_success_count",
+    "last_known_location",
+    "last_event_type_cd",
+    "last_event_timestamp",
+]
+EVENT_FIELDS = [
+    "mailitm_fid",
+    "date",
+    "event_type_cd",
+    "etablissement_postal",
+    "duration_to_next_step",
+]
+
+
+def split_packages_csv():
+    """Ten packages whose last events come after the rows of all the others."""
+    fids = [f"CP{n:05d}FR" for n in range(1, 11)]
+    first = [
+        row
+        for fid in fids
+        for row in (
+            (fid, "2025-01-01 08:00:00", "30", "ALGER", "BLIDA", "DZALGA001"),
+            (fid, "2025-01-03 08:00:00", "37", "BLIDA", "", "DZALGA001"),
+        )
+    ]
+    later = [
+        # Between the stored events, or after the delivery
+        (fid, f"2025-01-0{2 if n % 2 else 4} 08:00:00", "32", "ORAN", "", "")
+        for n, fid in enumerate(fids)
+    ]
+    return package_csv("split.csv", *first, *later)
+
+
+class StreamedPackageUploadTests(TestCase):
+    """Streamed uploads store what a whole-file upload of the same rows does."""
+
+    def stored(self):
+        return (
+            list(Package.objects.order_by("mailitm_fid").values_list(*PACKAGE_FIELDS)),
+            list(
+                PackageEvent.objects.order_by("mailitm_fid", "date").values_list(
+                    *EVENT_FIELDS
+                )
+            ),
+            sorted(Alert.objects.values_list("alarm_code", "timestamp")),
+        )
+
+    def test_packages_split_across_chunks(self):
+        whole = ingest_package_file(split_packages_csv())
+        expected = self.stored()
+        for model in (Package, Bag, Alert, UploadMetaData):
+            model.objects.all().delete()
+
+        streamed = ingest_package_file(split_packages_csv(), chunksize=7)
+        self.assertEqual(self.stored(), expected)
+        for count in ("packages_saved", "packages_created", "events_saved"):
+            self.assertEqual(streamed[count], whole[count], count)
+        self.assertEqual(streamed["packages_saved"], 10)
+        self.assertEqual(streamed["packages_updated"], 0)
+
+        delivered = Package.objects.get(mailitm_fid="CP00001FR")
+        self.assertEqual(delivered.status, "success")
+        self.assertEqual(
+            delivered.delivered_at, pd.Timestamp("2025-01-03 08:00", tz="UTC")
+        )
+
+
+class PackageUploadTests(TestCase):
+    """ingest_package_file() on whole files."""
+
+    def test_cleaning_errors_stop_the_upload(self):
+        file_obj = package_csv(
+            "no_date.csv",
+            ("EA000000001FR", "30", "ALGER", "", ""),
+            header="MAILITM_FID;EVENT_TYPE_CD;établissement_postal;next_établissement_postal;RECPTCL_FID",
+        )
+        with self.assertRaisesMessage(ValueError, "Missing required columns: date"):
+            ingest_package_file(file_obj)
+        self.assertFalse(PackageEvent.objects.exists())
+        self.assertFalse(UploadMetaData.objects.exists())
+
+    def test_counts_created_updated_unchanged(self):
+        delivered = [
+            ("EA000000001FR", "2025-01-01 08:00:00", "30", "ALGER", "BLIDA", ""),
+            ("EA000000001FR", "2025-01-03 08:00:00", "37", "BLIDA", "", ""),
+        ]
+        in_transit = [
+            ("EA000000002FR", "2025-01-01 08:00:00", "30", "ALGER", "ORAN", ""),
+            ("EA000000002FR", "2025-01-02 08:00:00", "32", "ALGER", "ORAN", ""),
+        ]
+        first = ingest_package_file(package_csv("first.csv", *delivered, *in_transit))
+        self.assertEqual(
+            [
+                first[f"packages_{count}"]
+                for count in ("created", "updated", "unchanged")
+            ],
+            [2, 0, 0],
+        )
+
+        second = ingest_package_file(
+            package_csv(
+                "second.csv",
+                *delivered,
+                *in_transit,
+                ("EA000000002FR", "2025-01-04 08:00:00", "37", "ORAN", "", ""),
+                ("EA000000003FR", "2025-01-04 08:00:00", "30", "ALGER", "", ""),
+            )
+        )
+        self.assertEqual(
+            [
+                second[f"packages_{count}"]
+                for count in ("created", "updated", "unchanged")
+            ],
+            [1, 1, 1],
+        )
+        self.assertEqual(second["packages_saved"], 3)
+        self.assertEqual(Package.objects.count(), 3)
+        self.assertEqual(
+            Package.objects.get(mailitm_fid="EA000000002FR").status, "success"
+        )
+
+    def test_overlapping_upload_skips_stored_events(self):
+        first = ingest_package_file(
+            package_csv(
+                "first.csv",
+                ("EA000000001FR", "2025-01-01 08:00:00", "30", "ALGER", "BLIDA", ""),
+                ("EA000000001FR", "2025-01-02 08:00:00", "32", "ALGER", "BLIDA", ""),
+                ("EA000000002FR", "2025-01-01 09:00:00", "30", "ORAN", "", ""),
+            )
+        )
+        self.assertEqual((first["events_saved"], first["events_skipped"]), (3, 0))
+
+        second = ingest_package_file(
+            package_csv(
+                "second.csv",
+                # Already stored
+                ("EA000000001FR", "2025-01-02 08:00:00", "32", "ALGER", "BLIDA", ""),
+                ("EA000000002FR", "2025-01-01 09:00:00", "30", "ORAN", "", ""),
+                ("EA000000001FR", "2025-01-03 08:00:00", "37", "BLIDA", "", ""),
+                ("EA000000002FR", "2025-01-02 09:00:00", "32", "ORAN", "", ""),
+            )
+        )
+        self.assertEqual((second["events_saved"], second["events_skipped"]), (2, 2))
+        self.assertEqual(PackageEvent.objects.count(), 5)
+        keys = PackageEvent.objects.values_list("mailitm_fid", "date", "event_type_cd")
+        self.assertEqual(len(set(keys)), 5)
+
+
+# ----------------------------
+# Office resolution
+# ----------------------------
+OFFICES = {
+    "agence ems oran1": (435, 31),
+    "agence ems oran2": (436, 31),
+    "constantine epi 1": (501, 25),
+    "annaba ep itinerant1": (602, 23),
+    "tebessa ep itinirant1": (703, 12),
+    "kherraza 1 mai": (801, 23),
+    "kherraza 2": (802, 23),
+    "blida": (901, 9),
+}
+
+
+class ResolveOfficeNamesTests(SimpleTestCase):
+    """resolve_office_names() / resolve_offices() against a fixed directory."""
+
+    def resolve(self, *names):
+        return resolve_office_names(names, OFFICES)
+
+    def test_exact_names(self):
+        self.assertEqual(
+            self.resolve(" Agence  EMS ORAN2 ", "BLIDA", "Kherraza 2"),
+            {
+                " Agence  EMS ORAN2 ": (436, 31),
+                "BLIDA": (901, 9),
+                "Kherraza 2": (802, 23),
+            },
+        )
+
+    def test_near_miss_with_the_same_numbers(self):
+        self.assertEqual(
+            self.resolve("agence ems oarn1", "agence ems oran 2", "constantine epi1"),
+            {
+                "agence ems oarn1": (435, 31),
+                "agence ems oran 2": (436, 31),
+                "constantine epi1": (501, 25),
+            },
+        )
+
+    def test_other_numbers_are_other_offices(self):
+        names = (
+            "agence ems oran3",
+            "constantine epi 3",
+            "annaba ep itinerant2",
+            "tebessa ep itinirant2",
+            "kherraza 3",
+            "kherraza",
+        )
+        self.assertEqual(self.resolve(*names), dict.fromkeys(names))
+
+    def test_unresolved_offices(self):
+        names = pd.Series(["BLIDA", "agence ems oran3", None, "agence ems oran3"])
+        office_ids, state_ids, unresolved = resolve_offices(names, OFFICES)
+        self.assertEqual(office_ids.tolist(), [901, pd.NA, pd.NA, pd.NA])
+        self.assertEqual(state_ids.tolist(), [9, pd.NA, pd.NA, pd.NA])
+        self.assertEqual(unresolved, ["agence ems oran3"])
+
+
+# ----------------------------
+# Alert rules
+# ----------------------------
+EVALUATED_AT = pd.Timestamp(2025, 1, 20, 12, tz="Africa/Algiers")
+ALERT_OFFICES = {
+    "alger": (1, 16),
+    "blida": (2, 9),
+    "aeropostal": (3, 16),
+    "alger cpx": (4, 16),
+    "ctni": (5, 16),
+}
+
+
+def alert_event(fid, code, day, hour, office, next_office=None):
+    return {
+        "MAILITM_FID": fid,
+        "date": pd.Timestamp(2025, 1, day, hour),
+        "EVENT_TYPE_CD": code,
+        "établissement_postal": office,
+        "next_établissement_postal": next_office,
+    }
+
+
+def at(day, hour):
+    return pd.Timestamp(2025, 1, day, hour, tz="Africa/Algiers")
+
+
+class EvaluateAlertsTests(SimpleTestCase):
+    """evaluate_alerts(), one rule at a time, at EVALUATED_AT."""
+
+    def alerts(self, codes, *events):
+        alerts = evaluate_alerts(
+            pd.DataFrame(events), EVALUATED_AT, ALERT_OFFICES, codes=codes
+        )
+        return sorted(
+            alerts[
+                ["alarm_code", "mailitm_fid", "office_name", "timestamp", "office_id"]
+            ].itertuples(index=False, name=None)
+        )
+
+    def test_alr001_transmission_not_received(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR001"],
+                alert_event("EA01", "32", 1, 8, "ALGER", "BLIDA"),
+                # Received at its destination
+                alert_event("EA02", "32", 1, 8, "ALGER", "BLIDA"),
+                alert_event("EA02", "35", 2, 8, "BLIDA"),
+                # Sent two days ago
+                alert_event("EA03", "32", 18, 8, "ALGER", "BLIDA"),
+            ),
+            [("ALR001", "EA01", "BLIDA", at(1, 8), 2)],
+        )
+
+    def test_alr002_reception_without_delivery_attempt(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR002"],
+                alert_event("EA01", "35", 18, 8, "BLIDA"),
+                alert_event("EA02", "35", 18, 8, "BLIDA"),
+                alert_event("EA02", "37", 18, 10, "BLIDA"),
+                # Received this morning
+                alert_event("EA03", "35", 20, 8, "BLIDA"),
+            ),
+            [("ALR002", "EA01", "BLIDA", at(18, 8), 2)],
+        )
+
+    def test_alr003_reception_held(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR003"],
+                alert_event("EA01", "35", 1, 8, "BLIDA"),
+                # Re-dispatched
+                alert_event("EA02", "35", 1, 8, "BLIDA"),
+                alert_event("EA02", "38", 2, 8, "BLIDA"),
+                alert_event("EA03", "35", 10, 8, "BLIDA"),
+            ),
+            [("ALR003", "EA01", "BLIDA", at(1, 8), 2)],
+        )
+
+    def test_alr004_waiting_at_airmail_centre(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR004"],
+                alert_event("EA01", "32", 18, 8, "Aéropostal", "Alger CPX"),
+                # Moved on to the CPX
+                alert_event("EA02", "32", 18, 8, "Aéropostal", "Alger CPX"),
+                alert_event("EA02", "35", 19, 8, "Alger CPX"),
+                alert_event("EA03", "32", 20, 8, "Aéropostal", "Alger CPX"),
+            ),
+            [("ALR004", "EA01", "Aéropostal", at(18, 8), 3)],
+        )
+
+    def test_alr005_not_received_at_cpx(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR005"],
+                alert_event("EA01", "32", 15, 8, "Aéropostal", "Alger CPX"),
+                alert_event("EA02", "32", 15, 8, "Aéropostal", "Alger CPX"),
+                alert_event("EA02", "35", 16, 8, "Alger CPX"),
+            ),
+            [("ALR005", "EA01", "Alger CPX", at(15, 8), 4)],
+        )
+
+    def test_alr006_not_received_at_ctni(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR006"],
+                alert_event("EA01", "32", 15, 8, "Alger CPX", "CTNI"),
+                alert_event("EA02", "32", 15, 8, "Alger CPX", "CTNI"),
+                alert_event("EA02", "35", 16, 8, "CTNI"),
+            ),
+            [("ALR006", "EA01", "CTNI", at(15, 8), 5)],
+        )
+
+    def test_alr007_no_hub_activity(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR007"],
+                alert_event("EA01", "35", 20, 8, "CTNI"),
+                alert_event("EA02", "35", 20, 10, "Alger CPX"),
+                # Never at a hub
+                alert_event("EA03", "35", 1, 8, "BLIDA"),
+            ),
+            [("ALR007", "EA01", "CTNI", at(20, 8), 5)],
+        )
+
+    def test_alr008_reception_not_forwarded(self):
+        self.assertEqual(
+            self.alerts(
+                ["ALR008"],
+                alert_event("EA01", "35", 10, 8, "BLIDA"),
+                alert_event("EA02", "35", 10, 8, "BLIDA"),
+                alert_event("EA02", "32", 11, 8, "ALGER"),
+                # Exactly four days
+                alert_event("EA03", "35", 16, 8, "BLIDA"),
+            ),
+            [("ALR008", "EA01", "BLIDA", at(10, 8), 2)],
+        )
+
+    def test_duplicates_are_suppressed(self):
+        # Same rule, office and time for two packages: one alert
+        self.assertEqual(
+            self.alerts(
+                ["ALR002"],
+                alert_event("EA01", "35", 18, 8, "BLIDA"),
+                alert_event("EA02", "35", 18, 8, " Blida "),
+                alert_event("EA03", "35", 18, 9, "BLIDA"),
+            ),
+            [
+                ("ALR002", "EA01", "BLIDA", at(18, 8), 2),
+                ("ALR002", "EA03", "BLIDA", at(18, 9), 2),
+            ],
+        )
+
+    def test_rules_without_alerts(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            alerts = self.alerts(None, alert_event("EA01", "35", 18, 8, "BLIDA"))
+            self.assertEqual(alerts, [("ALR002", "EA01", "BLIDA", at(18, 8), 2)])
+            self.assertEqual(
+                self.alerts(None, alert_event("EA01", "37", 20, 8, "BLIDA")), []
+            )
@@ -12,11 +12,29 @@ from .views import (
     OneOfficeAPIView,
     OneStateAPIView,
     MajorCentersAPIView,
+    UploadJobAPIView,
+    PackageTimelineAPIView,
+    PackageTimelineBatchAPIView,
+    BagTimelineAPIView,
+    BagTimelineBatchAPIView,
 )
 
 urlpatterns = [
     path("upload/", UploadCSVAndSave.as_view(), name="upload-csv"),
     path("bag-upload/", UploadBagsCSV.as_view(), name="bag-upload"),
+    path("jobs/<int:job_id>/", UploadJobAPIView.as_view(), name="upload-job"),
+    path(
+        "packages/timelines",
+        PackageTimelineBatchAPIView.as_view(),
+        name="package-timelines",
+    ),
+    path(
+        "packages/<str:fid>/timeline",
+        PackageTimelineAPIView.as_view(),
+        name="package-timeline",
+    ),
+    path("bags/timelines", BagTimelineBatchAPIView.as_view(), name="bag-timelines"),
+    path("bags/<str:fid>/timeline", BagTimelineAPIView.as_view(), name="bag-timeline"),
     path("stats/", PackageStatsAPIView.as_view(), name="package-stats"),  # Deprecated
     path(
         "transitions/report/",
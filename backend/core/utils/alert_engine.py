@@ -0,0 +1,343 @@
+import logging
+
+import pandas as pd
+import pytz
+from django.utils import timezone
+
+from core.utils.alert_defs import ALERT_DEFINITIONS
+from core.utils.office_resolver import resolve_office_names
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TZ = pytz.timezone("Africa/Algiers")
+
+TRANSMISSION_CODES = ["32", "33"]
+RECEPTION_CODES = ["34", "35"]
+DELIVERY_OUTCOME_CODES = ["36", "37"]
+CUSTODY_END_CODES = ["36", "37", "38"]
+
+HB_PATTERN = "Aéropostal"
+CPX_PATTERN = "Alger CPX"
+CTNI_PATTERN = "CTNI"
+HUB_ACTIVITY_PATTERN = "CPX|CTNI"
+
+ALERT_COLUMNS = [
+    "alarm_code",
+    "mailitm_fid",
+    "office_name",
+    "timestamp",
+    "office_id",
+    "state_id",
+]
+
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def _contains(series, pattern):
+    return series.astype("string").str.contains(pattern, case=False, na=False)
+
+
+def _latest_date(events, mask):
+    """Latest event date per package among rows matching `mask`."""
+    return events.loc[mask].groupby("MAILITM_FID", sort=False)["date"].max()
+
+
+def _latest_per_row(events, latest):
+    """Broadcast a per-package date Series back onto the event rows."""
+    return events["MAILITM_FID"].map(latest)
+
+
+def _latest_elsewhere(events):
+    """
+    For each event, the latest date of the same package at a *different* office.
+
+    Keeps the two most recent offices per package, so each row can pick the
+    runner-up when its own office is the most recent one. Events without an
+    office are compared as different from everything, like `!=` in pandas.
+    """
+    office = events["établissement_postal"].astype(object)
+    per_office = (
+        events.assign(_office=office.where(office.notna(), "\0"))
+        .groupby(["MAILITM_FID", "_office"], sort=False)["date"]
+        .max()
+        .reset_index()
+        .sort_values(["MAILITM_FID", "date"], ascending=[True, False], kind="mergesort")
+    )
+    top = per_office.groupby("MAILITM_FID", sort=False).head(2)
+    rank = top.groupby("MAILITM_FID", sort=False).cumcount()
+    best = top[rank == 0].set_index("MAILITM_FID")
+    runner_up = top[rank == 1].set_index("MAILITM_FID")["date"]
+
+    fid = events["MAILITM_FID"]
+    best_office = fid.map(best["_office"])
+    best_date = fid.map(best["date"])
+    runner_up_date = fid.map(runner_up)
+    same_as_best = office.notna() & (office == best_office)
+    return best_date.where(~same_as_best, runner_up_date)
+
+
+def _emit(rows, code, office_name):
+    return pd.DataFrame(
+        {
+            "alarm_code": code,
+            "mailitm_fid": rows["MAILITM_FID"].to_numpy(),
+            "office_name": office_name,
+            "timestamp": rows["date"].to_numpy(),
+        }
+    )
+
+
+# ---------------------------
+# Rules (one per ALERT_DEFINITIONS code)
+# ---------------------------
+def _alr001(events, evaluated_at):
+    """Transmissions never scanned at their destination within 3 days."""
+    sent = events[events["EVENT_TYPE_CD"].isin(TRANSMISSION_CODES)]
+    latest_at_office = events.groupby(
+        ["MAILITM_FID", "établissement_postal"], sort=False
+    )["date"].max()
+    keys = pd.MultiIndex.from_arrays(
+        [sent["MAILITM_FID"], sent["next_établissement_postal"]]
+    )
+    received_at = pd.Series(
+        latest_at_office.reindex(keys).array, index=sent.index
+    ).where(sent["next_établissement_postal"].notna())
+    hit = ~(received_at > sent["date"]) & ((evaluated_at - sent["date"]).dt.days > 3)
+    rows = sent[hit]
+    return _emit(rows, "ALR001", rows["next_établissement_postal"].to_numpy())
+
+
+def _received_without(events, evaluated_at, code, outcome_codes, too_old):
+    received = events[events["EVENT_TYPE_CD"].isin(RECEPTION_CODES)]
+    outcome = _latest_date(events, events["EVENT_TYPE_CD"].isin(outcome_codes))
+    resolved = _latest_per_row(received, outcome) > received["date"]
+    rows = received[~resolved & too_old(evaluated_at - received["date"])]
+    return _emit(rows, code, rows["établissement_postal"].to_numpy())
+
+
+def _alr002(events, evaluated_at):
+    """Receptions without delivery attempt within 24h."""
+    return _received_without(
+        events,
+        evaluated_at,
+        "ALR002",
+        DELIVERY_OUTCOME_CODES,
+        lambda age: age.dt.total_seconds() > 86400,
+    )
+
+
+def _alr003(events, evaluated_at):
+    """Receptions held more than 15 days without delivery or re-dispatch."""
+    return _received_without(
+        events,
+        evaluated_at,
+        "ALR003",
+        CUSTODY_END_CODES,
+        lambda age: age.dt.days > 15,
+    )
+
+
+def _stuck_at_office(events, evaluated_at, code, rows_mask, min_days, strict):
+    rows = events[rows_mask]
+    moved_on = events.loc[rows_mask, "_latest_elsewhere"] > rows["date"]
+    days = (evaluated_at - rows["date"]).dt.days
+    too_old = days > min_days if strict else days >= min_days
+    rows = rows[~moved_on & too_old]
+    return _emit(rows, code, rows["établissement_postal"].to_numpy())
+
+
+def _alr004(events, evaluated_at):
+    """Dispatches waiting at the HB airmail centre for a day or more."""
+    return _stuck_at_office(
+        events, evaluated_at, "ALR004", events["_at_hb"], 1, strict=False
+    )
+
+
+def _not_received_at_hub(events, evaluated_at, code, sent_mask, hub_mask, hub_name):
+    sent = events[sent_mask]
+    hub_latest = _latest_date(events, hub_mask)
+    received = _latest_per_row(sent, hub_latest) > sent["date"]
+    rows = sent[~received & ((evaluated_at - sent["date"]).dt.days > 2)]
+    return _emit(rows, code, hub_name)
+
+
+def _alr005(events, evaluated_at):
+    """HB → Alger CPX dispatches not received after 2 days."""
+    return _not_received_at_hub(
+        events,
+        evaluated_at,
+        "ALR005",
+        events["_at_hb"] & _contains(events["next_établissement_postal"], CPX_PATTERN),
+        events["_at_cpx"],
+        "Alger CPX",
+    )
+
+
+def _alr006(events, evaluated_at):
+    """Alger CPX → CTNI dispatches not received after 2 days."""
+    return _not_received_at_hub(
+        events,
+        evaluated_at,
+        "ALR006",
+        events["_at_cpx"]
+        & _contains(events["next_établissement_postal"], CTNI_PATTERN),
+        events["_at_ctni"],
+        "CTNI",
+    )
+
+
+def _alr007(events, evaluated_at):
+    """No CPX/CTNI activity on a package for more than 3 hours."""
+    activity = events[events["_at_hub"]]
+    last = activity.groupby("MAILITM_FID", sort=False).tail(1)
+    rows = last[(evaluated_at - last["date"]).dt.total_seconds() > 10800]
+    return _emit(rows, "ALR007", rows["établissement_postal"].to_numpy())
+
+
+def _alr008(events, evaluated_at):
+    """Receptions not forwarded to the next office within 4 days."""
+    return _stuck_at_office(
+        events,
+        evaluated_at,
+        "ALR008",
+        events["EVENT_TYPE_CD"].isin(RECEPTION_CODES),
+        4,
+        strict=True,
+    )
+
+
+ALERT_RULES = {
+    "ALR001": _alr001,
+    "ALR002": _alr002,
+    "ALR003": _alr003,
+    "ALR004": _alr004,
+    "ALR005": _alr005,
+    "ALR006": _alr006,
+    "ALR007": _alr007,
+    "ALR008": _alr008,
+}
+
+
+# ---------------------------
+# Office resolution
+# ---------------------------
+def _resolve_offices(alerts, events, office_ids):
+    """
+    Attach office_id/state_id to each alert.
+
+    Names go through the office resolver (normalized, then fuzzy match); when
+    that fails, fall back to the `next_établissement_postal` of the package's
+    previous event (as-of merge).
+    """
+    office_ids = office_ids or {}
+
+    def lookup(names):
+        names = names.astype(object)
+        found = names.map(resolve_office_names(names.dropna().unique(), office_ids))
+        return found.astype(object).where(found.notna(), None)
+
+    resolved = lookup(alerts["office_name"])
+
+    missing = resolved.isna()
+    if missing.any():
+        previous = events[["MAILITM_FID", "date", "next_établissement_postal"]]
+        lookback = pd.merge_asof(
+            alerts.loc[missing, ["mailitm_fid", "timestamp"]]
+            .reset_index()
+            .sort_values("timestamp", kind="mergesort"),
+            previous.sort_values("date", kind="mergesort"),
+            left_on="timestamp",
+            right_on="date",
+            left_by="mailitm_fid",
+            right_by="MAILITM_FID",
+            allow_exact_matches=False,
+        ).set_index("index")
+        resolved.loc[missing] = lookup(
+            lookback["next_établissement_postal"].reindex(alerts.index[missing])
+        )
+
+    # Keep ids as python ints / None (a float column would turn None into NaN)
+    alerts["office_id"] = pd.Series(
+        [ids[0] if ids else None for ids in resolved], index=alerts.index, dtype=object
+    )
+    alerts["state_id"] = pd.Series(
+        [ids[1] if ids else None for ids in resolved], index=alerts.index, dtype=object
+    )
+    return alerts
+
+
+# ---------------------------
+# Entry point
+# ---------------------------
+def evaluate_alerts(df_clean, evaluated_at=None, office_ids=None, codes=None):
+    """
+    Evaluate the ALR001–ALR008 rules across every package of an upload.
+
+    df_clean     : cleaned package events, with `date` parsed
+    evaluated_at : reference "now" for age thresholds (defaults to timezone.now())
+    office_ids   : {normalized office name: (office_id, state_id)}, as from
+                   office_directory()
+    codes        : restrict evaluation to these alert codes
+
+    Returns a DataFrame with ALERT_COLUMNS, one row per distinct
+    (alarm_code, timestamp, office_id, state_id).
+    """
+    evaluated_at = pd.Timestamp(evaluated_at or timezone.now())
+    if evaluated_at.tzinfo is None:
+        evaluated_at = evaluated_at.tz_localize(LOCAL_TZ)
+
+    if df_clean.empty:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    events = df_clean[
+        [
+            "MAILITM_FID",
+            "date",
+            "EVENT_TYPE_CD",
+            "établissement_postal",
+            "next_établissement_postal",
+        ]
+    ]
+    events = events[events["date"].notna()]
+    # The rules group and match on office names: plain objects, not categoricals
+    events = events.astype(
+        {
+            "EVENT_TYPE_CD": object,
+            "établissement_postal": object,
+            "next_établissement_postal": object,
+        }
+    )
+    events = events.sort_values(["MAILITM_FID", "date"], kind="mergesort")
+    if events["date"].dt.tz is None:
+        events = events.assign(date=events["date"].dt.tz_localize(LOCAL_TZ))
+
+    office = events["établissement_postal"]
+    events = events.assign(
+        _at_hb=_contains(office, HB_PATTERN),
+        _at_cpx=_contains(office, CPX_PATTERN),
+        _at_ctni=_contains(office, CTNI_PATTERN),
+        _at_hub=_contains(office, HUB_ACTIVITY_PATTERN),
+        _latest_elsewhere=_latest_elsewhere(events),
+    )
+
+    frames = []
+    for code in codes or ALERT_DEFINITIONS:
+        rule = ALERT_RULES.get(code)
+        if rule is None:
+            logger.warning(f"No alert rule registered for {code}")
+            continue
+        rows = rule(events, evaluated_at)
+        if not rows.empty:
+            frames.append(rows)
+
+    if not frames:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+    alerts = pd.concat(frames, ignore_index=True)
+
+    alerts = _resolve_offices(alerts, events, office_ids)
+    alerts = alerts.drop_duplicates(
+        subset=["alarm_code", "timestamp", "office_id", "state_id"]
+    ).reset_index(drop=True)
+    logger.debug(f"Evaluated {len(alerts)} alerts at {evaluated_at}")
+    return alerts[ALERT_COLUMNS]
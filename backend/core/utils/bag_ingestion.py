@@ -0,0 +1,317 @@
+import itertools
+import logging
+
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Bag, BagEvent, BagUploadMetaData, KPIDirtyEntity, UploadJob
+from core.utils.bag_state import (
+    derive_bag_states,
+    merge_stored_bags,
+    refresh_event_durations,
+)
+from core.utils.bulk_loader import bulk_insert
+from core.utils.clean_bag import (
+    clean_bag_data,
+    iter_clean_bag_chunks,
+    save_bag_upload_metadata,
+)
+from core.utils.kpi_tracking import mark_dirty
+from core.utils.office_resolver import office_directory, resolve_offices
+from core.utils.upload_jobs import report_rows, track_phase
+from core.utils.upload_ledger import (
+    clear_chunks,
+    committed_chunk_counts,
+    file_sha256,
+    find_duplicate_upload,
+    frame_sha256,
+    record_chunk,
+)
+
+logger = logging.getLogger(__name__)
+
+# BagEvent / Bag field → column of the cleaned (or aggregated) frame
+EVENT_COLUMNS = {
+    "receptacle_fid": "RECPTCL_FID",
+    "date": "date",
+    "event_typecd": "EVENT_TYPECD",
+    "etablissement_postal": "etablissement_postal",
+    "nextetablissement_postal": "nextetablissement_postal",
+    "country": "country",
+    "duration_to_next_step": "duration_to_next_step",
+    "total_duration": "total_duration",
+    "office_id": "office_id",
+    "state_id": "state_id",
+    "next_office_id": "next_office_id",
+    "next_state_id": "next_state_id",
+}
+BAG_COLUMNS = {
+    "receptacle_fid": "receptacle_fid",
+    "country": "country",
+    "total_duration": "total_duration",
+    "first_event_date": "first_event_date",
+    "last_event_date": "last_event_date",
+    "last_known_location": "last_known_location",
+    "events_count": "events_count",
+}
+
+# Counts returned by _load_bag_frame, summed over the chunks of an upload
+BAG_UPLOAD_COUNTS = ["events_saved", "bags_created", "bags_updated"]
+
+
+def format_duration(value):
+    if pd.isna(value) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        seconds = value.total_seconds()
+    days = int(seconds // 86400)
+    hours = int((seconds % 86400) // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{days} days {hours}h {minutes}m"
+
+
+def _or_none(value):
+    return None if pd.isna(value) else value
+
+
+def _sample_events(df_clean):
+    return [
+        {
+            "RECPTCL_FID": row["RECPTCL_FID"],
+            "date": str(row["date"]),
+            "EVENT_TYPECD": row["EVENT_TYPECD"],
+            "etablissement_postal": _or_none(row["etablissement_postal"]),
+            "nextetablissement_postal": _or_none(row["nextetablissement_postal"]),
+            "country": _or_none(row["country"]),
+            "duration_to_next_step": format_duration(row["duration_to_next_step"]),
+            "total_duration": format_duration(row["total_duration"]),
+        }
+        for _, row in df_clean.head(10).iterrows()
+    ]
+
+
+def _sample_bags(bags):
+    return [
+        {
+            "receptacle_fid": b["receptacle_fid"],
+            "country": _or_none(b["country"]),
+            "total_duration": format_duration(b["total_duration"]),
+            "first_event_date": b["first_event_date"].isoformat()
+            if pd.notna(b["first_event_date"])
+            else None,
+            "last_event_date": b["last_event_date"].isoformat()
+            if pd.notna(b["last_event_date"])
+            else None,
+            "last_known_location": _or_none(b["last_known_location"]),
+            "events_count": int(b["events_count"]),
+        }
+        for b in bags.head(10).to_dict("records")
+    ]
+
+
+def _save_metadata(file_obj, metadata, counts, content_hash):
+    extra_stats = {
+        "events_inserted": counts["events_saved"],
+        "bags_created": counts["bags_created"],
+        "bags_updated": counts["bags_updated"],
+        "content_hash": content_hash,
+    }
+    return save_bag_upload_metadata(file_obj, metadata, extra_stats)
+
+
+def _result(counts, samples):
+    return {
+        "status": "success",
+        "bags_saved": counts["bags_created"] + counts["bags_updated"],
+        **counts,
+        **samples,
+    }
+
+
+def _load_bag_frame(df_clean, directory, job=None, rows_done=0):
+    """
+    Load cleaned bag events: BagEvent rows, then the upserted Bag rows.
+
+    Every receptacle of `df_clean` must come with all of its events (a whole
+    file, or one chunk from iter_clean_bag_chunks). Office names are resolved
+    against `directory` (office_directory()). `rows_done` offsets the row
+    progress reported to `job`. Returns (counts, previews).
+    """
+    # Naive dates are in the current time zone
+    dates = df_clean["date"]
+    if dates.dt.tz is None:
+        df_clean = df_clean.assign(
+            date=dates.dt.tz_localize(timezone.get_current_timezone())
+        )
+
+    with track_phase(job, "events"):
+        office_id, state_id, unresolved = resolve_offices(
+            df_clean["etablissement_postal"], directory
+        )
+        next_office_id, next_state_id, next_unresolved = resolve_offices(
+            df_clean["nextetablissement_postal"], directory
+        )
+        unresolved = sorted(set(unresolved) | set(next_unresolved))
+        if unresolved:
+            logger.warning(f"🏤 {len(unresolved)} office names matched no office")
+        events = df_clean.assign(
+            office_id=office_id,
+            state_id=state_id,
+            next_office_id=next_office_id,
+            next_state_id=next_state_id,
+        )
+        loaded = bulk_insert(
+            BagEvent,
+            events,
+            EVENT_COLUMNS,
+            ignore_conflicts=True,
+            on_batch=lambda n: report_rows(job, rows_done + n),
+        )
+        logger.info(f"✅ Inserted {loaded['rows']} BagEvent records")
+
+    with track_phase(job, "bags"):
+        # --- Aggregate Bag data, merged with the stored bags ---
+        logger.debug("Aggregating Bag data per receptacle...")
+        bags, bags_updated, extended = merge_stored_bags(derive_bag_states(df_clean))
+        bags_created = len(bags) - bags_updated
+        logger.info(f"Prepared {len(bags)} Bag records")
+        if len(extended):
+            events_updated = refresh_event_durations(extended)
+            logger.info(
+                f"⏱️ Durations of {events_updated} events refreshed "
+                f"({len(extended)} bags with earlier events)"
+            )
+
+        # --- Upsert Bags ---
+        bulk_insert(
+            Bag,
+            bags,
+            BAG_COLUMNS,
+            update_fields=[field for field in BAG_COLUMNS if field != "receptacle_fid"],
+            unique_fields=["receptacle_fid"],
+        )
+        logger.info(f"✅ Bags: {bags_created} created, {bags_updated} updated")
+        mark_dirty(
+            KPIDirtyEntity.Kind.BAG,
+            Bag.objects.filter(
+                receptacle_fid__in=df_clean["RECPTCL_FID"].unique()
+            ).values_list("id", flat=True),
+        )
+
+    counts = {
+        "events_saved": loaded["rows"],
+        "bags_created": bags_created,
+        "bags_updated": bags_updated,
+    }
+    samples = {
+        "sample_events": _sample_events(df_clean),
+        "sample_bags": _sample_bags(bags),
+    }
+    return counts, samples
+
+
+def ingest_bag_file(file_obj, job=None, chunksize=None):
+    """
+    Clean a bag (receptacle) events CSV and load BagEvent + Bag rows.
+
+    file_obj  : uploaded (or staged) CSV file
+    job       : optional UploadJob receiving phase / row progress
+    chunksize : stream the file in chunks of this many rows. Defaults to
+                UPLOAD_STREAMING_CHUNK_ROWS for files larger than
+                UPLOAD_STREAMING_THRESHOLD_BYTES, otherwise the whole file is
+                loaded at once.
+
+    A file with the same content as an earlier completed upload is not loaded
+    again. A streamed file resumes after its last committed chunk.
+
+    Returns the counts and previews reported to the client.
+    """
+    content_hash = file_sha256(file_obj)
+    duplicate = find_duplicate_upload(BagUploadMetaData, content_hash)
+    if duplicate is not None:
+        logger.info(
+            f"⏭️ Same content as bag upload #{duplicate.id} ({duplicate.filename}), "
+            "skipped"
+        )
+        return {
+            "status": "duplicate",
+            "duplicate_of": duplicate.id,
+            "bags_saved": 0,
+            **dict.fromkeys(BAG_UPLOAD_COUNTS, 0),
+            "sample_events": [],
+            "sample_bags": [],
+        }
+
+    if chunksize is None:
+        file_size = getattr(file_obj, "size", 0) or 0
+        if file_size > settings.UPLOAD_STREAMING_THRESHOLD_BYTES:
+            chunksize = settings.UPLOAD_STREAMING_CHUNK_ROWS
+    if chunksize:
+        return _ingest_bag_chunks(file_obj, chunksize, content_hash, job)
+
+    # --- Clean uploaded data ---
+    with track_phase(job, "cleaning"):
+        logger.debug("Cleaning uploaded bag data...")
+        df_clean, metadata = clean_bag_data(file_obj)
+        if metadata["errors"]:
+            raise ValueError("; ".join(metadata["errors"]))
+    report_rows(job, 0, rows_total=len(df_clean))
+
+    counts, samples = _load_bag_frame(df_clean, office_directory(), job)
+    _save_metadata(file_obj, metadata, counts, content_hash)
+    logger.info("✅ Bag upload completed successfully")
+    return _result(counts, samples)
+
+
+def _ingest_bag_chunks(file_obj, chunksize, content_hash, job=None):
+    """
+    Streaming mode: clean and load one chunk of receptacles at a time.
+
+    Loaded chunks are recorded in the UploadChunk ledger like package chunks;
+    the previews come from the first chunk loaded by this run.
+    """
+    logger.info(f"Streaming bag upload in chunks of {chunksize} rows...")
+    metadata = {}
+    directory = office_directory()
+    chunks = iter_clean_bag_chunks(file_obj, metadata, chunksize=chunksize)
+    counts = dict.fromkeys(BAG_UPLOAD_COUNTS, 0)
+    samples = {"sample_events": [], "sample_bags": []}
+    rows_done = 0
+
+    for chunk_index in itertools.count():
+        with track_phase(job, "cleaning"):
+            df_clean = next(chunks, None)
+        if df_clean is None:
+            break
+        chunk_hash = frame_sha256(df_clean)
+        chunk_counts = committed_chunk_counts(
+            UploadJob.Kind.BAG, content_hash, chunk_index, chunk_hash
+        )
+        if chunk_counts is None:
+            chunk_counts, chunk_samples = _load_bag_frame(
+                df_clean, directory, job, rows_done
+            )
+            record_chunk(
+                UploadJob.Kind.BAG, content_hash, chunk_index, chunk_hash, chunk_counts
+            )
+            if not samples["sample_events"]:
+                samples = chunk_samples
+        else:
+            logger.info(f"⏭️ Bag chunk #{chunk_index} already loaded, skipped")
+        for key, value in chunk_counts.items():
+            counts[key] += value
+        rows_done += len(df_clean)
+        logger.info(f"🧩 Bag chunk loaded, {counts['events_saved']} events so far")
+        del df_clean
+
+    if metadata["errors"]:
+        raise ValueError("; ".join(metadata["errors"]))
+
+    _save_metadata(file_obj, metadata, counts, content_hash)
+    clear_chunks(UploadJob.Kind.BAG, content_hash)
+    report_rows(job, rows_done, rows_total=rows_done)
+    logger.info("✅ Bag upload completed successfully")
+    return _result(counts, samples)
@@ -0,0 +1,222 @@
+import logging
+
+import pandas as pd
+from django.db.models import Count, Max, Min, Q
+
+from core.models import Bag, BagEvent
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_BATCH_SIZE = 1000
+
+# Columns of the derived frame, in Bag field order
+BAG_STATE_COLUMNS = [
+    "receptacle_fid",
+    "country",
+    "total_duration",
+    "last_known_location",
+    "first_event_date",
+    "last_event_date",
+    "events_count",
+]
+
+EVENT_TOTALS = ["events_count", "first_event_date", "last_event_date", "location_date"]
+# BagEvent durations computed over the whole bag
+EVENT_DURATIONS = ["duration_to_next_step", "total_duration"]
+
+
+def _batches(values, size=LOOKUP_BATCH_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _durations(values):
+    """Timedeltas of a duration column (numbers are seconds)."""
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_timedelta(values, unit="s")
+    return pd.to_timedelta(values, errors="coerce")
+
+
+def derive_bag_states(df_clean):
+    """
+    One row per receptacle of cleaned bag events, indexed by receptacle_fid:
+    country and total duration of its first event, last known location (last
+    non-empty établissement) and its date, first / last event dates and event
+    count.
+    """
+    events = df_clean.sort_values(["RECPTCL_FID", "date"], kind="stable")
+    grouped = events.groupby("RECPTCL_FID", sort=False)
+
+    first = events.drop_duplicates("RECPTCL_FID", keep="first").set_index("RECPTCL_FID")
+    states = pd.DataFrame(
+        {
+            "country": first["country"].astype(object),
+            "total_duration": _durations(first["total_duration"]),
+            # "last" skips missing values
+            "last_known_location": grouped["etablissement_postal"]
+            .last()
+            .astype(object),
+            "location_date": events["date"]
+            .where(events["etablissement_postal"].notna())
+            .groupby(events["RECPTCL_FID"])
+            .max(),
+            "first_event_date": grouped["date"].min(),
+            "last_event_date": grouped["date"].max(),
+            "events_count": grouped.size(),
+        }
+    )
+    states.index.name = "receptacle_fid"
+    return states
+
+
+def _stored_bags(receptacle_fids):
+    """Stored Bag columns of these receptacles, indexed by receptacle_fid."""
+    rows = []
+    for batch in _batches(receptacle_fids):
+        rows.extend(
+            Bag.objects.filter(receptacle_fid__in=batch).values_list(*BAG_STATE_COLUMNS)
+        )
+    stored = pd.DataFrame.from_records(rows, columns=BAG_STATE_COLUMNS)
+    stored["total_duration"] = pd.to_timedelta(stored["total_duration"])
+    return stored.set_index("receptacle_fid")
+
+
+def _event_totals(receptacle_fids):
+    """
+    Event count, first / last event date and date of the last event with an
+    établissement, over the stored BagEvents.
+    """
+    rows = []
+    for batch in _batches(receptacle_fids):
+        rows.extend(
+            BagEvent.objects.filter(receptacle_fid__in=batch)
+            .values("receptacle_fid")
+            .annotate(
+                events_count=Count("id"),
+                first_event_date=Min("date"),
+                last_event_date=Max("date"),
+                location_date=Max("date", filter=Q(etablissement_postal__isnull=False)),
+            )
+            .values_list("receptacle_fid", *EVENT_TOTALS)
+        )
+    totals = pd.DataFrame.from_records(
+        rows,
+        columns=["receptacle_fid", *EVENT_TOTALS],
+    )
+    for column in ("first_event_date", "last_event_date", "location_date"):
+        totals[column] = pd.to_datetime(totals[column], utc=True)
+    return totals.set_index("receptacle_fid")
+
+
+def merge_stored_bags(states):
+    """
+    Bag rows of an upload merged with what earlier uploads stored.
+
+    Run once the upload's BagEvents are inserted: event count and first / last
+    dates are recounted from every stored event of the bag, and the total
+    duration is the span between them. The country comes from the upload when
+    it holds the bag's first event, the location when it holds its last
+    located event; otherwise the stored values are kept.
+
+    Returns (frame of BAG_STATE_COLUMNS, number of bags already stored,
+    receptacle_fids of the stored bags that gained events).
+    """
+    fids = states.index
+    stored = _stored_bags(fids).reindex(fids)
+    totals = _event_totals(fids).reindex(fids)
+    states = states.assign(
+        first_event_date=pd.to_datetime(states["first_event_date"], utc=True),
+        last_event_date=pd.to_datetime(states["last_event_date"], utc=True),
+        location_date=pd.to_datetime(states["location_date"], utc=True),
+    )
+
+    holds_first = totals["first_event_date"].isna() | (
+        states["first_event_date"] <= totals["first_event_date"]
+    )
+    holds_location = totals["location_date"].isna() | (
+        states["location_date"] >= totals["location_date"]
+    )
+
+    def merge(column, upload_wins):
+        # Bags created empty by package uploads have no stored values yet
+        return (
+            states[column]
+            .where(upload_wins, stored[column])
+            .fillna(stored[column])
+            .fillna(states[column])
+        )
+
+    merged = pd.DataFrame(
+        {
+            "country": merge("country", holds_first),
+            "last_known_location": merge("last_known_location", holds_location),
+            "first_event_date": totals["first_event_date"].fillna(
+                states["first_event_date"]
+            ),
+            "last_event_date": totals["last_event_date"].fillna(
+                states["last_event_date"]
+            ),
+            "events_count": totals["events_count"].fillna(states["events_count"]),
+        },
+        index=fids,
+    )
+    merged["total_duration"] = merged["last_event_date"] - merged["first_event_date"]
+    n_stored = int(stored["events_count"].notna().sum())
+    # Bags with earlier events that this upload added events to
+    extended = fids[
+        (
+            stored["events_count"].gt(0)
+            & totals["events_count"].gt(stored["events_count"])
+        ).to_numpy()
+    ]
+    return merged.reset_index()[BAG_STATE_COLUMNS], n_stored, extended
+
+
+def refresh_event_durations(receptacle_fids):
+    """
+    Recompute duration_to_next_step and total_duration of every stored event
+    of these bags.
+
+    The cleaner only sees the events of one file: once an upload adds events
+    to a stored bag, the event before each new one and the bag's span are
+    stale. Only the changed rows are written. Returns the number of events
+    updated.
+    """
+    updated = 0
+    for batch in _batches(receptacle_fids):
+        events = pd.DataFrame.from_records(
+            list(
+                BagEvent.objects.filter(receptacle_fid__in=batch)
+                .order_by("receptacle_fid", "date", "id")
+                .values_list("id", "receptacle_fid", "date", *EVENT_DURATIONS)
+            ),
+            columns=["id", "receptacle_fid", "date", *EVENT_DURATIONS],
+        )
+        dates = pd.to_datetime(events["date"], utc=True)
+        grouped = dates.groupby(events["receptacle_fid"], sort=False)
+        durations = pd.DataFrame(
+            {
+                "duration_to_next_step": grouped.shift(-1) - dates,
+                "total_duration": grouped.transform("max") - grouped.transform("min"),
+            }
+        )
+        stored = events[EVENT_DURATIONS].apply(pd.to_timedelta)
+        changed = (durations.ne(stored) & (durations.notna() | stored.notna())).any(
+            axis=1
+        )
+
+        refreshed = durations[changed]
+        refreshed = refreshed.astype(object).where(refreshed.notna(), None)
+        BagEvent.objects.bulk_update(
+            [
+                BagEvent(id=int(event_id), **row)
+                for event_id, row in zip(
+                    events.loc[changed, "id"], refreshed.to_dict("records")
+                )
+            ],
+            EVENT_DURATIONS,
+            batch_size=LOOKUP_BATCH_SIZE,
+        )
+        updated += len(refreshed)
+    return updated
@@ -0,0 +1,162 @@
+import logging
+import time
+
+import pandas as pd
+from django.conf import settings
+from django.db import NotSupportedError, connection, models, transaction
+from django.db.models.constants import OnConflict
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Column conversion
+# ----------------------------
+def _as_objects(values):
+    """Plain Python values, None for missing ones."""
+    values = values.astype(object)
+    return values.where(values.notna(), None)
+
+
+def _datetime_values(series):
+    dates = pd.to_datetime(series, errors="coerce")
+    if dates.dt.tz is None:
+        dates = dates.dt.tz_localize(settings.TIME_ZONE)
+    if connection.features.supports_timezones:
+        return _as_objects(pd.Series(dates.dt.to_pydatetime(), index=dates.index))
+
+    # Text as the backend adapts it: naive, in the connection time zone and
+    # without microseconds when there are none (str(datetime))
+    naive = dates.dt.tz_convert(connection.timezone).dt.tz_localize(None)
+    text = naive.dt.strftime("%Y-%m-%d %H:%M:%S")
+    microseconds = naive.dt.microsecond.fillna(0).astype("int64")
+    text = text.where(
+        microseconds == 0, text + "." + microseconds.astype(str).str.zfill(6)
+    )
+    return text.where(dates.notna(), None)
+
+
+def _duration_values(series):
+    if pd.api.types.is_timedelta64_dtype(series):
+        durations = series
+    elif pd.api.types.is_numeric_dtype(series):
+        # Numbers are seconds
+        durations = pd.to_timedelta(series, unit="s")
+    else:
+        durations = pd.to_timedelta(series, errors="coerce")
+    if connection.features.has_native_duration_field:
+        return _as_objects(pd.Series(durations.dt.to_pytimedelta(), index=series.index))
+    # Stored as a bigint of microseconds
+    return _as_objects((durations // pd.Timedelta(microseconds=1)).astype("Int64"))
+
+
+def _column_values(field, series):
+    """Database values of one frame column, converted as a whole."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if isinstance(field, models.DateTimeField):
+        return _datetime_values(series)
+    if isinstance(field, models.DurationField):
+        return _duration_values(series)
+    target = field.target_field if field.is_relation else field
+    if isinstance(target, (models.IntegerField, models.AutoField)):
+        return _as_objects(pd.to_numeric(series, errors="coerce").astype("Int64"))
+    if isinstance(target, models.BooleanField):
+        return _as_objects(series.astype("boolean"))
+    return _as_objects(series)
+
+
+def frame_rows(model, frame, columns):
+    """
+    Insert tuples of `frame` for `model`, built column by column.
+
+    columns : {model field name (or attname, e.g. "package_id"): frame column}
+
+    Fields left out get their default when they have one. Returns
+    (fields, rows).
+    """
+    fields = [model._meta.get_field(name) for name in columns]
+    values = [
+        _column_values(field, frame[column]).tolist()
+        for field, column in zip(fields, columns.values())
+    ]
+    for field in model._meta.concrete_fields:
+        if field in fields or field.primary_key or not field.has_default():
+            continue
+        fields.append(field)
+        values.append([field.get_default()] * len(frame))
+    return fields, list(zip(*values))
+
+
+# ----------------------------
+# Insert
+# ----------------------------
+def _insert_sql(model, fields, ignore_conflicts, update_fields, unique_fields):
+    ops = connection.ops
+    if update_fields:
+        on_conflict = OnConflict.UPDATE
+        update_fields = [model._meta.get_field(name).column for name in update_fields]
+        unique_fields = [model._meta.get_field(name).column for name in unique_fields]
+    else:
+        on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+    sql = (
+        f"{ops.insert_statement(on_conflict=on_conflict)} "
+        f"{ops.quote_name(model._meta.db_table)} "
+        f"({', '.join(ops.quote_name(field.column) for field in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    suffix = ops.on_conflict_suffix_sql(
+        fields, on_conflict, update_fields, unique_fields
+    )
+    return f"{sql} {suffix}" if suffix else sql
+
+
+def bulk_insert(
+    model,
+    frame,
+    columns,
+    batch_size=None,
+    ignore_conflicts=False,
+    update_fields=None,
+    unique_fields=None,
+    on_batch=None,
+):
+    """
+    Insert every row of `frame` into `model` with batched executemany, without
+    building model instances (no save() / signals).
+
+    columns          : {model field: frame column}, see frame_rows()
+    batch_size       : rows per executemany (default BULK_LOAD_BATCH_SIZE)
+    ignore_conflicts : skip rows violating a unique constraint
+    update_fields    : upsert instead, rows whose `unique_fields` already exist
+                       get these fields overwritten (INSERT ... ON CONFLICT
+                       DO UPDATE)
+    on_batch         : called with the number of rows sent after each batch
+
+    Returns {"rows", "seconds", "rows_per_sec"}.
+    """
+    batch_size = batch_size or settings.BULK_LOAD_BATCH_SIZE
+    if update_fields and not connection.features.supports_update_conflicts_with_target:
+        raise NotSupportedError(
+            "This database backend does not support updating conflicts with "
+            "specifying unique fields that can trigger the upsert."
+        )
+    start = time.perf_counter()
+
+    fields, rows = frame_rows(model, frame, columns)
+    if rows:
+        sql = _insert_sql(model, fields, ignore_conflicts, update_fields, unique_fields)
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i : i + batch_size]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            if on_batch:
+                on_batch(i + len(batch))
+
+    seconds = time.perf_counter() - start
+    rows_per_sec = len(rows) / seconds if seconds else 0.0
+    logger.info(
+        f"⚡ {model.__name__}: {len(rows)} rows loaded in {seconds:.2f}s "
+        f"({rows_per_sec:,.0f} rows/s)"
+    )
+    return {"rows": len(rows), "seconds": seconds, "rows_per_sec": rows_per_sec}
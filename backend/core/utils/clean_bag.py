@@ -1,82 +1,223 @@
 import pandas as pd
-import numpy as np
-import io
 import time
 import traceback
 import os
 import logging
+from collections import defaultdict
 from django.utils import timezone
 from core.models import BagUploadMetaData
+from core.utils.cleaning import CSV_READ_OPTIONS, concat_raw_frames, read_csv_frames
 
 logger = logging.getLogger(__name__)
 
+# Declared schema: event codes / names are read as categoricals, the rest as
+# strings ("date" is parsed in _clean_bag_frame)
+BAG_CATEGORY_COLUMNS = ["EVENT_TYPECD", "LOCAL_EVENT_TYPE_NM"]
+BAG_CSV_READ_OPTIONS = {
+    **CSV_READ_OPTIONS,
+    "dtype": defaultdict(lambda: str, dict.fromkeys(BAG_CATEGORY_COLUMNS, "category")),
+}
+
+SAMPLING_EVENT_NM = "Receptacle evaluated for sampling"
+# Columns of the cleaned frame
+BAG_CLEAN_COLUMNS = [
+    "RECPTCL_FID",
+    "date",
+    "EVENT_TYPECD",
+    "etablissement_postal",
+    "nextetablissement_postal",
+    "country",
+    "duration_to_next_step",
+    "total_duration",
+]
+
+
+def _new_metadata():
+    return {"errors": [], "warnings": [], "cleaning_summary": {}}
+
+
+def _clean_bag_frame(df_raw, metadata, check_dates=True):
+    """
+    Validate and clean raw bag rows.
 
-def clean_bag(raw_csv_file):
-    """Clean and preprocess uploaded bag (receptacle) data CSV. Args: raw_csv_file (InMemoryUploadedFile or file-like): Uploaded CSV file. Returns: pd.DataFrame: Cleaned and structured bag dataset."""
-    # --- Read CSV safely ---
-    try:
-        text_stream = io.TextIOWrapper(raw_csv_file, encoding="utf-8")
-        df = pd.read_csv(text_stream, delimiter=";", dtype=str)
-    except Exception as e:
-        raise ValueError(f"Error reading CSV file: {e}")
-    # --- Basic cleaning ---
-    df["country"] = df["RECPTCL_FID"].str[:2]
-    df = df[df["LOCAL_EVENT_TYPE_NM"] != "Receptacle evaluated for sampling"].copy()
-    # --- Parse dates ---
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    # --- Sort and compute durations ---
+    Every RECPTCL_FID must be complete in `df_raw`, since durations are
+    computed per receptacle. Returns (df, rows_removed_sampling,
+    rows_removed_duplicates), or (None, 0, 0) when validation fails (the
+    reason is added to metadata["errors"]). Dates are datetime64 and
+    durations timedelta64 columns.
+    """
+    # --- 1️⃣ Basic validation ---
+    required_columns = {"RECPTCL_FID", "date"}
+    missing_required = required_columns - set(df_raw.columns)
+    if missing_required:
+        metadata["errors"].append(
+            f"Missing required columns: {', '.join(missing_required)}"
+        )
+        return None, 0, 0
+
+    # --- 2️⃣ Drop sampling evaluations ---
+    rows_removed_sampling = 0
+    if "LOCAL_EVENT_TYPE_NM" in df_raw.columns:
+        sampling = df_raw["LOCAL_EVENT_TYPE_NM"].eq(SAMPLING_EVENT_NM).to_numpy()
+        rows_removed_sampling = int(sampling.sum())
+        df_raw = df_raw[~sampling]
+
+    # --- 3️⃣ Date parsing ---
+    df = df_raw.assign(
+        country=df_raw["RECPTCL_FID"].astype(str).str[:2],
+        date=pd.to_datetime(df_raw["date"], errors="coerce"),
+    )
+    if check_dates and df["date"].isna().all():
+        metadata["errors"].append("All 'date' values could not be parsed.")
+        return None, 0, 0
+
+    # --- 4️⃣ Sort and duration calculations ---
     df = df.sort_values(["RECPTCL_FID", "date"]).reset_index(drop=True)
-    df["duration_to_next_step"] = (
-        df.groupby("RECPTCL_FID")["date"].shift(-1) - df["date"]
+    dates = df.groupby("RECPTCL_FID")["date"]
+    df["duration_to_next_step"] = dates.shift(-1) - df["date"]
+    df["total_duration"] = dates.transform("last") - dates.transform("first")
+
+    # --- 5️⃣ Guarantee columns ---
+    for col in BAG_CLEAN_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+            if f"Added missing column '{col}'" not in metadata["warnings"]:
+                metadata["warnings"].append(f"Added missing column '{col}'")
+
+    # --- 6️⃣ Postal data cleanup: exports without an office are at the origin ---
+    missing_office = df["EVENT_TYPECD"].eq("107") & df["etablissement_postal"].isna()
+    df["etablissement_postal"] = df["etablissement_postal"].mask(
+        missing_office, df["country"]
     )
-    first_date = df.groupby("RECPTCL_FID")["date"].transform("first")
-    last_date = df.groupby("RECPTCL_FID")["date"].transform("last")
-    df["total_duration"] = last_date - first_date
-    # --- Postal fixes ---
-    df["etablissement_postal"] = df["etablissement_postal"].replace("", np.nan)
-    mask = df["EVENT_TYPECD"].eq(107) & df["etablissement_postal"].isna()
-    df.loc[mask, "etablissement_postal"] = df.loc[
-        mask, "country"
-    ]  # --- Deduplicate ---
+
+    # --- 7️⃣ Deduplication ---
+    before_dedup = len(df)
     df = df.drop_duplicates(
         subset=["RECPTCL_FID", "date", "EVENT_TYPECD", "etablissement_postal"],
         keep="first",
     )
-    # --- Keep only relevant columns ---
-    keep_cols = [
-        "RECPTCL_FID",
-        "date",
-        "EVENT_TYPECD",
-        "etablissement_postal",
-        "nextetablissement_postal",
-        "country",
-        "duration_to_next_step",
-        "total_duration",
-    ]
-    df = df[[c for c in keep_cols if c in df.columns]]
-    # --- Final cleanup ---
-    df.replace([pd.NaT, pd.NA, np.nan, np.inf, -np.inf], None, inplace=True)
-    print(" BAG DATA CLEANED SUCCESSFULLY ")
-    print(f"Rows: {len(df)} | Columns: {df.columns.tolist()}")
-    return df
+    rows_removed_duplicates = int(before_dedup - len(df))
+    return df[BAG_CLEAN_COLUMNS], rows_removed_sampling, rows_removed_duplicates
+
+
+def _accumulate_bag_stats(totals, df, rows_removed_sampling, rows_removed_duplicates):
+    """Fold the statistics of one cleaned frame into running `totals`."""
+    step = df["duration_to_next_step"].dt.total_seconds().dropna()
+    total = df["total_duration"].dt.total_seconds().dropna()
+
+    totals["n_rows"] = totals.get("n_rows", 0) + len(df)
+    totals.setdefault("columns", list(df.columns))
+    by_column = totals.setdefault("missing_values_by_column", {})
+    for col, count in df.isna().sum().to_dict().items():
+        by_column[col] = by_column.get(col, 0) + int(count)
+
+    totals.setdefault("bags", set()).update(df["RECPTCL_FID"].unique())
+    event_counts = totals.setdefault("event_type_counts", {})
+    for code, count in df["EVENT_TYPECD"].value_counts().items():
+        if count:  # categoricals also count unused labels
+            event_counts[code] = event_counts.get(code, 0) + int(count)
+
+    for key, value, pick in [
+        ("earliest_date", df["date"].min(), min),
+        ("latest_date", df["date"].max(), max),
+    ]:
+        if pd.notna(value):
+            current = totals.get(key)
+            totals[key] = value if current is None else pick(current, value)
+
+    for key, value in [
+        ("step_seconds", step.sum()),
+        ("step_count", len(step)),
+        ("total_seconds", total.sum()),
+        ("total_count", len(total)),
+        ("rows_removed_sampling", rows_removed_sampling),
+        ("rows_removed_duplicates", rows_removed_duplicates),
+    ]:
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _bag_stats_metadata(metadata, totals, start_time):
+    """Turn running `totals` into the summary fields of `metadata`."""
+    rows_removed_sampling = totals.get("rows_removed_sampling", 0)
+    if rows_removed_sampling > 0:
+        metadata["warnings"].append(
+            f"Removed {rows_removed_sampling} rows with sampling evaluation events"
+        )
+    rows_removed_duplicates = totals.get("rows_removed_duplicates", 0)
+    if rows_removed_duplicates > 0:
+        metadata["warnings"].append(f"Removed {rows_removed_duplicates} duplicate rows")
+    bad_lines = metadata.get("bad_lines", 0)
+    if bad_lines > 0:
+        metadata["warnings"].append(f"Skipped {bad_lines} malformed lines")
+
+    earliest_date = totals.get("earliest_date")
+    latest_date = totals.get("latest_date")
+    time_range_days = (
+        (latest_date - earliest_date).days
+        if earliest_date is not None and latest_date is not None
+        else None
+    )
+
+    missing_values_by_column = totals.get("missing_values_by_column", {})
+    columns = totals.get("columns", [])
+    event_counts = pd.Series(totals.get("event_type_counts", {}), dtype="int64")
+
+    def average_seconds(seconds_key, count_key):
+        count = totals.get(count_key, 0)
+        return round(float(totals[seconds_key] / count), 6) if count else None
+
+    metadata.update(
+        {
+            "n_rows": totals.get("n_rows", 0),
+            "n_columns": len(columns),
+            "columns": columns,
+            "missing_values_count": int(sum(missing_values_by_column.values())),
+            "missing_values_by_column": missing_values_by_column,
+            "unique_bags_count": len(totals.get("bags", ())),
+            "unique_event_types": int(event_counts.size),
+            "top_event_types": event_counts.sort_values(
+                ascending=False, kind="mergesort"
+            )
+            .head(10)
+            .to_dict(),
+            "earliest_date": earliest_date,
+            "latest_date": latest_date,
+            "time_range_days": time_range_days,
+            "cleaning_time_seconds": round(time.time() - start_time, 3),
+            "rows_removed_due_to_sampling": rows_removed_sampling,
+            "rows_removed_due_to_duplicates": rows_removed_duplicates,
+            "avg_step_duration_seconds": average_seconds("step_seconds", "step_count"),
+            "avg_total_duration_seconds": average_seconds(
+                "total_seconds", "total_count"
+            ),
+        }
+    )
+    return metadata
 
 
 def clean_bag_data(raw_csv_file):
     """
-    Clean uploaded bag (receptacle) CSV and extract metadata for analysis/logging.
+    Clean an uploaded bag (receptacle) CSV and compute its upload metadata.
+
+    The file is parsed once with BAG_CSV_READ_OPTIONS. Validation problems
+    are reported in metadata["errors"].
 
     Returns:
         tuple[pd.DataFrame, dict]: (cleaned DataFrame, metadata dict)
     """
     start_time = time.time()
-    metadata = {"errors": [], "warnings": [], "cleaning_summary": {}}
+    metadata = _new_metadata()
 
     try:
-        # --- 1️⃣ Read CSV safely ---
-        text_stream = io.TextIOWrapper(raw_csv_file, encoding="utf-8")
+        # --- Read CSV safely ---
         try:
-            df_raw = pd.read_csv(text_stream, delimiter=";", dtype=str)
+            df_raw = next(
+                read_csv_frames(raw_csv_file, metadata, options=BAG_CSV_READ_OPTIONS)
+            )
+            df_raw.columns = df_raw.columns.str.strip()
         except Exception as e:
+            logger.error(e)
             metadata["errors"].append(f"CSV parsing error: {str(e)}")
             metadata["traceback"] = traceback.format_exc()
             return pd.DataFrame(), metadata
@@ -84,119 +225,17 @@ def clean_bag_data(raw_csv_file):
         metadata["raw_rows"] = len(df_raw)
         metadata["raw_columns"] = list(df_raw.columns)
 
-        # --- 2️⃣ Basic validation ---
-        required_columns = {"RECPTCL_FID", "date"}
-        missing_required = required_columns - set(df_raw.columns)
-        if missing_required:
-            metadata["errors"].append(
-                f"Missing required columns: {', '.join(missing_required)}"
-            )
-            return df_raw, metadata
-
-        # --- 3️⃣ Basic cleaning ---
-        df_raw["country"] = df_raw["RECPTCL_FID"].astype(str).str[:2]
-        if "LOCAL_EVENT_TYPE_NM" in df_raw.columns:
-            before = len(df_raw)
-            df_raw = df_raw[
-                df_raw["LOCAL_EVENT_TYPE_NM"] != "Receptacle evaluated for sampling"
-            ].copy()
-            removed = before - len(df_raw)
-            if removed > 0:
-                metadata["warnings"].append(
-                    f"Removed {removed} rows with sampling evaluation events"
-                )
-
-        # --- 4️⃣ Date parsing ---
-        df_raw["date"] = pd.to_datetime(df_raw["date"], errors="coerce")
-        if df_raw["date"].isna().all():
-            metadata["errors"].append("All 'date' values could not be parsed.")
-            return df_raw, metadata
-
-        # --- 5️⃣ Sort and duration calculations ---
-        df = df_raw.sort_values(["RECPTCL_FID", "date"]).reset_index(drop=True)
-        df["duration_to_next_step"] = (
-            df.groupby("RECPTCL_FID")["date"].shift(-1) - df["date"]
-        )
-        first_date = df.groupby("RECPTCL_FID")["date"].transform("first")
-        last_date = df.groupby("RECPTCL_FID")["date"].transform("last")
-        df["total_duration"] = last_date - first_date
-
-        # --- 6️⃣ Postal data cleanup ---
-        if "etablissement_postal" in df.columns:
-            df["etablissement_postal"] = df["etablissement_postal"].replace("", np.nan)
-            mask = df["EVENT_TYPECD"].eq("107") & df["etablissement_postal"].isna()
-            df.loc[mask, "etablissement_postal"] = df.loc[mask, "country"]
-
-        # --- 7️⃣ Deduplication ---
-        before_dedup = len(df)
-        df = df.drop_duplicates(
-            subset=["RECPTCL_FID", "date", "EVENT_TYPECD", "etablissement_postal"],
-            keep="first",
-        )
-        removed_duplicates = before_dedup - len(df)
-        if removed_duplicates > 0:
-            metadata["warnings"].append(f"Removed {removed_duplicates} duplicate rows")
-
-        # --- 8️⃣ Keep only relevant columns ---
-        keep_cols = [
-            "RECPTCL_FID",
-            "date",
-            "EVENT_TYPECD",
-            "etablissement_postal",
-            "nextetablissement_postal",
-            "country",
-            "duration_to_next_step",
-            "total_duration",
-        ]
-        df = df[[c for c in keep_cols if c in df.columns]]
-
-        # --- 9️⃣ Replace NaN with None ---
-        df.replace([pd.NaT, pd.NA, np.nan, np.inf, -np.inf], None, inplace=True)
-
-        # --- 🔟 Metadata statistics ---
-        n_rows = len(df)
-        n_columns = len(df.columns)
-        unique_bags = int(df["RECPTCL_FID"].nunique())
-        unique_event_types = int(df["EVENT_TYPECD"].nunique())
-        top_event_types = df["EVENT_TYPECD"].value_counts().head(10).to_dict()
-
-        avg_step_duration = df["duration_to_next_step"].mean()
-        avg_total_duration = df["total_duration"].mean()
-        earliest_date = df["date"].min()
-        latest_date = df["date"].max()
-        time_range_days = (
-            (latest_date - earliest_date).days
-            if pd.notna(earliest_date) and pd.notna(latest_date)
-            else None
+        df, rows_removed_sampling, rows_removed_duplicates = _clean_bag_frame(
+            df_raw, metadata
         )
+        if df is None:
+            return df_raw, metadata
 
-        metadata.update(
-            {
-                "n_rows": n_rows,
-                "n_columns": n_columns,
-                "columns": list(df.columns),
-                "unique_bags_count": unique_bags,
-                "unique_event_types": unique_event_types,
-                "top_event_types": top_event_types,
-                "earliest_date": earliest_date,
-                "latest_date": latest_date,
-                "time_range_days": time_range_days,
-                "avg_step_duration_seconds": (
-                    avg_step_duration.total_seconds()
-                    if pd.notna(avg_step_duration)
-                    else None
-                ),
-                "avg_total_duration_seconds": (
-                    avg_total_duration.total_seconds()
-                    if pd.notna(avg_total_duration)
-                    else None
-                ),
-                "rows_removed_due_to_duplicates": removed_duplicates,
-                "missing_values_by_column": df.isna().sum().to_dict(),
-                "missing_values_count": int(df.isna().sum().sum()),
-                "cleaning_time_seconds": round(time.time() - start_time, 3),
-            }
+        totals = _accumulate_bag_stats(
+            {}, df, rows_removed_sampling, rows_removed_duplicates
         )
+        _bag_stats_metadata(metadata, totals, start_time)
+        logger.info(f"✅ Bag data cleaned: {len(df)} rows")
 
     except Exception as e:
         metadata["errors"].append(f"Unexpected error: {str(e)}")
@@ -206,63 +245,78 @@ def clean_bag_data(raw_csv_file):
     return df if "df" in locals() else pd.DataFrame(), metadata
 
 
-def get_bag_upload_metadata(df, start_time):
-    """Generate metadata dictionary from a cleaned bag DataFrame."""
-    metadata = {}
-
-    try:
-        metadata["n_rows"] = len(df)
-        metadata["n_columns"] = len(df.columns)
-        metadata["columns"] = list(df.columns)
-        metadata["missing_values_count"] = int(df.isna().sum().sum())
-        metadata["missing_values_by_column"] = df.isna().sum().to_dict()
-
-        # Bag and event type stats
-        metadata["unique_bags_count"] = int(df["RECPTCL_FID"].nunique())
-        metadata["unique_event_types"] = int(df["EVENT_TYPECD"].nunique())
-        metadata["top_event_types"] = (
-            df["EVENT_TYPECD"].value_counts().head(10).to_dict()
-        )
-
-        # Date range
-        metadata["earliest_date"] = pd.to_datetime(df["date"], errors="coerce").min()
-        metadata["latest_date"] = pd.to_datetime(df["date"], errors="coerce").max()
-
-        if pd.notna(metadata["earliest_date"]) and pd.notna(metadata["latest_date"]):
-            metadata["time_range_days"] = (
-                metadata["latest_date"] - metadata["earliest_date"]
-            ).days
-        else:
-            metadata["time_range_days"] = None
+def iter_clean_bag_chunks(raw_csv_file, metadata, chunksize=100_000):
+    """
+    Streaming variant of clean_bag_data: yield cleaned frames of ~chunksize rows.
 
-        # --- FIX: ensure duration columns are numeric (seconds) ---
-        for col in ["duration_to_next_step", "total_duration"]:
-            if col in df.columns:
-                df[col] = pd.to_timedelta(df[col], errors="coerce").dt.total_seconds()
+    The rows of the last RECPTCL_FID of each chunk are carried over to the
+    next one, so every receptacle is cleaned with all of its events as long as
+    the file keeps each receptacle's rows together. Statistics are complete
+    in `metadata` once the generator is exhausted; validation errors stop the
+    stream and are reported in metadata["errors"].
+    """
+    start_time = time.time()
+    metadata.update(_new_metadata())
+    metadata["raw_rows"] = 0
+    totals = {}
 
-        # Compute averages safely
-        avg_step_duration = df["duration_to_next_step"].mean(skipna=True)
-        avg_total_duration = df["total_duration"].mean(skipna=True)
+    reader = read_csv_frames(
+        raw_csv_file, metadata, chunksize=chunksize, options=BAG_CSV_READ_OPTIONS
+    )
 
-        metadata["avg_step_duration_seconds"] = (
-            float(avg_step_duration) if pd.notna(avg_step_duration) else None
-        )
-        metadata["avg_total_duration_seconds"] = (
-            float(avg_total_duration) if pd.notna(avg_total_duration) else None
+    def clean(df_raw):
+        df, removed_sampling, removed_duplicates = _clean_bag_frame(
+            df_raw, metadata, check_dates=False
         )
+        if df is not None:
+            _accumulate_bag_stats(totals, df, removed_sampling, removed_duplicates)
+        return df
 
-        # Cleaning time
-        metadata["cleaning_time_seconds"] = round(time.time() - start_time, 3)
-
-        logger.info("✅ Bag metadata generated successfully")
-        logger.debug(f"📊 Metadata summary: {metadata}")
-
-    except Exception:
-        logger.exception("❌ Error generating bag metadata")
-        metadata["error"] = "Error while generating bag metadata"
-        metadata["traceback"] = traceback.format_exc()
-
-    return metadata
+    carry = None
+    while True:
+        try:
+            chunk = next(reader, None)
+        except Exception as e:
+            logger.error(e)
+            metadata["errors"].append(f"CSV parsing error: {str(e)}")
+            metadata["traceback"] = traceback.format_exc()
+            return
+        if chunk is None:
+            break
+        chunk.columns = chunk.columns.str.strip()
+        metadata.setdefault("raw_columns", list(chunk.columns))
+        metadata["raw_rows"] += len(chunk)
+
+        if carry is not None:
+            chunk = concat_raw_frames([carry, chunk], BAG_CATEGORY_COLUMNS)
+        if "RECPTCL_FID" not in chunk.columns:
+            clean(chunk)  # reports the missing column
+            return
+
+        # Hold back the (possibly incomplete) last receptacle until the next chunk
+        fid = chunk["RECPTCL_FID"]
+        same_bag = (fid == fid.iloc[-1]).to_numpy()
+        if same_bag.all():
+            carry = chunk
+            continue
+        tail = int((~same_bag[::-1]).argmax())
+        carry = chunk.iloc[len(chunk) - tail :] if tail else None
+
+        df = clean(chunk.iloc[: len(chunk) - tail])
+        if df is None:
+            return
+        logger.debug(f"🧩 Cleaned bag chunk: {len(df)} rows")
+        yield df
+
+    if carry is not None:
+        df = clean(carry)
+        if df is None:
+            return
+        yield df
+
+    if totals.get("earliest_date") is None:
+        metadata["errors"].append("All 'date' values could not be parsed.")
+    _bag_stats_metadata(metadata, totals, start_time)
 
 
 def save_bag_upload_metadata(uploaded_file, metadata, extra_stats=None):
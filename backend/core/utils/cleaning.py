@@ -1,7 +1,10 @@
+import numpy as np
 import pandas as pd
-import io
 import time
 import traceback
+import warnings
+from collections import defaultdict
+from pandas.api.types import union_categoricals
 from core.models import UploadMetaData
 from django.utils import timezone
 import os
@@ -9,28 +12,313 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-
-def clean_package_data(raw_csv_file):
-    start_time = time.time()
-    metadata = {
+# Declared schema: low-cardinality columns are read as categoricals, the rest
+# as strings ("date" is parsed in _clean_package_frame)
+CATEGORY_COLUMNS = [
+    "EVENT_TYPE_CD",
+    "établissement_postal",
+    "next_établissement_postal",
+]
+PACKAGE_CSV_DTYPES = defaultdict(
+    lambda: str, dict.fromkeys(CATEGORY_COLUMNS, "category")
+)
+
+CSV_READ_OPTIONS = {
+    "sep": ";",
+    "dtype": PACKAGE_CSV_DTYPES,
+    "engine": "c",
+    "on_bad_lines": "warn",
+    "encoding": "utf-8",
+    "encoding_errors": "replace",
+}
+
+
+def _new_metadata():
+    return {
         "errors": [],
         "warnings": [],
         "cleaning_summary": {},
     }
 
+
+def _csv_frames(raw_csv_file, options, chunksize=None):
+    if chunksize:
+        yield from pd.read_csv(raw_csv_file, chunksize=chunksize, **options)
+    else:
+        yield pd.read_csv(raw_csv_file, **options)
+
+
+def _count_skipped_lines(caught):
+    return sum(
+        str(w.message).count("Skipping line")
+        for w in caught
+        if issubclass(w.category, pd.errors.ParserWarning)
+    )
+
+
+def read_csv_frames(raw_csv_file, metadata, chunksize=None, options=CSV_READ_OPTIONS):
+    """
+    Yield raw frames of an upload CSV (a single frame when chunksize is None).
+
+    The C parser is used with `options` (the package schema by default). If it
+    fails on a malformed file (e.g. an unbalanced quote), the file is read
+    again with the python parser and the rows already yielded are skipped.
+    Lines with the wrong number of fields are dropped by both parsers and
+    counted in metadata["bad_lines"].
+    """
+    metadata["bad_lines"] = 0
+    rows_read = 0
+    frames = _csv_frames(raw_csv_file, options, chunksize)
+    try:
+        while True:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", pd.errors.ParserWarning)
+                frame = next(frames, None)
+            metadata["bad_lines"] += _count_skipped_lines(caught)
+            if frame is None:
+                return
+            rows_read += len(frame)
+            yield frame
+    except pd.errors.ParserError as e:
+        logger.warning(f"⚠️ C parser failed, falling back to the python engine: {e}")
+        metadata["warnings"].append(f"Malformed CSV read with the python parser: {e}")
+
+    bad_lines = 0
+
+    def skip_bad_line(fields):
+        # Returning None drops the line
+        nonlocal bad_lines
+        bad_lines += 1
+
+    raw_csv_file.seek(0)
+    frames = _csv_frames(
+        raw_csv_file,
+        {**options, "engine": "python", "on_bad_lines": skip_bad_line},
+        chunksize,
+    )
+    for frame in frames:
+        if rows_read:
+            skipped = min(rows_read, len(frame))
+            rows_read -= skipped
+            frame = frame.iloc[skipped:]
+            if frame.empty:
+                continue
+        metadata["bad_lines"] = bad_lines
+        yield frame
+    metadata["bad_lines"] = bad_lines
+
+
+def _strip_labels(series):
+    """
+    Strip the labels of a categorical (or string) column and turn "nan" into
+    missing, working on the categories instead of every row.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    labels = series.cat.categories.astype(str).str.strip()
+    codes, uniques = pd.factorize(labels.where(labels != "nan"))
+    # Missing values (code -1) pick the trailing -1, also when there are no
+    # categories at all (a blank or added column)
+    new_codes = np.append(codes, -1)[series.cat.codes.to_numpy()]
+    return pd.Series(
+        pd.Categorical.from_codes(new_codes, categories=uniques),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def concat_raw_frames(frames, category_columns=CATEGORY_COLUMNS):
+    """Concatenate raw frames, keeping the categorical columns categorical."""
+    for col in category_columns:
+        columns = [f[col] for f in frames if col in f.columns]
+        if len(columns) == len(frames) and all(
+            isinstance(c.dtype, pd.CategoricalDtype) for c in columns
+        ):
+            categories = union_categoricals(columns).categories
+            frames = [
+                f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames
+            ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _clean_package_frame(df_raw, metadata, check_dates=True):
+    """
+    Validate and clean raw package rows (steps 2️⃣–8️⃣ of clean_package_data).
+
+    Every MAILITM_FID must be complete in `df_raw`, since durations are computed
+    per package. Returns (df, rows_removed_invalid, rows_removed_duplicates), or
+    (None, 0, 0) when validation fails (the reason is added to metadata["errors"]).
+    """
+    # --- 2️⃣ Basic validation ---
+    required_columns = {"MAILITM_FID", "date"}
+    missing_required = required_columns - set(df_raw.columns)
+    if missing_required:
+        metadata["errors"].append(
+            f"Missing required columns: {', '.join(missing_required)}"
+        )
+        return None, 0, 0
+
+    # --- 3️⃣ Convert dates safely ---
+    df_raw["date"] = pd.to_datetime(df_raw["date"], errors="coerce")
+    if check_dates and df_raw["date"].isna().all():
+        metadata["errors"].append("All 'date' values could not be parsed.")
+        return None, 0, 0
+
+    # --- 4️⃣ Filter invalid MAILITM_FID entries ---
+    valid_mask = df_raw["MAILITM_FID"].astype(str).str[-2:].str.isalpha()
+    rows_removed_invalid = int((~valid_mask).sum())
+    df = df_raw[valid_mask].copy()
+
+    # --- 5️⃣ Derive and clean ---
+    df["country"] = df["MAILITM_FID"].astype(str).str[-2:]
+    # if "RECPTCL_FID" in df.columns:
+    #     df = df.drop(columns=["RECPTCL_FID"])
+
+    df = df.sort_values(["MAILITM_FID", "date"])
+
+    # --- 6️⃣ Duration calculations ---
+    df["duration_to_next_step"] = (
+        df.groupby("MAILITM_FID")["date"].shift(-1) - df["date"]
+    )
+    first_date = df.groupby("MAILITM_FID")["date"].transform("first")
+    last_date = df.groupby("MAILITM_FID")["date"].transform("last")
+    df["total_duration"] = last_date - first_date
+
+    # --- 7️⃣ Guarantee columns ---
+    for col in CATEGORY_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+            if f"Added missing column '{col}'" not in metadata["warnings"]:
+                metadata["warnings"].append(f"Added missing column '{col}'")
+        df[col] = _strip_labels(df[col])
+
+    df["MAILITM_FID"] = df["MAILITM_FID"].astype(str).str.strip()
+    # A missing event type is kept as the "None" label
+    event_type = df["EVENT_TYPE_CD"]
+    if event_type.isna().any():
+        if "None" not in event_type.cat.categories:
+            event_type = event_type.cat.add_categories("None")
+        df["EVENT_TYPE_CD"] = event_type.fillna("None")
+
+    # --- 8️⃣ Deduplication ---
+    before_dedup = len(df)
+    df = df.drop_duplicates(
+        subset=["MAILITM_FID", "date", "EVENT_TYPE_CD", "établissement_postal"],
+        keep="first",
+    )
+    rows_removed_duplicates = int(before_dedup - len(df))
+    return df, rows_removed_invalid, rows_removed_duplicates
+
+
+def _accumulate_package_stats(
+    totals, df, rows_removed_invalid, rows_removed_duplicates
+):
+    """Fold the statistics of one cleaned frame into running `totals`."""
+    step = df["duration_to_next_step"].dt.total_seconds().dropna()
+    total = df["total_duration"].dt.total_seconds().dropna()
+
+    totals["n_rows"] = totals.get("n_rows", 0) + len(df)
+    totals.setdefault("columns", list(df.columns))
+    by_column = totals.setdefault("missing_values_by_column", {})
+    for col, count in df.isna().sum().to_dict().items():
+        by_column[col] = by_column.get(col, 0) + count
+
+    totals.setdefault("packages", set()).update(df["MAILITM_FID"].unique())
+    event_counts = totals.setdefault("event_type_counts", {})
+    for code, count in df["EVENT_TYPE_CD"].value_counts().items():
+        if count:  # categoricals also count unused labels
+            event_counts[code] = event_counts.get(code, 0) + count
+
+    for key, value, pick in [
+        ("earliest_date", df["date"].min(), min),
+        ("latest_date", df["date"].max(), max),
+    ]:
+        if pd.notna(value):
+            current = totals.get(key)
+            totals[key] = value if current is None else pick(current, value)
+
+    totals["step_seconds"] = totals.get("step_seconds", 0) + step.sum()
+    totals["step_count"] = totals.get("step_count", 0) + len(step)
+    totals["total_seconds"] = totals.get("total_seconds", 0) + total.sum()
+    totals["total_count"] = totals.get("total_count", 0) + len(total)
+    totals["rows_removed_invalid"] = (
+        totals.get("rows_removed_invalid", 0) + rows_removed_invalid
+    )
+    totals["rows_removed_duplicates"] = (
+        totals.get("rows_removed_duplicates", 0) + rows_removed_duplicates
+    )
+    return totals
+
+
+def _package_stats_metadata(metadata, totals, start_time):
+    """Turn running `totals` into the summary fields of `metadata` (9️⃣–🔟)."""
+    rows_removed_invalid = totals.get("rows_removed_invalid", 0)
+    if rows_removed_invalid > 0:
+        metadata["warnings"].append(
+            f"Removed {rows_removed_invalid} rows with invalid MAILITM_FID"
+        )
+    rows_removed_duplicates = totals.get("rows_removed_duplicates", 0)
+    if rows_removed_duplicates > 0:
+        metadata["warnings"].append(f"Removed {rows_removed_duplicates} duplicate rows")
+    bad_lines = metadata.get("bad_lines", 0)
+    if bad_lines > 0:
+        metadata["warnings"].append(f"Skipped {bad_lines} malformed lines")
+
+    # --- 9️⃣ Compute statistics ---
+    earliest_date = totals.get("earliest_date")
+    latest_date = totals.get("latest_date")
+    time_range_days = (
+        (latest_date - earliest_date).days
+        if earliest_date is not None and latest_date is not None
+        else None
+    )
+
+    missing_values_by_column = totals.get("missing_values_by_column", {})
+    columns = totals.get("columns", [])
+    event_counts = pd.Series(totals.get("event_type_counts", {}), dtype="int64")
+    top_event_types = (
+        event_counts.sort_values(ascending=False, kind="mergesort").head(10).to_dict()
+    )
+
+    def average_seconds(seconds_key, count_key):
+        count = totals.get(count_key, 0)
+        return round(float(totals[seconds_key] / count), 6) if count else None
+
+    # --- 🔟 Populate summary ---
+    metadata.update(
+        {
+            "n_rows": totals.get("n_rows", 0),
+            "n_columns": len(columns),
+            "columns": columns,
+            "missing_values_count": int(sum(missing_values_by_column.values())),
+            "missing_values_by_column": missing_values_by_column,
+            "unique_packages_count": len(totals.get("packages", ())),
+            "unique_event_types": int(event_counts.size),
+            "top_event_types": top_event_types,
+            "earliest_date": earliest_date,
+            "latest_date": latest_date,
+            "time_range_days": time_range_days,
+            "cleaning_time_seconds": round(time.time() - start_time, 3),
+            "rows_removed_due_to_invalid_id": rows_removed_invalid,
+            "rows_removed_due_to_duplicates": rows_removed_duplicates,
+            "avg_total_duration_seconds": average_seconds(
+                "total_seconds", "total_count"
+            ),
+            "avg_step_duration_seconds": average_seconds("step_seconds", "step_count"),
+        }
+    )
+    return metadata
+
+
+def clean_package_data(raw_csv_file):
+    start_time = time.time()
+    metadata = _new_metadata()
+
     try:
         # --- 1️⃣ Read CSV safely ---
-        text_stream = io.TextIOWrapper(raw_csv_file, encoding="utf-8")
         try:
             logger.debug("Reading csv file: ")
-            df_raw = pd.read_csv(
-                text_stream,
-                sep=";",
-                dtype=str,
-                engine="python",
-                on_bad_lines="skip",
-                encoding_errors="replace",
-            )
+            df_raw = next(read_csv_frames(raw_csv_file, metadata))
             # ✅ clean BOM / spaces from column names
             df_raw.columns = df_raw.columns.str.strip()
 
@@ -51,131 +339,16 @@ def clean_package_data(raw_csv_file):
         metadata["raw_rows"] = initial_rows
         metadata["raw_columns"] = list(df_raw.columns)
 
-        # --- 2️⃣ Basic validation ---
-        required_columns = {"MAILITM_FID", "date"}
-        missing_required = required_columns - set(df_raw.columns)
-        if missing_required:
-            metadata["errors"].append(
-                f"Missing required columns: {', '.join(missing_required)}"
-            )
-            return df_raw, metadata
-
-        # --- 3️⃣ Convert dates safely ---
-        df_raw["date"] = pd.to_datetime(df_raw["date"], errors="coerce")
-        if df_raw["date"].isna().all():
-            metadata["errors"].append("All 'date' values could not be parsed.")
-            return df_raw, metadata
-
-        # --- 4️⃣ Filter invalid MAILITM_FID entries ---
-        valid_mask = df_raw["MAILITM_FID"].astype(str).str[-2:].str.isalpha()
-        rows_removed_invalid = int((~valid_mask).sum())
-        if rows_removed_invalid > 0:
-            metadata["warnings"].append(
-                f"Removed {rows_removed_invalid} rows with invalid MAILITM_FID"
-            )
-        df = df_raw[valid_mask].copy()
-
-        # --- 5️⃣ Derive and clean ---
-        df["country"] = df["MAILITM_FID"].astype(str).str[-2:]
-        # if "RECPTCL_FID" in df.columns:
-        #     df = df.drop(columns=["RECPTCL_FID"])
-
-        df = df.sort_values(["MAILITM_FID", "date"])
-
-        # --- 6️⃣ Duration calculations ---
-        df["duration_to_next_step"] = (
-            df.groupby("MAILITM_FID")["date"].shift(-1) - df["date"]
-        )
-        first_date = df.groupby("MAILITM_FID")["date"].transform("first")
-        last_date = df.groupby("MAILITM_FID")["date"].transform("last")
-        df["total_duration"] = last_date - first_date
-
-        # --- 7️⃣ Guarantee columns ---
-        for col in [
-            "EVENT_TYPE_CD",
-            "établissement_postal",
-            "next_établissement_postal",
-        ]:
-            if col not in df.columns:
-                df[col] = None
-                metadata["warnings"].append(f"Added missing column '{col}'")
-            else:
-                df[col] = df[col].astype(str).str.strip().replace("nan", None)
-
-        df["MAILITM_FID"] = df["MAILITM_FID"].astype(str).str.strip()
-        df["EVENT_TYPE_CD"] = df["EVENT_TYPE_CD"].astype(str).str.strip()
-
-        # --- 8️⃣ Deduplication ---
-        before_dedup = len(df)
-        df = df.drop_duplicates(
-            subset=["MAILITM_FID", "date", "EVENT_TYPE_CD", "établissement_postal"],
-            keep="first",
-        )
-        rows_removed_duplicates = int(before_dedup - len(df))
-        if rows_removed_duplicates > 0:
-            metadata["warnings"].append(
-                f"Removed {rows_removed_duplicates} duplicate rows"
-            )
-
-        # --- 9️⃣ Compute statistics ---
-        avg_step_duration = df["duration_to_next_step"].mean()
-        avg_total_duration = df["total_duration"].mean()
-
-        earliest_date = df["date"].min()
-        latest_date = df["date"].max()
-        time_range_days = (
-            (latest_date - earliest_date).days
-            if pd.notna(earliest_date) and pd.notna(latest_date)
-            else None
-        )
-
-        missing_values_count = int(df.isna().sum().sum())
-        missing_values_by_column = df.isna().sum().to_dict()
-
-        columns = list(df.columns)
-        n_rows = len(df)
-        n_columns = len(columns)
-
-        unique_packages_count = int(df["MAILITM_FID"].nunique())
-        unique_event_types = int(df["EVENT_TYPE_CD"].nunique())
-        top_event_types = df["EVENT_TYPE_CD"].value_counts().head(10).to_dict()
-
-        cleaning_time_seconds = round(time.time() - start_time, 3)
-
-        # --- 🔟 Populate summary ---
-        metadata.update(
-            {
-                "n_rows": n_rows,
-                "n_columns": n_columns,
-                "columns": columns,
-                "missing_values_count": missing_values_count,
-                "missing_values_by_column": missing_values_by_column,
-                "unique_packages_count": unique_packages_count,
-                "unique_event_types": unique_event_types,
-                "top_event_types": top_event_types,
-                "earliest_date": earliest_date,
-                "latest_date": latest_date,
-                "time_range_days": time_range_days,
-                "cleaning_time_seconds": cleaning_time_seconds,
-            }
+        df, rows_removed_invalid, rows_removed_duplicates = _clean_package_frame(
+            df_raw, metadata
         )
+        if df is None:
+            return df_raw, metadata
 
-        metadata.update(
-            {
-                "rows_removed_due_to_invalid_id": rows_removed_invalid,
-                "rows_removed_due_to_duplicates": rows_removed_duplicates,
-                "avg_total_duration_seconds": (
-                    avg_total_duration.total_seconds()
-                    if pd.notna(avg_total_duration)
-                    else None
-                ),
-                "avg_step_duration_seconds": (
-                    avg_step_duration.total_seconds()
-                    if pd.notna(avg_step_duration)
-                    else None
-                ),
-            }
+        totals = _accumulate_package_stats(
+            {}, df, rows_removed_invalid, rows_removed_duplicates
         )
+        _package_stats_metadata(metadata, totals, start_time)
 
     except Exception as e:
         metadata["errors"].append(f"Unexpected error: {str(e)}")
@@ -184,6 +357,117 @@ def clean_package_data(raw_csv_file):
     return df if "df" in locals() else pd.DataFrame(), metadata
 
 
+def noncontiguous_packages(raw_csv_file, chunksize=100_000):
+    """
+    MAILITM_FIDs whose rows are not all together in the file, read in a first
+    pass over that column only. The file is rewound afterwards.
+    """
+    options = {**CSV_READ_OPTIONS, "usecols": lambda c: c.strip() == "MAILITM_FID"}
+    split, seen, previous = set(), set(), None
+    for frame in read_csv_frames(raw_csv_file, _new_metadata(), chunksize, options):
+        if frame.empty:
+            continue
+        fid = frame.iloc[:, 0].astype(str).str.strip()
+        starts = fid.ne(fid.shift()).to_numpy()
+        starts[0] = fid.iloc[0] != previous
+        blocks = fid[starts]
+        split.update(blocks[blocks.duplicated() | blocks.isin(seen)])
+        seen.update(blocks)
+        previous = fid.iloc[-1]
+    raw_csv_file.seek(0)
+    return split
+
+
+def iter_clean_package_chunks(raw_csv_file, metadata, chunksize=100_000):
+    """
+    Streaming variant of clean_package_data: yield cleaned frames of ~chunksize rows.
+
+    The rows of the last MAILITM_FID of each chunk are carried over to the next
+    one, so every package is cleaned (durations included) with all of its
+    events as long as the file keeps each package's rows together. Packages
+    found again in a later block are counted in
+    metadata["packages_split_across_chunks"]; their durations only cover each
+    block here and are recomputed with the stored events when the block is
+    loaded. Statistics are accumulated in `metadata` as chunks are consumed
+    and are complete once the generator is exhausted. Validation errors stop
+    the stream and are reported in metadata["errors"].
+    """
+    start_time = time.time()
+    metadata.update(_new_metadata())
+    metadata["raw_rows"] = 0
+    totals = {}
+    seen_packages = set()
+    split_packages = 0
+
+    reader = read_csv_frames(raw_csv_file, metadata, chunksize=chunksize)
+
+    def clean(df_raw):
+        nonlocal split_packages
+        df, removed_invalid, removed_duplicates = _clean_package_frame(
+            df_raw, metadata, check_dates=False
+        )
+        if df is None:
+            return None
+        fids = df["MAILITM_FID"].unique()
+        split_packages += int(pd.Series(fids).isin(seen_packages).sum())
+        seen_packages.update(fids)
+        _accumulate_package_stats(totals, df, removed_invalid, removed_duplicates)
+        return df
+
+    carry = None
+    while True:
+        try:
+            chunk = next(reader, None)
+        except Exception as e:
+            logger.error(e)
+            metadata["errors"].append(f"CSV parsing error: {str(e)}")
+            metadata["traceback"] = traceback.format_exc()
+            return
+        if chunk is None:
+            break
+        chunk.columns = chunk.columns.str.strip()
+        if "raw_columns" not in metadata:
+            metadata["raw_columns"] = list(chunk.columns)
+            logger.debug(f"📋 Columns found: {list(chunk.columns)}")
+        metadata["raw_rows"] += len(chunk)
+
+        if carry is not None:
+            chunk = concat_raw_frames([carry, chunk])
+        if "MAILITM_FID" not in chunk.columns:
+            clean(chunk)  # reports the missing column
+            return
+
+        # Hold back the (possibly incomplete) last package until the next chunk
+        fid = chunk["MAILITM_FID"]
+        same_package = (fid == fid.iloc[-1]).to_numpy()
+        if same_package.all():
+            carry = chunk
+            continue
+        tail = int((~same_package[::-1]).argmax())
+        carry = chunk.iloc[len(chunk) - tail :] if tail else None
+
+        df = clean(chunk.iloc[: len(chunk) - tail].copy())
+        if df is None:
+            return
+        logger.debug(f"🧩 Cleaned chunk: {len(df)} rows")
+        yield df
+
+    if carry is not None:
+        df = clean(carry.copy())
+        if df is None:
+            return
+        yield df
+
+    if totals.get("earliest_date") is None:
+        metadata["errors"].append("All 'date' values could not be parsed.")
+    if split_packages:
+        metadata["warnings"].append(
+            f"{split_packages} packages were split across non-contiguous blocks"
+        )
+    metadata["packages_split_across_chunks"] = split_packages
+    _package_stats_metadata(metadata, totals, start_time)
+
+
 def save_upload_metadata(uploaded_file, metadata, extra_stats=None):
     """
     Creates and saves an UploadMetaData entry from the given file and metadata.
@@ -239,6 +523,7 @@ def save_upload_metadata(uploaded_file, metadata, extra_stats=None):
     # --- Field name mapping for your model ---
     data["rows_removed_duplicates"] = metadata.get("rows_removed_due_to_duplicates", 0)
     data["rows_removed_invalid"] = metadata.get("rows_removed_due_to_invalid_id", 0)
+    data["bad_lines_count"] = metadata.get("bad_lines", 0)
 
     # --- Merge any extra processing stats ---
     if extra_stats:
@@ -252,6 +537,7 @@ def save_upload_metadata(uploaded_file, metadata, extra_stats=None):
         "events_inserted": 0,
         "packages_created": 0,
         "packages_updated": 0,
+        "packages_unchanged": 0,
         "alerts_created": 0,
     }
     for k, v in defaults.items():
@@ -0,0 +1,65 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+# ----------------------------
+# Cursors
+# ----------------------------
+def encode_cursor(values):
+    """
+    Opaque cursor of a list of JSON values. Dates should be passed as
+    isoformat() strings, which keep their microseconds.
+    """
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Values of an encode_cursor() cursor, ValueError when it is malformed."""
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Validated ?limit= value, ValueError outside 1..maximum."""
+    if value in (None, ""):
+        return default
+    size = int(value)
+    if not 1 <= size <= maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return size
+
+
+# ----------------------------
+# Pages
+# ----------------------------
+def _after(fields, values):
+    """Rows ordered after `values` on `fields`: a > x OR (a = x AND b > y) ..."""
+    condition = Q(**{f"{fields[-1]}__gt": values[-1]})
+    for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+        condition = Q(**{f"{field}__gt": value}) | (Q(**{field: value}) & condition)
+    return condition
+
+
+def keyset_page(qs, fields, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of qs ordered by `fields` (ascending, the last one unique),
+    starting after the row whose `fields` values are `after`.
+
+    Unlike OFFSET, every page is an index range scan, so late pages cost the
+    same as the first one. Returns (rows, has_more).
+    """
+    if after is not None:
+        qs = qs.filter(_after(fields, after))
+    rows = list(qs.order_by(*fields)[: limit + 1])
+    return rows[:limit], len(rows) > limit
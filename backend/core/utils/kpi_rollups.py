@@ -0,0 +1,239 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Avg,
+    Count,
+    DecimalField,
+    DurationField,
+    FloatField,
+    IntegerField,
+    Max,
+    Q,
+)
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from core.models import AirportStats, CPXStats, CTNIStats, Dashboard, KPIRollup
+
+logger = logging.getLogger(__name__)
+
+# Snapshot models with time series endpoints
+ROLLUP_SOURCES = {
+    "dashboard": Dashboard,
+    "ctni": CTNIStats,
+    "cpx": CPXStats,
+    "airport": AirportStats,
+}
+INTERVALS = ("daily", "weekly", "monthly")
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def rollup_fields(model):
+    """Numeric / duration fields of a snapshot model, the ones kept in KPIRollup."""
+    return [
+        f.name
+        for f in model._meta.concrete_fields
+        if isinstance(f, (IntegerField, FloatField, DecimalField, DurationField))
+        and not f.primary_key
+    ]
+
+
+def _as_number(value):
+    if isinstance(value, timedelta):
+        return value / timedelta(microseconds=1)
+    return float(value)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _daily_totals(model, fields, timestamp_filter):
+    """{(day, field): [total, value count, snapshot count]} of the snapshots."""
+    totals = defaultdict(lambda: [0.0, 0, 0])
+    for row in model.objects.filter(timestamp_filter).values("timestamp", *fields):
+        day = timezone.localtime(row["timestamp"]).date()
+        for field in fields:
+            entry = totals[(day, field)]
+            entry[2] += 1
+            if row[field] is not None:
+                entry[0] += _as_number(row[field])
+                entry[1] += 1
+    return totals
+
+
+# ----------------------------
+# Maintenance (on snapshot write)
+# ----------------------------
+def refresh_rollups(source, timestamps):
+    """
+    Recompute the daily rollups of `source` for every day between the first
+    and the last of `timestamps`.
+    """
+    model = ROLLUP_SOURCES[source]
+    days = [timezone.localtime(ts).date() for ts in timestamps if ts is not None]
+    if not days:
+        return
+    first_day, last_day = min(days), max(days)
+
+    totals = _daily_totals(
+        model,
+        rollup_fields(model),
+        Q(
+            timestamp__gte=_day_bounds(first_day)[0],
+            timestamp__lt=_day_bounds(last_day)[1],
+        ),
+    )
+
+    with transaction.atomic():
+        KPIRollup.objects.filter(
+            source=source, day__range=(first_day, last_day)
+        ).delete()
+        KPIRollup.objects.bulk_create(
+            [
+                KPIRollup(
+                    source=source,
+                    kpi_name=field,
+                    day=day,
+                    total=total,
+                    value_count=value_count,
+                    snapshot_count=snapshot_count,
+                )
+                for (day, field), (total, value_count, snapshot_count) in totals.items()
+            ],
+            batch_size=1000,
+        )
+    logger.debug(f"📚 {source} rollups refreshed from {first_day} to {last_day}")
+
+
+def rebuild_rollups(source=None):
+    """Recompute every rollup (of one source or of all of them)."""
+    for name in [source] if source else ROLLUP_SOURCES:
+        KPIRollup.objects.filter(source=name).delete()
+        refresh_rollups(
+            name, ROLLUP_SOURCES[name].objects.values_list("timestamp", flat=True)
+        )
+
+
+def _rollup_version(source):
+    """Changes whenever the rollups of `source` are written; part of cache keys."""
+    state = KPIRollup.objects.filter(source=source).aggregate(
+        last=Max("id"), n=Count("id")
+    )
+    return f"{state['last']}-{state['n']}"
+
+
+# ----------------------------
+# Time series
+# ----------------------------
+def _period_start(day, interval):
+    if interval == "weekly":
+        return day - timedelta(days=day.weekday())
+    if interval == "monthly":
+        return day.replace(day=1)
+    return day
+
+
+def _series_from_rollups(source, kpi_name, start_date, end_date, interval):
+    model = ROLLUP_SOURCES[source]
+    first_day = timezone.localtime(start_date).date()
+    last_day = timezone.localtime(end_date).date()
+
+    # Days only partly inside the range are read from the snapshots themselves
+    partial_days = set()
+    if _day_bounds(first_day)[0] < start_date:
+        partial_days.add(first_day)
+    if _day_bounds(last_day)[1] - timedelta(microseconds=1) > end_date:
+        partial_days.add(last_day)
+
+    daily = {
+        day: (total, value_count, snapshot_count)
+        for day, total, value_count, snapshot_count in KPIRollup.objects.filter(
+            source=source, kpi_name=kpi_name, day__range=(first_day, last_day)
+        )
+        .exclude(day__in=partial_days)
+        .values_list("day", "total", "value_count", "snapshot_count")
+    }
+    if partial_days:
+        day_filter = Q()
+        for day in partial_days:
+            day_start, day_end = _day_bounds(day)
+            day_filter |= Q(
+                timestamp__gte=max(day_start, start_date),
+                timestamp__lt=day_end,
+                timestamp__lte=end_date,
+            )
+        for (day, _), entry in _daily_totals(model, [kpi_name], day_filter).items():
+            daily[day] = tuple(entry)
+
+    periods = defaultdict(lambda: [0.0, 0, 0])
+    for day, (total, value_count, snapshot_count) in daily.items():
+        period = periods[_period_start(day, interval)]
+        period[0] += total
+        period[1] += value_count
+        period[2] += snapshot_count
+
+    is_duration = isinstance(model._meta.get_field(kpi_name), DurationField)
+    series = []
+    for day in sorted(periods):
+        total, value_count, snapshot_count = periods[day]
+        if not snapshot_count:
+            continue
+        value = total / value_count if value_count else None
+        if is_duration and value is not None:
+            value = timedelta(microseconds=value)
+        series.append((timezone.make_aware(datetime.combine(day, time.min)), value))
+    return series
+
+
+def _live_series(source, kpi_name, start_date, end_date, interval):
+    """Trunc + Avg over the snapshots, for KPIs without rollups."""
+    trunc_func = {
+        "daily": TruncDay("timestamp"),
+        "weekly": TruncWeek("timestamp"),
+        "monthly": TruncMonth("timestamp"),
+    }[interval]
+    queryset = (
+        ROLLUP_SOURCES[source]
+        .objects.filter(timestamp__range=(start_date, end_date))
+        .annotate(period=trunc_func)
+        .values("period")
+        .annotate(avg_value=Avg(kpi_name))
+        .order_by("period")
+    )
+    return [(item["period"], item["avg_value"]) for item in queryset]
+
+
+def kpi_series(source, kpi_names, start_date, end_date, interval="daily"):
+    """
+    Average of each KPI of a snapshot model per day / week / month between
+    start_date and end_date (inclusive), as {kpi: [(period start, value)]}.
+
+    Answers come from the daily KPIRollup rows and are cached until the
+    rollups of the source change.
+    """
+    if timezone.is_naive(start_date):
+        start_date = timezone.make_aware(start_date)
+    if timezone.is_naive(end_date):
+        end_date = timezone.make_aware(end_date)
+
+    version = _rollup_version(source)
+    numeric = set(rollup_fields(ROLLUP_SOURCES[source]))
+    result = {}
+    for kpi_name in kpi_names:
+        key = (
+            f"kpi_series:{source}:{version}:{kpi_name}:{interval}:"
+            f"{start_date.isoformat()}:{end_date.isoformat()}"
+        )
+        series = cache.get(key)
+        if series is None:
+            compute = _series_from_rollups if kpi_name in numeric else _live_series
+            series = compute(source, kpi_name, start_date, end_date, interval)
+            cache.set(key, series, CACHE_TIMEOUT)
+        result[kpi_name] = series
+    return result
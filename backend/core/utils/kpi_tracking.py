@@ -0,0 +1,356 @@
+import logging
+from decimal import Decimal
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max
+
+from core.models import (
+    KPIDirtyEntity,
+    Package,
+    PackageEvent,
+    PackageKPIContribution,
+    RunningKPI,
+)
+
+logger = logging.getLogger(__name__)
+
+SLA_DAYS = 3
+MAX_ALLOWED_DAYS = 60
+ID_BATCH_SIZE = 500
+
+CONTRIBUTION_FIELDS = [
+    "total_packages",
+    "success_count",
+    "failure_count",
+    "in_process_count",
+    "on_time_count",
+    "delivery_duration_count",
+    "delivery_duration_us",
+    "recovered_count",
+    "recovered_failures",
+    "failed_cities",
+    "failed_with_movement_count",
+    "in_customs_count",
+    "exited_customs_count",
+    "customs_alert_count",
+    "hold_duration_count",
+    "hold_duration_us",
+]
+
+PACKAGE_FIELDS = [
+    "id",
+    "status",
+    "total_duration",
+    "recovered_after_failure",
+    "failure_before_success_count",
+    "cities_after_failure_count",
+    "flag_seized",
+    "seized_at",
+    "exited_at",
+    "alert_after_seizure",
+    "hold_duration",
+]
+
+
+def _batches(values, size=ID_BATCH_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+# ----------------------------
+# Dirty entities (written by uploads)
+# ----------------------------
+def mark_dirty(kind, entity_ids):
+    """
+    Record entities changed by an upload for the next incremental refresh.
+
+    Entities already pending are deleted and inserted again, so their ledger
+    id moves past the last id a running refresh read and they are not cleared
+    with the changes it has already processed.
+    """
+    entity_ids = set(entity_ids)
+    with transaction.atomic():
+        for batch in _batches(entity_ids):
+            KPIDirtyEntity.objects.filter(kind=kind, entity_id__in=batch).delete()
+        KPIDirtyEntity.objects.bulk_create(
+            [KPIDirtyEntity(kind=kind, entity_id=pk) for pk in entity_ids],
+            batch_size=1000,
+            # Marked again by a concurrent upload
+            ignore_conflicts=True,
+        )
+    logger.debug(f"Marked {len(entity_ids)} {kind} entities dirty")
+
+
+def pending_dirty_entities():
+    """
+    Return ({kind: set of ids}, last ledger id). Pass the id to
+    clear_dirty_entities() once they have been processed.
+    """
+    dirty = {kind: set() for kind in KPIDirtyEntity.Kind.values}
+    last_id = 0
+    for pk, kind, entity_id in KPIDirtyEntity.objects.values_list(
+        "id", "kind", "entity_id"
+    ):
+        dirty[kind].add(entity_id)
+        last_id = max(last_id, pk)
+    return dirty, last_id
+
+
+def clear_dirty_entities(last_id):
+    """
+    Forget the entities read by pending_dirty_entities(). Entities marked
+    again since then have a higher id and stay pending.
+    """
+    KPIDirtyEntity.objects.filter(id__lte=last_id).delete()
+
+
+def affected_owners(package_ids):
+    """Office and state ids with events of the given packages."""
+    office_ids, state_ids = set(), set()
+    for batch in _batches(package_ids):
+        pairs = (
+            PackageEvent.objects.filter(package_id__in=batch)
+            .values_list("office_id", "state_id")
+            .distinct()
+        )
+        for office_id, state_id in pairs:
+            office_ids.add(office_id)
+            state_ids.add(state_id)
+    office_ids.discard(None)
+    state_ids.discard(None)
+    return office_ids, state_ids
+
+
+# ----------------------------
+# Package contributions / running totals
+# ----------------------------
+def package_contributions(packages):
+    """
+    Per-package contribution to each RunningKPI, from rows of PACKAGE_FIELDS.
+    Mirrors the filters of package_kpis.calculate_package_kpis.
+    """
+    return contributions_frame(
+        pd.DataFrame.from_records(list(packages), columns=PACKAGE_FIELDS)
+    )
+
+
+def contributions_frame(df):
+    """package_contributions() of a DataFrame with the PACKAGE_FIELDS columns."""
+    status = df["status"]
+    total_duration = pd.to_timedelta(df["total_duration"])
+    hold_duration = pd.to_timedelta(df["hold_duration"])
+    one_us = pd.Timedelta(microseconds=1)
+
+    success = status == "success"
+    failure = status == "failure"
+    delivered = success & total_duration.notna()
+    in_range = (
+        delivered
+        & (total_duration >= pd.Timedelta(0))
+        & (total_duration <= pd.Timedelta(days=MAX_ALLOWED_DAYS))
+    )
+    recovered = df["recovered_after_failure"].astype(bool)
+    cities = df["cities_after_failure_count"].fillna(0)
+    seized = df["flag_seized"].astype(bool)
+    exited = ~seized & df["seized_at"].notna() & df["exited_at"].notna()
+    valid_hold = exited & (hold_duration > pd.Timedelta(0))
+
+    contributions = pd.DataFrame(
+        {
+            "total_packages": 1,
+            "success_count": success,
+            "failure_count": failure,
+            "in_process_count": status == "in_process",
+            "on_time_count": delivered
+            & (total_duration <= pd.Timedelta(days=SLA_DAYS)),
+            "delivery_duration_count": in_range,
+            "delivery_duration_us": (total_duration // one_us).where(in_range, 0),
+            "recovered_count": recovered,
+            "recovered_failures": df["failure_before_success_count"]
+            .fillna(0)
+            .where(recovered, 0),
+            "failed_cities": cities.where(failure, 0),
+            "failed_with_movement_count": failure & (cities > 0),
+            "in_customs_count": seized,
+            "exited_customs_count": exited,
+            "customs_alert_count": df["alert_after_seizure"].astype(bool),
+            "hold_duration_count": valid_hold,
+            "hold_duration_us": (hold_duration // one_us).where(valid_hold, 0),
+        }
+    )
+    return contributions.set_index(df["id"]).astype("int64")
+
+
+def _apply_deltas(deltas):
+    with transaction.atomic():
+        running = {r.name: r for r in RunningKPI.objects.select_for_update().all()}
+        to_create, to_update = [], []
+        for name, delta in deltas.items():
+            row = running.get(name)
+            if row is None:
+                to_create.append(RunningKPI(name=name, value=Decimal(int(delta))))
+            elif delta:
+                row.value += Decimal(int(delta))
+                to_update.append(row)
+        RunningKPI.objects.bulk_create(to_create)
+        RunningKPI.objects.bulk_update(to_update, ["value"])
+
+
+def apply_package_changes(package_ids):
+    """
+    Replace the contribution of each package with its current one and move
+    the RunningKPI totals by the difference. Returns the number of packages.
+    """
+    deltas = pd.Series(0, index=CONTRIBUTION_FIELDS, dtype="int64")
+    count = 0
+    for batch in _batches(package_ids):
+        new = package_contributions(
+            Package.objects.filter(id__in=batch).values_list(*PACKAGE_FIELDS)
+        )
+        old = pd.DataFrame.from_records(
+            list(
+                PackageKPIContribution.objects.filter(package_id__in=batch).values_list(
+                    *CONTRIBUTION_FIELDS
+                )
+            ),
+            columns=CONTRIBUTION_FIELDS,
+        )
+        deltas += new.sum().reindex(CONTRIBUTION_FIELDS, fill_value=0)
+        deltas -= old.sum().reindex(CONTRIBUTION_FIELDS, fill_value=0).astype("int64")
+
+        PackageKPIContribution.objects.bulk_create(
+            [
+                PackageKPIContribution(package_id=pk, **values)
+                for pk, values in new.to_dict("index").items()
+            ],
+            update_conflicts=True,
+            unique_fields=["package"],
+            update_fields=CONTRIBUTION_FIELDS,
+        )
+        count += len(new)
+
+    _apply_deltas(deltas.to_dict())
+    logger.info(f"📈 Running KPIs updated from {count} packages")
+    return count
+
+
+def running_kpis_initialized():
+    return RunningKPI.objects.exists()
+
+
+def rebuild_running_kpis():
+    """Recompute every contribution and running total from the Package table."""
+    with transaction.atomic():
+        RunningKPI.objects.all().delete()
+        PackageKPIContribution.objects.all().delete()
+        apply_package_changes(Package.objects.values_list("id", flat=True))
+
+
+def running_totals():
+    totals = dict.fromkeys(CONTRIBUTION_FIELDS, 0)
+    totals.update(
+        {
+            name: int(value)
+            for name, value in RunningKPI.objects.values_list("name", "value")
+        }
+    )
+    return totals
+
+
+def _average_duration(total_us, count):
+    return str(pd.Timedelta(nanoseconds=total_us * 1000 // count)) if count else None
+
+
+def kpis_from_totals(totals, max_cities_after_failure=None):
+    """
+    The calculate_package_kpis() dict, built from running totals.
+    Medians need every value and are not maintained. The max of cities after
+    failure is read from the contributions unless given.
+    """
+    total = totals["total_packages"]
+    n_success = totals["success_count"]
+    n_failure = totals["failure_count"]
+    n_done = n_success + n_failure
+    on_time_count = totals["on_time_count"]
+    recovered_count = totals["recovered_count"]
+
+    if n_failure:
+        total_cities_after_failure = totals["failed_cities"]
+        if max_cities_after_failure is None:
+            max_cities_after_failure = (
+                PackageKPIContribution.objects.filter(failure_count=1).aggregate(
+                    max=Max("failed_cities")
+                )["max"]
+                or 0
+            )
+        avg_cities_after_failure = round(total_cities_after_failure / n_failure, 2)
+        packages_with_post_failure_movement = totals["failed_with_movement_count"]
+        pct_with_post_failure_movement = round(
+            packages_with_post_failure_movement / n_failure, 4
+        )
+    else:
+        total_cities_after_failure = 0
+        max_cities_after_failure = 0
+        avg_cities_after_failure = 0
+        packages_with_post_failure_movement = 0
+        pct_with_post_failure_movement = 0
+
+    return {
+        "total_packages": total,
+        "success_count": n_success,
+        "failure_count": n_failure,
+        "in_process_count": totals["in_process_count"],
+        "done_count": n_done,
+        "success_rate_all": round(n_success / total, 4) if total else 0,
+        "failure_rate_all": round(n_failure / total, 4) if total else 0,
+        "success_rate_done": round(n_success / n_done, 4) if n_done else 0,
+        "failure_rate_done": round(n_failure / n_done, 4) if n_done else 0,
+        "on_time_delivery_rate_all": round(on_time_count / total, 4) if total else 0,
+        "on_time_delivery_rate_delivered_only": round(on_time_count / n_success, 4)
+        if n_success
+        else 0,
+        "average_delivery_duration": _average_duration(
+            totals["delivery_duration_us"], totals["delivery_duration_count"]
+        ),
+        "recovered_after_failure_count": recovered_count,
+        "recovery_rate_success": round(recovered_count / n_success, 4)
+        if n_success
+        else 0,
+        "avg_failures_before_success": round(
+            totals["recovered_failures"] / recovered_count, 2
+        )
+        if recovered_count
+        else 0,
+        "in_customs_count": totals["in_customs_count"],
+        "exited_customs_count": totals["exited_customs_count"],
+        "customs_alert_count": totals["customs_alert_count"],
+        "avg_customs_hold_duration": _average_duration(
+            totals["hold_duration_us"], totals["hold_duration_count"]
+        ),
+        "total_cities_after_failure": total_cities_after_failure,
+        "avg_cities_after_failure": avg_cities_after_failure,
+        "max_cities_after_failure": max_cities_after_failure,
+        "packages_with_post_failure_movement": packages_with_post_failure_movement,
+        "pct_with_post_failure_movement": pct_with_post_failure_movement,
+    }
+
+
+def compare_kpis(incremental, full):
+    """
+    Keys where the incremental and full KPI dicts disagree. Durations are
+    compared to the microsecond (the full path averages in float).
+    """
+    mismatches = {}
+    for key, value in incremental.items():
+        expected = full.get(key)
+        if key.endswith("_duration") and value is not None and expected is not None:
+            if abs(pd.Timedelta(value) - pd.Timedelta(expected)) <= pd.Timedelta(
+                microseconds=1
+            ):
+                continue
+        elif value == expected:
+            continue
+        mismatches[key] = {"incremental": value, "full": expected}
+    return mismatches
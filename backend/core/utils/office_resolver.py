@@ -0,0 +1,135 @@
+import logging
+import re
+import unicodedata
+from difflib import get_close_matches
+
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from core.models import PostalOffice
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_CACHE_KEY = "office_directory"
+DIRECTORY_CACHE_TIMEOUT = 60 * 60
+# Minimum difflib ratio for a near-miss name to resolve to an office
+FUZZY_CUTOFF = 0.9
+# Close names compared before giving up on a near miss
+FUZZY_CANDIDATES = 5
+
+
+def normalize_office_name(name):
+    """Lookup key of an office name: no accents, single spaces, lower case."""
+    if name is None or pd.isna(name):
+        return None
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", name).strip().casefold() or None
+
+
+def _numbers(key):
+    """Numbers in an office name ("agence ems oran2" → (2,))."""
+    return tuple(int(number) for number in re.findall(r"\d+", key))
+
+
+# ----------------------------
+# Directory (cached)
+# ----------------------------
+def _fingerprint():
+    state = PostalOffice.objects.aggregate(last=Max("id"), n=Count("id"))
+    return f"{state['last']}-{state['n']}"
+
+
+def office_directory():
+    """
+    {normalized office name: (office_id, state_id)}, cached across requests.
+
+    The cache is dropped whenever an office is saved or deleted (see
+    core.signals.office_directory) and rebuilt when offices were added or
+    removed without signals.
+    """
+    fingerprint = _fingerprint()
+    cached = cache.get(DIRECTORY_CACHE_KEY)
+    if cached and cached["fingerprint"] == fingerprint:
+        return cached["directory"]
+
+    directory = {}
+    for office_id, name, state_id in PostalOffice.objects.order_by("id").values_list(
+        "id", "name", "state_id"
+    ):
+        key = normalize_office_name(name)
+        if key:
+            directory[key] = (office_id, state_id)
+
+    cache.set(
+        DIRECTORY_CACHE_KEY,
+        {"fingerprint": fingerprint, "directory": directory},
+        DIRECTORY_CACHE_TIMEOUT,
+    )
+    logger.debug(f"🏤 Office directory rebuilt ({len(directory)} names)")
+    return directory
+
+
+def invalidate_office_directory():
+    cache.delete(DIRECTORY_CACHE_KEY)
+
+
+# ----------------------------
+# Resolution
+# ----------------------------
+def resolve_office_names(names, directory=None):
+    """
+    {name: (office_id, state_id) or None} for each distinct name.
+
+    Names are matched on their normalized form, then to the closest office
+    name when one is similar enough (FUZZY_CUTOFF) and has the same numbers:
+    "agence ems oran3" is a new office, not "agence ems oran1".
+    """
+    if directory is None:
+        directory = office_directory()
+
+    resolved = {}
+    for name in names:
+        key = normalize_office_name(name)
+        ids = directory.get(key) if key else None
+        if ids is None and key:
+            numbers = _numbers(key)
+            close = [
+                match
+                for match in get_close_matches(
+                    key, directory, n=FUZZY_CANDIDATES, cutoff=FUZZY_CUTOFF
+                )
+                if _numbers(match) == numbers
+            ]
+            if close:
+                ids = directory[close[0]]
+                logger.debug(f"🏤 {name!r} resolved to office {close[0]!r}")
+        resolved[name] = ids
+    return resolved
+
+
+def resolve_offices(names, directory=None):
+    """
+    Office and state ids of a column of office names, resolved once per
+    distinct name.
+
+    Returns (office ids, state ids, unresolved names): two Int64 Series
+    aligned on `names` (<NA> when missing or unknown) and the sorted names
+    that matched no office.
+    """
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        names = names.cat.remove_unused_categories()
+        codes, uniques = names.cat.codes.to_numpy(), list(names.cat.categories)
+    else:
+        codes, uniques = pd.factorize(names.astype(object))
+    resolved = resolve_office_names(uniques, directory)
+    ids = [resolved[name] or (None, None) for name in uniques]
+
+    def take(position):
+        # Missing names have code -1, the trailing None
+        values = pd.array([i[position] for i in ids] + [None], dtype="Int64")
+        return pd.Series(values[codes], index=names.index)
+
+    unresolved = sorted(str(name) for name in uniques if resolved[name] is None)
+    return take(0), take(1), unresolved
@@ -0,0 +1,502 @@
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import (
+    Alert,
+    Bag,
+    KPIDirtyEntity,
+    PackageEvent,
+    UploadJob,
+    UploadMetaData,
+)
+from core.utils.alert_defs import ALERT_DEFINITIONS
+from core.utils.alert_engine import evaluate_alerts
+from core.utils.bulk_loader import bulk_insert
+from core.utils.cleaning import (
+    clean_package_data,
+    iter_clean_package_chunks,
+    noncontiguous_packages,
+    save_upload_metadata,
+)
+from core.utils.kpi_tracking import mark_dirty
+from core.utils.office_resolver import office_directory, resolve_offices
+from core.utils.package_state import derive_package_states, package_state_records
+from core.utils.package_upsert import upsert_packages
+from core.utils.transitions_helper import rebuild_transitions
+from core.utils.upload_jobs import report_rows, track_phase
+from core.utils.upload_ledger import (
+    clear_chunks,
+    committed_chunk_counts,
+    file_sha256,
+    find_duplicate_upload,
+    frame_sha256,
+    record_chunk,
+)
+
+logger = logging.getLogger(__name__)
+
+# PackageEvent field → column of the cleaned frame
+EVENT_COLUMNS = {
+    "package_id": "package_id",
+    "mailitm_fid": "MAILITM_FID",
+    "date": "date",
+    "event_type_cd": "EVENT_TYPE_CD",
+    "etablissement_postal": "établissement_postal",
+    "next_etablissement_postal": "next_établissement_postal",
+    "duration_to_next_step": "duration_to_next_step",
+    "office_id": "office_id",
+    "next_office_id": "next_office_id",
+    "state_id": "state_id",
+    "next_state_id": "next_state_id",
+}
+
+# PackageEvent unique_together → column of the cleaned frame
+EVENT_KEY = {
+    "mailitm_fid": "MAILITM_FID",
+    "date": "date",
+    "event_type_cd": "EVENT_TYPE_CD",
+    "etablissement_postal": "établissement_postal",
+}
+
+# PackageEvent field → column of the cleaned frame, for events read back
+STORED_EVENT_COLUMNS = {
+    "id": "event_id",
+    "mailitm_fid": "MAILITM_FID",
+    "date": "date",
+    "event_type_cd": "EVENT_TYPE_CD",
+    "etablissement_postal": "établissement_postal",
+    "next_etablissement_postal": "next_établissement_postal",
+    "duration_to_next_step": "duration_to_next_step",
+    "package__bag__receptacle_fid": "RECPTCL_FID",
+}
+STORED_EVENTS_BATCH_SIZE = 500
+
+# Counts returned by _load_package_frame, summed over the chunks of an upload
+# (its "unresolved_offices" names are merged instead)
+UPLOAD_COUNTS = [
+    "events_saved",
+    "events_inserted",
+    "events_skipped",
+    "packages_saved",
+    "packages_created",
+    "packages_updated",
+    "packages_unchanged",
+    "alerts_created",
+]
+
+
+def _save_metadata(file_obj, metadata, counts, content_hash):
+    return save_upload_metadata(
+        file_obj, metadata, extra_stats={**counts, "content_hash": content_hash}
+    )
+
+
+def _duplicate_result(duplicate):
+    logger.info(
+        f"⏭️ Same content as upload #{duplicate.id} ({duplicate.filename}), skipped"
+    )
+    return {
+        "status": "duplicate",
+        "duplicate_of": duplicate.id,
+        **dict.fromkeys(UPLOAD_COUNTS, 0),
+    }
+
+
+def _event_key_hashes(keys):
+    """One 64-bit hash per row of event keys (missing values hash alike)."""
+    keys = keys.astype(object).where(keys.notna(), None)
+    keys["date"] = pd.to_datetime(keys["date"], utc=True)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def _unknown_events(events, mailitm_fids):
+    """
+    Rows of `events` whose key (PackageEvent unique_together) isn't stored yet.
+
+    The keys already stored for these packages are fetched in one query and
+    compared as hashes, so overlapping uploads only send new events to the
+    database.
+    """
+    stored = pd.DataFrame.from_records(
+        PackageEvent.objects.filter(mailitm_fid__in=mailitm_fids).values_list(
+            *EVENT_KEY
+        ),
+        columns=list(EVENT_KEY),
+    )
+    if stored.empty:
+        return events
+
+    keys = events[list(EVENT_KEY.values())].set_axis(list(EVENT_KEY), axis=1)
+    known = np.isin(_event_key_hashes(keys), _event_key_hashes(stored))
+    return events[~known]
+
+
+def _stored_events(mailitm_fids):
+    """Stored events of these packages, with the columns of the cleaned frame."""
+    mailitm_fids = list(mailitm_fids)
+    rows = []
+    for i in range(0, len(mailitm_fids), STORED_EVENTS_BATCH_SIZE):
+        rows.extend(
+            PackageEvent.objects.filter(
+                mailitm_fid__in=mailitm_fids[i : i + STORED_EVENTS_BATCH_SIZE]
+            ).values_list(*STORED_EVENT_COLUMNS)
+        )
+    stored = pd.DataFrame.from_records(
+        rows, columns=list(STORED_EVENT_COLUMNS.values())
+    )
+    return stored.assign(
+        date=pd.to_datetime(stored["date"], utc=True),
+        duration_to_next_step=pd.to_timedelta(stored["duration_to_next_step"]),
+    )
+
+
+def _with_stored_events(df_clean, mailitm_fids):
+    """
+    Events of packages already loaded by an earlier chunk of the upload: their
+    stored events plus the new rows of `df_clean`, with the durations
+    recomputed over both.
+
+    The step durations of those `df_clean` rows are updated in place. Returns
+    (events of df_clean's packages, stored PackageEvents whose step changed).
+    """
+    stored = _stored_events(mailitm_fids)
+    split = df_clean["MAILITM_FID"].isin(mailitm_fids)
+    rows = df_clean[split]
+    known = np.isin(
+        _event_key_hashes(
+            rows[list(EVENT_KEY.values())].set_axis(list(EVENT_KEY), axis=1)
+        ),
+        _event_key_hashes(
+            stored[list(EVENT_KEY.values())].set_axis(list(EVENT_KEY), axis=1)
+        ),
+    )
+
+    events = pd.concat(
+        [
+            stored.assign(stored_step=stored["duration_to_next_step"]),
+            rows[~known].assign(row=rows.index[~known]),
+        ],
+        ignore_index=True,
+    ).sort_values(["MAILITM_FID", "date"], kind="mergesort")
+    dates = events.groupby("MAILITM_FID")["date"]
+    events["duration_to_next_step"] = dates.shift(-1) - events["date"]
+    events["total_duration"] = dates.transform("last") - dates.transform("first")
+    events["country"] = events["MAILITM_FID"].str[-2:]
+
+    new = events[events["row"].notna()]
+    df_clean.loc[new["row"].astype(int), "duration_to_next_step"] = new[
+        "duration_to_next_step"
+    ].to_numpy()
+
+    refreshed = events[events["event_id"].notna()]
+    refreshed = refreshed[
+        refreshed["duration_to_next_step"].ne(refreshed["stored_step"])
+        & refreshed[["duration_to_next_step", "stored_step"]].notna().any(axis=1)
+    ]
+    changed = [
+        PackageEvent(id=int(event_id), duration_to_next_step=step)
+        for event_id, step in zip(
+            refreshed["event_id"],
+            refreshed["duration_to_next_step"]
+            .astype(object)
+            .where(refreshed["duration_to_next_step"].notna(), None),
+        )
+    ]
+
+    events = events.drop(columns=["event_id", "stored_step", "row"])
+    return pd.concat([df_clean[~split], events], ignore_index=True), changed
+
+
+def _create_alerts(events, directory):
+    """
+    Evaluate the alert rules on cleaned events and create the alerts not stored
+    yet (same code, event timestamp, office and state). Returns their number.
+    """
+    alerts_df = evaluate_alerts(
+        events,
+        evaluated_at=timezone.now(),
+        office_ids=directory,
+    )
+    # Existing alerts at the same timestamps, including those created by
+    # earlier chunks of this upload
+    timestamps = alerts_df["timestamp"].drop_duplicates().tolist()
+    existing_alerts_set = set(
+        Alert.objects.filter(timestamp__in=timestamps).values_list(
+            "alarm_code", "timestamp", "office_id", "state_id"
+        )
+    )
+    alerts_to_create = []
+    for alert in alerts_df.itertuples(index=False):
+        event_timestamp = alert.timestamp.to_pydatetime()
+        key = (alert.alarm_code, event_timestamp, alert.office_id, alert.state_id)
+        if key in existing_alerts_set:
+            continue
+        definition = ALERT_DEFINITIONS[alert.alarm_code]
+        alerts_to_create.append(
+            Alert(
+                alarm_code=alert.alarm_code,
+                title=definition["title"],
+                trigger_condition=definition["trigger_condition"],
+                severity=definition["severity"],
+                action_required=definition["action_required"],
+                office_id=alert.office_id,
+                state_id=alert.state_id,
+                timestamp=event_timestamp,
+            )
+        )
+        existing_alerts_set.add(key)
+
+    if alerts_to_create:
+        Alert.objects.bulk_create(alerts_to_create, batch_size=1000)
+        logger.info(f"Created {len(alerts_to_create)} alerts in bulk.")
+    return len(alerts_to_create)
+
+
+def _load_package_frame(
+    df_clean, directory, job=None, rows_done=0, loaded_fids=None, deferred_fids=None
+):
+    """
+    Load cleaned package events: packages, events, alerts and transitions.
+
+    Every package of `df_clean` must come with all of its events (a whole file,
+    or one chunk from iter_clean_package_chunks), except those in
+    `loaded_fids`: packages loaded by earlier chunks of the same upload, whose
+    state and durations are derived from their stored events plus this chunk.
+    No alerts are evaluated for the packages of `deferred_fids`. Office names
+    are resolved against `directory` (office_directory()). `rows_done` offsets
+    the row progress reported to `job`. Returns the counts of this frame.
+    """
+    df_clean["date"] = pd.to_datetime(df_clean["date"], errors="coerce", utc=True)
+    unique_ids = df_clean["MAILITM_FID"].unique()
+
+    packages, refreshed_events = df_clean, []
+    split_fids = [fid for fid in unique_ids if fid in (loaded_fids or ())]
+    if split_fids:
+        logger.info(f"🧩 {len(split_fids)} packages continue an earlier chunk")
+        packages, refreshed_events = _with_stored_events(df_clean, split_fids)
+
+    # --- Bags, then derive package state and upsert the changed packages ---
+    with track_phase(job, "packages"):
+        bag_fids = (
+            packages["RECPTCL_FID"]
+            .dropna()  # remove NaNs
+            .astype(str)  # ensure string keys
+            .str.strip()
+            .unique()
+        )
+
+        # Get all existing Bag objects in one query
+        existing_bags = Bag.objects.filter(receptacle_fid__in=bag_fids)
+        bag_map = {b.receptacle_fid: b for b in existing_bags}
+
+        # Create missing Bag objects
+        new_bags = [Bag(receptacle_fid=fid) for fid in bag_fids if fid not in bag_map]
+        if new_bags:
+            Bag.objects.bulk_create(new_bags)
+            # update the map with the new ones
+            created = Bag.objects.filter(
+                receptacle_fid__in=[b.receptacle_fid for b in new_bags]
+            )
+            bag_map.update({b.receptacle_fid: b for b in created})
+
+        logger.info(f"Processing {len(unique_ids)} unique packages...")
+        package_states = derive_package_states(packages)
+        package_ids, package_counts = upsert_packages(
+            package_state_records(package_states), bag_map, counted=split_fids
+        )
+        mark_dirty(KPIDirtyEntity.Kind.PACKAGE, package_ids.values())
+
+    # --- Bulk insert PackageEvents, linked to their package ---
+    with track_phase(job, "events"):
+        office_id, state_id, unresolved = resolve_offices(
+            df_clean["établissement_postal"], directory
+        )
+        next_office_id, next_state_id, next_unresolved = resolve_offices(
+            df_clean["next_établissement_postal"], directory
+        )
+        unresolved = sorted(set(unresolved) | set(next_unresolved))
+        if unresolved:
+            logger.warning(f"🏤 {len(unresolved)} office names matched no office")
+        events = df_clean.assign(
+            package_id=df_clean["MAILITM_FID"].map(package_ids),
+            office_id=office_id,
+            state_id=state_id,
+            next_office_id=next_office_id,
+            next_state_id=next_state_id,
+        )
+
+        new_events = _unknown_events(events, unique_ids)
+        events_skipped = len(events) - len(new_events)
+        loaded = bulk_insert(
+            PackageEvent,
+            new_events,
+            EVENT_COLUMNS,
+            # Still guards against events inserted concurrently
+            ignore_conflicts=True,
+            on_batch=lambda n: report_rows(job, rows_done + events_skipped + n),
+        )
+        if refreshed_events:
+            PackageEvent.objects.bulk_update(
+                refreshed_events,
+                ["duration_to_next_step"],
+                batch_size=STORED_EVENTS_BATCH_SIZE,
+            )
+        report_rows(job, rows_done + len(events))
+        logger.info(
+            f"Inserted {loaded['rows']} PackageEvents, skipped {events_skipped} "
+            "already stored."
+        )
+
+    # --- Evaluate alert rules for the whole frame ---
+    with track_phase(job, "alerts"):
+        if deferred_fids:
+            df_clean = df_clean[~df_clean["MAILITM_FID"].isin(deferred_fids)]
+        alerts_created = _create_alerts(df_clean, directory)
+
+    # --- Rebuild the transitions of the packages of this frame ---
+    with track_phase(job, "transitions"):
+        rebuild_transitions(package_ids.values())
+
+    return {
+        "events_saved": loaded["rows"],
+        "events_inserted": loaded["rows"],
+        "events_skipped": events_skipped,
+        "packages_saved": len(unique_ids) - len(split_fids),
+        "packages_created": package_counts["created"],
+        "packages_updated": package_counts["updated"],
+        "packages_unchanged": package_counts["unchanged"],
+        "alerts_created": alerts_created,
+        "unresolved_offices": unresolved,
+    }
+
+
+def ingest_package_file(file_obj, job=None, chunksize=None):
+    """
+    Clean a package events CSV and load it: events, packages, alerts, transitions.
+
+    file_obj  : uploaded (or staged) CSV file
+    job       : optional UploadJob receiving phase / row progress
+    chunksize : stream the file in chunks of this many rows. Defaults to
+                UPLOAD_STREAMING_CHUNK_ROWS for files larger than
+                UPLOAD_STREAMING_THRESHOLD_BYTES, otherwise the whole file is
+                loaded at once.
+
+    A file with the same content as an earlier completed upload is not loaded
+    again. A streamed file resumes after its last committed chunk.
+
+    Returns the counts reported to the client.
+    """
+    content_hash = file_sha256(file_obj)
+    duplicate = find_duplicate_upload(UploadMetaData, content_hash)
+    if duplicate is not None:
+        return _duplicate_result(duplicate)
+
+    if chunksize is None:
+        file_size = getattr(file_obj, "size", 0) or 0
+        if file_size > settings.UPLOAD_STREAMING_THRESHOLD_BYTES:
+            chunksize = settings.UPLOAD_STREAMING_CHUNK_ROWS
+    if chunksize:
+        return _ingest_package_chunks(file_obj, chunksize, content_hash, job)
+
+    # --- Clean CSV data ---
+    with track_phase(job, "cleaning"):
+        logger.info("Starting CSV data cleaning...")
+        df_clean, metadata = clean_package_data(file_obj)
+        if metadata["errors"]:
+            raise ValueError("; ".join(metadata["errors"]))
+        logger.debug(f"Cleaned dataframe shape: {df_clean.shape}")
+    report_rows(job, 0, rows_total=len(df_clean))
+
+    counts = _load_package_frame(df_clean, office_directory(), job)
+    _save_metadata(file_obj, metadata, counts, content_hash)
+    return {"status": "success", **counts}
+
+
+def _create_split_package_alerts(mailitm_fids, directory, batch_size=10_000):
+    """Alerts of packages loaded over several chunks, from all of their events."""
+    mailitm_fids = sorted(mailitm_fids)
+    created = 0
+    for i in range(0, len(mailitm_fids), batch_size):
+        created += _create_alerts(
+            _stored_events(mailitm_fids[i : i + batch_size]), directory
+        )
+    return created
+
+
+def _ingest_package_chunks(file_obj, chunksize, content_hash, job=None):
+    """
+    Streaming mode: clean and load one chunk of packages at a time.
+
+    Every loaded chunk is recorded in the UploadChunk ledger; chunks already
+    recorded for this file (same index and rows) are cleaned but not loaded.
+    Cleaning errors stop the upload before the chunk is loaded.
+
+    Packages whose rows are not all together in the file (found by a first pass
+    over their ids) are derived again from all of their events loaded so far
+    whenever a later chunk holds more of them, and counted once. Their alerts
+    are evaluated once, from their stored events, after the last chunk.
+    """
+    logger.info(f"Streaming package upload in chunks of {chunksize} rows...")
+    directory = office_directory()
+    with track_phase(job, "cleaning"):
+        split_fids = noncontiguous_packages(file_obj, chunksize)
+    if split_fids:
+        logger.info(f"🧩 {len(split_fids)} packages have rows in several blocks")
+    metadata = {}
+    chunks = iter_clean_package_chunks(file_obj, metadata, chunksize=chunksize)
+    counts = dict.fromkeys(UPLOAD_COUNTS, 0)
+    unresolved = set()
+    loaded_fids = set()
+
+    for chunk_index in itertools.count():
+        with track_phase(job, "cleaning"):
+            df_clean = next(chunks, None)
+        if metadata["errors"]:
+            raise ValueError("; ".join(metadata["errors"]))
+        if df_clean is None:
+            break
+        chunk_hash = frame_sha256(df_clean)
+        chunk_counts = committed_chunk_counts(
+            UploadJob.Kind.PACKAGE, content_hash, chunk_index, chunk_hash
+        )
+        if chunk_counts is None:
+            chunk_counts = _load_package_frame(
+                df_clean,
+                directory,
+                job,
+                rows_done=counts["events_saved"] + counts["events_skipped"],
+                loaded_fids=loaded_fids,
+                deferred_fids=split_fids,
+            )
+            record_chunk(
+                UploadJob.Kind.PACKAGE,
+                content_hash,
+                chunk_index,
+                chunk_hash,
+                chunk_counts,
+            )
+        else:
+            logger.info(f"⏭️ Chunk #{chunk_index} already loaded, skipped")
+        chunk_counts = dict(chunk_counts)
+        unresolved.update(chunk_counts.pop("unresolved_offices"))
+        for key, value in chunk_counts.items():
+            counts[key] += value
+        fids = df_clean["MAILITM_FID"]
+        loaded_fids.update(fids[fids.isin(split_fids)].unique())
+        logger.info(f"🧩 Chunk loaded, {counts['events_saved']} events so far")
+        del df_clean
+
+    with track_phase(job, "alerts"):
+        counts["alerts_created"] += _create_split_package_alerts(loaded_fids, directory)
+
+    counts["unresolved_offices"] = sorted(unresolved)
+    _save_metadata(file_obj, metadata, counts, content_hash)
+    clear_chunks(UploadJob.Kind.PACKAGE, content_hash)
+    rows = counts["events_saved"] + counts["events_skipped"]
+    report_rows(job, rows, rows_total=rows)
+    return {"status": "success", **counts}
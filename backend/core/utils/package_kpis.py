@@ -0,0 +1,161 @@
+import logging
+
+import pandas as pd
+from django.db import connection
+from django.db.models import Aggregate, Count, Max, Q, Sum
+
+from core.utils.kpi_tracking import MAX_ALLOWED_DAYS, SLA_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+class PercentileCont(Aggregate):
+    """PERCENTILE_CONT(fraction) WITHIN GROUP (ORDER BY expression), PostgreSQL."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _duration_str(value):
+    return str(pd.Timedelta(value)) if value is not None else None
+
+
+def _median_duration(qs, field, count):
+    """
+    Median of a duration field over `count` rows of qs, without loading them:
+    PERCENTILE_CONT where the database has it, otherwise the middle row(s)
+    of an ORDER BY.
+    """
+    if not count:
+        return None
+    if connection.vendor == "postgresql":
+        return _duration_str(qs.aggregate(median=PercentileCont(field, 0.5))["median"])
+
+    middle = qs.order_by(field).values_list(field, flat=True)[
+        (count - 1) // 2 : count // 2 + 1
+    ]
+    return str(pd.to_timedelta(list(middle)).mean())
+
+
+def _average_duration(total, count):
+    return str(pd.Timedelta(total).as_unit("ns") / count) if count else None
+
+
+def calculate_package_kpis(qs, sla_days=SLA_DAYS, max_allowed_days=MAX_ALLOWED_DAYS):
+    """
+    Dashboard KPIs of a Package queryset, counted in one conditional aggregate
+    query (plus the two medians).
+
+    sla_days         : deliveries within this many days are on time
+    max_allowed_days : delivery durations above this are left out of the
+                       average / median
+    """
+    success = Q(status="success")
+    failure = Q(status="failure")
+    recovered = Q(recovered_after_failure=True)
+    delivered = success & Q(total_duration__isnull=False)
+    durations_in_range = delivered & Q(
+        total_duration__gte=pd.Timedelta(0),
+        total_duration__lte=pd.Timedelta(days=max_allowed_days),
+    )
+    customs_out = Q(flag_seized=False, seized_at__isnull=False, exited_at__isnull=False)
+    valid_holds = customs_out & Q(hold_duration__gt=pd.Timedelta(0))
+
+    totals = qs.aggregate(
+        total=Count("id"),
+        success_count=Count("id", filter=success),
+        failure_count=Count("id", filter=failure),
+        in_process_count=Count("id", filter=Q(status="in_process")),
+        on_time_count=Count(
+            "id",
+            filter=delivered & Q(total_duration__lte=pd.Timedelta(days=sla_days)),
+        ),
+        duration_count=Count("id", filter=durations_in_range),
+        duration_sum=Sum("total_duration", filter=durations_in_range),
+        recovered_count=Count("id", filter=recovered),
+        recovered_failures=Sum("failure_before_success_count", filter=recovered),
+        total_cities=Sum("cities_after_failure_count", filter=failure),
+        max_cities=Max("cities_after_failure_count", filter=failure),
+        failed_with_movement=Count(
+            "id", filter=failure & Q(cities_after_failure_count__gt=0)
+        ),
+        in_customs_count=Count("id", filter=Q(flag_seized=True)),
+        exited_customs_count=Count("id", filter=customs_out),
+        customs_alert_count=Count("id", filter=Q(alert_after_seizure=True)),
+        hold_count=Count("id", filter=valid_holds),
+        hold_sum=Sum("hold_duration", filter=valid_holds),
+    )
+
+    total = totals["total"]
+    n_success = totals["success_count"]
+    n_failure = totals["failure_count"]
+    n_done = n_success + n_failure
+    on_time_count = totals["on_time_count"]
+    recovered_count = totals["recovered_count"]
+
+    # ----------------------------
+    # Post-failure movement
+    # ----------------------------
+    if n_failure:
+        total_cities_after_failure = totals["total_cities"] or 0
+        max_cities_after_failure = totals["max_cities"] or 0
+        avg_cities_after_failure = round(total_cities_after_failure / n_failure, 2)
+        packages_with_post_failure_movement = totals["failed_with_movement"]
+        pct_with_post_failure_movement = round(
+            packages_with_post_failure_movement / n_failure, 4
+        )
+    else:
+        total_cities_after_failure = 0
+        max_cities_after_failure = 0
+        avg_cities_after_failure = 0
+        packages_with_post_failure_movement = 0
+        pct_with_post_failure_movement = 0
+
+    return {
+        "total_packages": total,
+        "success_count": n_success,
+        "failure_count": n_failure,
+        "in_process_count": totals["in_process_count"],
+        "done_count": n_done,
+        "success_rate_all": round(n_success / total, 4) if total else 0,
+        "failure_rate_all": round(n_failure / total, 4) if total else 0,
+        "success_rate_done": round(n_success / n_done, 4) if n_done else 0,
+        "failure_rate_done": round(n_failure / n_done, 4) if n_done else 0,
+        "on_time_delivery_rate_all": round(on_time_count / total, 4) if total else 0,
+        "on_time_delivery_rate_delivered_only": round(on_time_count / n_success, 4)
+        if n_success
+        else 0,
+        "average_delivery_duration": _average_duration(
+            totals["duration_sum"], totals["duration_count"]
+        ),
+        "median_delivery_duration": _median_duration(
+            qs.filter(durations_in_range), "total_duration", totals["duration_count"]
+        ),
+        "recovered_after_failure_count": recovered_count,
+        "recovery_rate_success": round(recovered_count / n_success, 4)
+        if n_success
+        else 0,
+        "avg_failures_before_success": round(
+            (totals["recovered_failures"] or 0) / recovered_count, 2
+        )
+        if recovered_count
+        else 0,
+        "in_customs_count": totals["in_customs_count"],
+        "exited_customs_count": totals["exited_customs_count"],
+        "customs_alert_count": totals["customs_alert_count"],
+        "avg_customs_hold_duration": _average_duration(
+            totals["hold_sum"], totals["hold_count"]
+        ),
+        "median_customs_hold_duration": _median_duration(
+            qs.filter(valid_holds), "hold_duration", totals["hold_count"]
+        ),
+        "total_cities_after_failure": total_cities_after_failure,
+        "avg_cities_after_failure": avg_cities_after_failure,
+        "max_cities_after_failure": max_cities_after_failure,
+        "packages_with_post_failure_movement": packages_with_post_failure_movement,
+        "pct_with_post_failure_movement": pct_with_post_failure_movement,
+    }
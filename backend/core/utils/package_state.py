@@ -0,0 +1,182 @@
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Event codes driving the package state machine
+CUSTOMS_SEIZURE_CODES = ["4", "6", "31"]
+CUSTOMS_EXIT_CODES = ["7", "38"]
+CUSTOMS_CODES = CUSTOMS_SEIZURE_CODES + CUSTOMS_EXIT_CODES
+SUCCESS_CODE = "37"
+FAILURE_CODE = "36"
+TRANSMISSION_CODE = "32"
+
+# Columns of the derived frame, in Package field order (+ the bag receptacle id)
+PACKAGE_STATE_COLUMNS = [
+    "mailitm_fid",
+    "bag_fid",
+    "country",
+    "total_duration",
+    "status",
+    "delivered_at",
+    "failed_at",
+    "alert_after_success",
+    "failure_before_success_count",
+    "recovered_after_failure",
+    "flag_seized",
+    "seized_at",
+    "exited_at",
+    "hold_duration",
+    "alert_after_seizure",
+    "cities_after_failure_count",
+    "last_known_location",
+    "last_event_type_cd",
+    "last_event_timestamp",
+]
+
+
+def _per_package(values, index, fill=None):
+    """Reindex a per-package Series on the full package index."""
+    values = values.reindex(index)
+    if fill is not None:
+        values = values.fillna(fill)
+    return values
+
+
+def derive_package_states(df_clean):
+    """
+    Derive every Package field for all packages of a cleaned upload in one pass.
+
+    df_clean : cleaned package events (output of clean_package_data), with
+               `date` already parsed.
+
+    Returns a DataFrame with one row per MAILITM_FID and the columns listed in
+    PACKAGE_STATE_COLUMNS, ready to be turned into Package rows.
+    """
+    if df_clean.empty:
+        return pd.DataFrame(columns=PACKAGE_STATE_COLUMNS)
+
+    df = df_clean.sort_values(["MAILITM_FID", "date"], kind="mergesort")
+    df = df.reset_index(drop=True)
+
+    fid = df["MAILITM_FID"]
+    code = df["EVENT_TYPE_CD"]
+    date = df["date"]
+
+    grouped = df.groupby("MAILITM_FID", sort=False)
+    position = grouped.cumcount()
+    size = grouped["MAILITM_FID"].transform("size")
+
+    first_rows = df[position == 0].set_index("MAILITM_FID")
+    last_rows = df[position == size - 1].set_index("MAILITM_FID")
+    index = first_rows.index
+
+    states = pd.DataFrame(index=index)
+    if "RECPTCL_FID" in df.columns:
+        bag_fid = first_rows["RECPTCL_FID"].astype("string").str.strip()
+        states["bag_fid"] = bag_fid.astype(object).where(bag_fid.notna(), None)
+    else:
+        states["bag_fid"] = None
+    states["country"] = first_rows["country"]
+    states["total_duration"] = first_rows["total_duration"]
+    states["last_known_location"] = last_rows["établissement_postal"]
+    states["last_event_type_cd"] = last_rows["EVENT_TYPE_CD"]
+    states["last_event_timestamp"] = last_rows["date"]
+
+    # ----------------------------
+    # Customs: latest customs event decides seized / exited
+    # ----------------------------
+    customs = df[code.isin(CUSTOMS_CODES)]
+    latest_customs = customs.groupby("MAILITM_FID", sort=False).tail(1)
+    latest_customs = latest_customs.set_index("MAILITM_FID")
+    latest_code = _per_package(latest_customs["EVENT_TYPE_CD"], index)
+    latest_date = _per_package(latest_customs["date"], index)
+
+    seizures = df[code.isin(CUSTOMS_SEIZURE_CODES)]
+    last_seizure = seizures.groupby("MAILITM_FID", sort=False).tail(1)
+    last_seizure_date = _per_package(
+        last_seizure.set_index("MAILITM_FID")["date"], index
+    )
+
+    flag_seized = latest_code.isin(CUSTOMS_SEIZURE_CODES)
+    exited = latest_code.isin(CUSTOMS_EXIT_CODES)
+
+    seized_at = latest_date.where(flag_seized, last_seizure_date.where(exited))
+    exited_at = latest_date.where(exited)
+
+    # Seized packages that kept moving without a customs exit
+    seized_at_per_event = fid.map(seized_at.where(flag_seized))
+    after_seizure = date > seized_at_per_event
+    exit_after_seizure = after_seizure & code.isin(CUSTOMS_EXIT_CODES)
+    moved_after_seizure = after_seizure.groupby(fid, sort=False).any()
+    exited_after_seizure = exit_after_seizure.groupby(fid, sort=False).any()
+
+    states["flag_seized"] = flag_seized
+    states["seized_at"] = seized_at
+    states["exited_at"] = exited_at
+    states["hold_duration"] = exited_at - seized_at
+    states["alert_after_seizure"] = flag_seized & (
+        _per_package(moved_after_seizure, index, False)
+        & ~_per_package(exited_after_seizure, index, False)
+    )
+
+    # ----------------------------
+    # Delivery: first success wins, otherwise first failure
+    # ----------------------------
+    is_success = code == SUCCESS_CODE
+    is_failure = code == FAILURE_CODE
+
+    first_success = df[is_success].groupby("MAILITM_FID", sort=False).head(1)
+    first_success = first_success.set_index("MAILITM_FID")
+    delivered_at = _per_package(first_success["date"], index)
+    success_position = _per_package(
+        position[is_success].groupby(fid[is_success], sort=False).first(), index
+    )
+    has_success = success_position.notna()
+
+    failures_before = (
+        (is_failure & (date < fid.map(delivered_at))).groupby(fid, sort=False).sum()
+    )
+    failure_before_success_count = _per_package(failures_before, index, 0).where(
+        has_success, 0
+    )
+
+    first_failure = df[is_failure].groupby("MAILITM_FID", sort=False).head(1)
+    failed_at = _per_package(first_failure.set_index("MAILITM_FID")["date"], index)
+    last_failure_position = _per_package(
+        position[is_failure].groupby(fid[is_failure], sort=False).last(), index
+    )
+    has_failure = last_failure_position.notna() & ~has_success
+
+    transmissions_after_failure = (
+        ((code == TRANSMISSION_CODE) & (position > fid.map(last_failure_position)))
+        .groupby(fid, sort=False)
+        .sum()
+    )
+
+    states["status"] = "in_process"
+    states.loc[has_failure, "status"] = "failure"
+    states.loc[has_success, "status"] = "success"
+    states["delivered_at"] = delivered_at.where(has_success)
+    states["failed_at"] = failed_at.where(has_failure)
+    states["alert_after_success"] = has_success & (
+        success_position < _per_package(grouped.size(), index) - 1
+    )
+    states["failure_before_success_count"] = failure_before_success_count.astype(int)
+    states["recovered_after_failure"] = states["failure_before_success_count"] > 0
+    states["cities_after_failure_count"] = (
+        _per_package(transmissions_after_failure, index, 0)
+        .where(has_failure, 0)
+        .astype(int)
+    )
+
+    states = states.reset_index().rename(columns={"MAILITM_FID": "mailitm_fid"})
+    logger.debug(f"Derived state for {len(states)} packages")
+    return states[PACKAGE_STATE_COLUMNS]
+
+
+def package_state_records(states):
+    """Return Package-ready dicts from derive_package_states(), with NaN/NaT as None."""
+    states = states.astype(object).where(states.notna(), None)
+    return states.to_dict("records")
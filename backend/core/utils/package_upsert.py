@@ -0,0 +1,128 @@
+import logging
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from core.models import Package
+from core.utils.package_state import PACKAGE_STATE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+UPSERT_BATCH_SIZE = 1000
+
+# Package columns written from the derived state ("bag_id" from bag_fid)
+UPSERT_FIELDS = [
+    column
+    for column in PACKAGE_STATE_COLUMNS
+    if column not in ("mailitm_fid", "bag_fid")
+] + ["bag_id"]
+
+
+def _batches(values, size=UPSERT_BATCH_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _same(stored, incoming):
+    if stored is None or incoming is None:
+        return stored is None and incoming is None
+    return stored == incoming
+
+
+def _model_fields(fields):
+    return ["bag" if field == "bag_id" else field for field in fields]
+
+
+def upsert_packages(records, bag_map, counted=()):
+    """
+    Insert new packages and write only the changed columns of existing ones.
+
+    records : package_state_records() dicts (with "bag_fid")
+    bag_map : {receptacle_fid: Bag}
+    counted : mailitm_fids already counted by an earlier chunk of the same
+              upload, written but left out of the counts
+
+    Existing rows are diffed against the incoming state; changed rows are
+    grouped by the set of columns that changed and written with
+    INSERT ... ON CONFLICT DO UPDATE where the backend supports it
+    (bulk_update otherwise). Unchanged rows are not written.
+
+    Returns ({mailitm_fid: package id}, {"created", "updated", "unchanged"}).
+    """
+    rows = {}
+    for record in records:
+        record = dict(record)
+        bag_fid = record.pop("bag_fid")
+        bag = bag_map.get(bag_fid) if bag_fid else None
+        record["bag_id"] = bag.id if bag else None
+        rows[record["mailitm_fid"]] = record
+
+    # --- Diff incoming vs stored values ---
+    package_ids = {}
+    changed = defaultdict(list)
+    for batch in _batches(rows):
+        stored_rows = Package.objects.filter(mailitm_fid__in=batch).values(
+            "id", "mailitm_fid", *UPSERT_FIELDS
+        )
+        for stored in stored_rows:
+            fid = stored["mailitm_fid"]
+            package_ids[fid] = stored["id"]
+            record = rows[fid]
+            fields = tuple(
+                field
+                for field in UPSERT_FIELDS
+                if not _same(stored[field], record[field])
+            )
+            if fields:
+                changed[fields].append((stored["id"], record))
+
+    to_create = [
+        Package(**record) for fid, record in rows.items() if fid not in package_ids
+    ]
+    counted = set(counted)
+    n_updated = sum(
+        record["mailitm_fid"] not in counted
+        for updates in changed.values()
+        for _, record in updates
+    )
+
+    # --- Write new rows, then only the changed columns of the others ---
+    native_upsert = connection.features.supports_update_conflicts_with_target
+    with transaction.atomic():
+        Package.objects.bulk_create(
+            to_create, batch_size=UPSERT_BATCH_SIZE, ignore_conflicts=True
+        )
+        for fields, updates in changed.items():
+            if native_upsert:
+                Package.objects.bulk_create(
+                    [Package(**record) for _, record in updates],
+                    batch_size=UPSERT_BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=["mailitm_fid"],
+                    update_fields=_model_fields(fields),
+                )
+            else:
+                Package.objects.bulk_update(
+                    [Package(id=pk, **record) for pk, record in updates],
+                    _model_fields(fields),
+                    batch_size=UPSERT_BATCH_SIZE,
+                )
+
+    for batch in _batches(p.mailitm_fid for p in to_create):
+        package_ids.update(
+            Package.objects.filter(mailitm_fid__in=batch).values_list(
+                "mailitm_fid", "id"
+            )
+        )
+
+    counts = {
+        "created": len(to_create),
+        "updated": n_updated,
+        "unchanged": len(rows.keys() - counted) - len(to_create) - n_updated,
+    }
+    logger.info(
+        f"📦 Packages: {counts['created']} created, {counts['updated']} updated, "
+        f"{counts['unchanged']} unchanged"
+    )
+    return package_ids, counts
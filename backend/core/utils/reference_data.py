@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(settings.BASE_DIR, "core", "data")
+
+# name -> (file path, loader(path))
+_DATASETS = {}
+# name -> (file mtime, loaded value)
+_CACHE = {}
+_LOCK = threading.Lock()
+
+
+def reference_dataset(name, filename):
+    """Register the decorated function as the loader of a file of core/data."""
+
+    def register(loader):
+        _DATASETS[name] = (os.path.join(DATA_DIR, filename), loader)
+        return loader
+
+    return register
+
+
+def get_reference(name):
+    """
+    The loaded dataset `name`, read on first use and kept until its file
+    changes (mtime).
+    """
+    path, loader = _DATASETS[name]
+    mtime = os.path.getmtime(path)
+    cached = _CACHE.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _LOCK:
+        cached = _CACHE.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        value = loader(path)
+        _CACHE[name] = (mtime, value)
+    logger.info(f"📚 Reference data {name!r} loaded from {os.path.basename(path)}")
+    return value
+
+
+def warm_up_reference_data():
+    """Load every dataset now (worker start) rather than on the first upload."""
+    for name in _DATASETS:
+        get_reference(name)
+
+
+# ----------------------------
+# Datasets
+# ----------------------------
+@reference_dataset("establishments", "code_etablissement.csv")
+def load_establishments(path):
+    """Postal establishment name (bp_nm) → wilaya code (code_upw)."""
+    return pd.read_csv(path, usecols=["bp_nm", "code_upw"])
+
+
+def _column_to_timedelta(column):
+    """Numbers as days, anything else parsed as a duration (NaT if it can't be)."""
+    if pd.api.types.is_numeric_dtype(column):
+        return pd.to_timedelta(column, unit="D")
+    return pd.to_timedelta(column.astype("string"), errors="coerce")
+
+
+def load_duration_matrix(path):
+    """SLA baselines between wilayas, as a DataFrame of Timedelta (NaT if unknown)."""
+    duration_matrix = pd.read_csv(path, index_col=0)
+    duration_matrix = duration_matrix.apply(_column_to_timedelta)
+
+    # Harmonize indices/columns → int
+    duration_matrix.index = pd.to_numeric(duration_matrix.index, errors="coerce")
+    duration_matrix.columns = pd.to_numeric(duration_matrix.columns, errors="coerce")
+    duration_matrix = duration_matrix.dropna(axis=0, how="all").dropna(
+        axis=1, how="all"
+    )
+    duration_matrix.index = duration_matrix.index.astype(int)
+    duration_matrix.columns = duration_matrix.columns.astype(int)
+    return duration_matrix
+
+
+def sla_array(duration_matrix):
+    """
+    SLA matrix as a square timedelta64 array indexed by wilaya codes:
+    array[origin, dest], NaT for pairs without a baseline.
+    """
+    size = max(duration_matrix.index.max(), duration_matrix.columns.max()) + 1
+    array = np.full((size, size), np.timedelta64("NaT"), dtype="timedelta64[ns]")
+    rows = duration_matrix.index.to_numpy()[:, None]
+    cols = duration_matrix.columns.to_numpy()[None, :]
+    array[rows, cols] = duration_matrix.to_numpy(dtype="timedelta64[ns]")
+    return array
+
+
+@reference_dataset("sla_matrix", "wilayas_cleaned.csv")
+def load_sla_matrix(path):
+    return sla_array(load_duration_matrix(path))
@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from django.utils import timezone
+
+from core.models import CPXStats, CTNIStats, Dashboard, Package
+from core.utils.aiport_kpis_function import compute_airport_stats
+from core.utils.kpi_rollups import refresh_rollups
+from core.utils.kpi_tracking import (
+    CONTRIBUTION_FIELDS,
+    PACKAGE_FIELDS,
+    contributions_frame,
+    kpis_from_totals,
+)
+from core.utils.state_and_office_stats import compute_office_stats, compute_state_stats
+from core.utils.upload_jobs import track_phase
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("daily", "weekly", "monthly")
+
+
+# ----------------------------
+# Periods
+# ----------------------------
+def snapshot_periods(start, end, granularity="monthly"):
+    """
+    (period start, period end) pairs covering start → end, one per day, week
+    (from Monday) or month. Periods start at 00:00:00 and end at 23:59:59,
+    the first one at the beginning of its week / month and the last one on
+    `end`.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}, use {GRANULARITIES}")
+
+    current = start.date() if isinstance(start, datetime) else start
+    last = end.date() if isinstance(end, datetime) else end
+    if granularity == "weekly":
+        current -= timedelta(days=current.weekday())
+    elif granularity == "monthly":
+        current = current.replace(day=1)
+
+    step = {
+        "daily": relativedelta(days=1),
+        "weekly": relativedelta(weeks=1),
+        "monthly": relativedelta(months=1),
+    }[granularity]
+
+    periods = []
+    while current <= last:
+        period_end = min(current + step - timedelta(days=1), last)
+        periods.append(
+            (
+                timezone.make_aware(datetime.combine(current, time.min)),
+                timezone.make_aware(datetime.combine(period_end, time(23, 59, 59))),
+            )
+        )
+        current += step
+    return periods
+
+
+# ----------------------------
+# Dashboard snapshots
+# ----------------------------
+def dashboard_snapshot(data, snapshot_time):
+    """Unsaved Dashboard row for a calculate_package_kpis() dict."""
+    if timezone.is_naive(snapshot_time):
+        snapshot_time = timezone.make_aware(snapshot_time)
+
+    return Dashboard(
+        pre_arrived_dispatches_count=0,
+        items_delivered=data["success_count"],
+        items_delivered_after_one_fail=data["recovered_after_failure_count"],
+        undelivered_items=data["failure_count"],
+        delivery_rate=data["success_rate_all"] * 100,
+        on_time_delivery_rate=data["on_time_delivery_rate_all"] * 100,
+        items_exceeding_holding_time=0,
+        items_blocked_in_customs=data["in_customs_count"],
+        returned_items=0,
+        consolidation_time=str(data["avg_failures_before_success"]),
+        end_to_end_transit_time_average=data["average_delivery_duration"] or "",
+        shipment_consolidation_time=data["avg_customs_hold_duration"] or "",
+        unscanned_items=0,
+        timestamp=snapshot_time,
+    )
+
+
+def _period_kpis(contributions):
+    """KPIs of the packages of one period."""
+    failed = contributions.loc[contributions["failure_count"] == 1, "failed_cities"]
+    return kpis_from_totals(
+        contributions.sum().reindex(CONTRIBUTION_FIELDS, fill_value=0).to_dict(),
+        max_cities_after_failure=int(failed.max()) if len(failed) else 0,
+    )
+
+
+def _packages_by_period(periods):
+    """
+    Read the packages of all periods in one query and split their KPI
+    contributions by last_event_timestamp, the way RefreshDashboard.post
+    filters one period.
+    """
+    packages = pd.DataFrame.from_records(
+        list(
+            Package.objects.filter(
+                last_event_timestamp__range=[periods[0][0], periods[-1][1]]
+            )
+            .order_by("last_event_timestamp")
+            .values_list(*PACKAGE_FIELDS, "last_event_timestamp")
+        ),
+        columns=[*PACKAGE_FIELDS, "last_event_timestamp"],
+    )
+    contributions = contributions_frame(packages)
+    timestamps = pd.to_datetime(packages["last_event_timestamp"], utc=True)
+
+    for period_start, period_end in periods:
+        first = timestamps.searchsorted(pd.Timestamp(period_start), side="left")
+        last = timestamps.searchsorted(pd.Timestamp(period_end), side="right")
+        yield contributions.iloc[first:last]
+
+
+def compute_period_stats(start_date, end_date):
+    """Office, state, airport and hub stats of one period."""
+    compute_office_stats(start_date, end_date)
+    compute_state_stats(start_date, end_date)
+    compute_airport_stats(start_date, end_date)
+
+    packages_qs = Package.objects.filter(
+        last_event_timestamp__range=[start_date, end_date]
+    )
+    CTNIStats.compute_stats("CTNI", packages_queryset=packages_qs)
+    CPXStats.compute_stats("ALGER COLIS POSTAUX", packages_queryset=packages_qs)
+
+
+def rebuild_snapshots(start, end, granularity="monthly", job=None):
+    """
+    Rebuild the dashboard history between start and end: one Dashboard
+    snapshot per period, stamped at the period end.
+
+    All packages are read in one query and bucketed by period; each period
+    is then a sum over its slice. The office / state / airport / hub stats
+    only keep their latest values, so they are computed once, for the last
+    period. Phases are reported to `job` (an UploadJob) when given.
+
+    Returns one {"period", "start", "end", "total_packages"} dict per period.
+    """
+    periods = snapshot_periods(start, end, granularity)
+    if not periods:
+        return []
+    logger.info(
+        f"🧱 Rebuilding {len(periods)} {granularity} snapshots "
+        f"({periods[0][0]:%Y-%m-%d} → {periods[-1][1]:%Y-%m-%d})"
+    )
+
+    with track_phase(job, "packages"):
+        kpis = [_period_kpis(bucket) for bucket in _packages_by_period(periods)]
+
+    with track_phase(job, "snapshots"):
+        snapshots = Dashboard.objects.bulk_create(
+            [
+                dashboard_snapshot(data, period_end)
+                for (_, period_end), data in zip(periods, kpis)
+            ],
+            batch_size=1000,
+        )
+        # bulk_create sends no post_save, update the chart rollups here
+        refresh_rollups("dashboard", [snapshot.timestamp for snapshot in snapshots])
+
+    with track_phase(job, "stats"):
+        compute_period_stats(*periods[-1])
+
+    logger.info(f"✅ Rebuilt {len(periods)} dashboard snapshots")
+    return [
+        {
+            "period": f"{period_start:%Y-%m-%d}",
+            "start": period_start.isoformat(),
+            "end": period_end.isoformat(),
+            "total_packages": data["total_packages"],
+        }
+        for (period_start, period_end), data in zip(periods, kpis)
+    ]
@@ -1,104 +1,188 @@
+import logging
 from datetime import timedelta
-from django.db.models import Count, Avg, Q
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Count, Q
+
 from core.models import (
     State,
     StateStats,
-    Package,
     PackageEvent,
     PostalOffice,
     OfficeStats,
 )
 
+logger = logging.getLogger(__name__)
+
+# Package fields needed for the KPIs, read through PackageEvent.package
+PACKAGE_KPI_FIELDS = [
+    "status",
+    "total_duration",
+    "hold_duration",
+    "flag_seized",
+    "recovered_after_failure",
+    "alert_after_success",
+    "failure_before_success_count",
+    "cities_after_failure_count",
+]
+
+# KPIs of an owner without any package in the period
+EMPTY_KPIS = {
+    "items_delivered": 0,
+    "undelivered_items": 0,
+    "total_packages": 0,
+    "avg_delivery_duration": timedelta(0),
+    "avg_hold_duration": timedelta(0),
+    "seized_packages": 0,
+    "recovered_after_failure_count": 0,
+    "alert_after_success_count": 0,
+    "failure_before_success_count": 0,
+    "cities_after_failure_avg": 0,
+}
+
+
+def _as_duration(mean_microseconds):
+    """Avg() result as stored by the old loop: 0 when there is nothing to average."""
+    if pd.isna(mean_microseconds) or not mean_microseconds:
+        return timedelta(0)
+    return timedelta(microseconds=mean_microseconds)
+
+
+def _kpis_by_owner(packages, owner_id):
+    """
+    Aggregate distinct (owner, package) rows into the KPIs of each owner.
+    Returns {owner pk: {kpi: value}}.
+    """
+    if packages.empty:
+        return {}
+
+    microseconds = {
+        field: pd.to_timedelta(packages[field]).dt.total_seconds() * 1e6
+        for field in ["total_duration", "hold_duration"]
+    }
+    delivered = packages["status"] == "success"
+    kpis = (
+        packages.assign(
+            delivered=delivered,
+            undelivered=packages["status"] == "failure",
+            delivery_us=microseconds["total_duration"].where(delivered),
+            hold_us=microseconds["hold_duration"],
+        )
+        .groupby(owner_id)
+        .agg(
+            items_delivered=("delivered", "sum"),
+            undelivered_items=("undelivered", "sum"),
+            total_packages=("package_id", "size"),
+            avg_delivery_duration=("delivery_us", "mean"),
+            avg_hold_duration=("hold_us", "mean"),
+            seized_packages=("flag_seized", "sum"),
+            recovered_after_failure_count=("recovered_after_failure", "sum"),
+            alert_after_success_count=("alert_after_success", "sum"),
+            failure_before_success_count=("failure_before_success_count", "mean"),
+            cities_after_failure_avg=("cities_after_failure_count", "mean"),
+        )
+    )
+    records = kpis.astype(object).to_dict("index")
+    for values in records.values():
+        for field in ["avg_delivery_duration", "avg_hold_duration"]:
+            values[field] = _as_duration(values[field])
+    return records
+
+
+def _compute_stats(owners, owner_field, stats_model, date_filter, owner_ids=None):
+    """
+    Compute the KPIs of every owner (office or state) in a few grouped queries.
 
-def compute_office_stats(start_date=None, end_date=None):
-    """Compute Office KPIs (optionally within a date range)."""
+    owners      : queryset of PostalOffice / State, each one gets a stats row
+    owner_field : "office" or "state", the PackageEvent FK grouping the events
+    stats_model : OfficeStats / StateStats, upserted by owner
+    date_filter : Q() on PackageEvent.date
+    owner_ids   : only refresh these owners (default: all of `owners`)
+
+    A package counts once per owner it has events at. Returns the pks of the
+    owners whose stats row was created or changed.
+    """
+    owner_id = f"{owner_field}_id"
+    events = PackageEvent.objects.filter(date_filter)
+    stats_rows = stats_model.objects.filter(**{f"{owner_field}__isnull": False})
+    if owner_ids is not None:
+        owner_ids = list(owner_ids)
+        owners = owners.filter(pk__in=owner_ids)
+        events = events.filter(**{f"{owner_id}__in": owner_ids})
+        stats_rows = stats_rows.filter(**{f"{owner_id}__in": owner_ids})
+
+    # --- Distinct (owner, package) pairs with the package fields, one query ---
+    rows = (
+        events.filter(**{f"{owner_field}__isnull": False}, package__isnull=False)
+        .values_list(
+            owner_id, "package_id", *[f"package__{f}" for f in PACKAGE_KPI_FIELDS]
+        )
+        .distinct()
+    )
+    packages = pd.DataFrame.from_records(
+        list(rows), columns=[owner_id, "package_id", *PACKAGE_KPI_FIELDS]
+    )
+    kpis_by_owner = _kpis_by_owner(packages, owner_id)
+
+    # --- PRE_ARRIVED events per owner, one query ---
+    pre_arrived = dict(
+        events.filter(event_type_cd__icontains="PRE_ARRIVED")
+        .values(owner_id)
+        .annotate(n=Count("id"))
+        .values_list(owner_id, "n")
+    )
+
+    # --- Upsert one stats row per owner, skipping unchanged ones ---
+    existing = {}
+    for stats in stats_rows:
+        existing.setdefault(getattr(stats, owner_id), stats)
+
+    to_create, to_update = [], []
+    for owner_pk in owners.values_list("pk", flat=True):
+        values = {
+            **kpis_by_owner.get(owner_pk, EMPTY_KPIS),
+            "pre_arrived_dispatches_count": pre_arrived.get(owner_pk, 0),
+        }
+        stats = existing.get(owner_pk)
+        if stats is None:
+            to_create.append(stats_model(**{owner_id: owner_pk}, **values))
+        elif any(getattr(stats, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(stats, field, value)
+            to_update.append(stats)
+
+    with transaction.atomic():
+        stats_model.objects.bulk_create(to_create, batch_size=1000)
+        stats_model.objects.bulk_update(
+            to_update,
+            fields=["pre_arrived_dispatches_count", *EMPTY_KPIS],
+            batch_size=1000,
+        )
+    logger.info(
+        f"📊 {stats_model.__name__}: {len(to_create)} created, "
+        f"{len(to_update)} updated from {len(packages)} {owner_field}/package pairs"
+    )
+    return [getattr(stats, owner_id) for stats in to_create + to_update]
+
+
+def compute_office_stats(start_date=None, end_date=None, office_ids=None):
+    """Compute Office KPIs (optionally within a date range / for some offices)."""
     date_filter = Q()
     if start_date and end_date:
         date_filter &= Q(date__range=[start_date, end_date])
 
-    for office in PostalOffice.objects.all():
-        event_qs = PackageEvent.objects.filter(office=office).filter(date_filter)
-        package_ids = event_qs.values_list("package_id", flat=True).distinct()
-        packages = Package.objects.filter(id__in=package_ids)
-        avg_delivery = packages.filter(status="success").aggregate(
-            avg=Avg("total_duration")
-        )["avg"]
-        avg_hold = packages.aggregate(avg=Avg("hold_duration"))["avg"]
-
-        OfficeStats.objects.update_or_create(
-            office=office,
-            defaults={
-                "pre_arrived_dispatches_count": event_qs.filter(
-                    event_type_cd__icontains="PRE_ARRIVED"
-                ).count(),
-                "items_delivered": packages.filter(status="success").count(),
-                "undelivered_items": packages.filter(status="failure").count(),
-                "total_packages": packages.count(),
-                "avg_delivery_duration": avg_delivery
-                if avg_delivery
-                else timedelta(seconds=0),
-                "avg_hold_duration": avg_hold if avg_hold else timedelta(seconds=0),
-                "seized_packages": packages.filter(flag_seized=True).count(),
-                "recovered_after_failure_count": packages.filter(
-                    recovered_after_failure=True
-                ).count(),
-                "alert_after_success_count": packages.filter(
-                    alert_after_success=True
-                ).count(),
-                "failure_before_success_count": packages.aggregate(
-                    total=Avg("failure_before_success_count")
-                )["total"]
-                or 0,
-                "cities_after_failure_avg": packages.aggregate(
-                    avg=Avg("cities_after_failure_count")
-                )["avg"]
-                or 0,
-            },
-        )
+    return _compute_stats(
+        PostalOffice.objects.all(), "office", OfficeStats, date_filter, office_ids
+    )
 
 
-def compute_state_stats(start_date=None, end_date=None):
-    """Compute State KPIs (optionally within a date range)."""
+def compute_state_stats(start_date=None, end_date=None, state_ids=None):
+    """Compute State KPIs (optionally within a date range / for some states)."""
     date_filter = Q()
     if start_date and end_date:
         date_filter &= Q(date__range=[start_date, end_date])
 
-    for state in State.objects.all():
-        event_qs = PackageEvent.objects.filter(state=state).filter(date_filter)
-        package_ids = event_qs.values_list("package_id", flat=True).distinct()
-        packages = Package.objects.filter(id__in=package_ids)
-        avg_delivery = packages.filter(status="success").aggregate(
-            avg=Avg("total_duration")
-        )["avg"]
-        avg_hold = packages.aggregate(avg=Avg("hold_duration"))["avg"]
-
-        StateStats.objects.update_or_create(
-            state=state,
-            defaults={
-                "pre_arrived_dispatches_count": event_qs.filter(
-                    event_type_cd__icontains="PRE_ARRIVED"
-                ).count(),
-                "items_delivered": packages.filter(status="success").count(),
-                "undelivered_items": packages.filter(status="failure").count(),
-                "total_packages": packages.count(),
-                "avg_delivery_duration": avg_delivery
-                if avg_delivery
-                else timedelta(seconds=0),
-                "avg_hold_duration": avg_hold if avg_hold else timedelta(seconds=0),
-                "seized_packages": packages.filter(flag_seized=True).count(),
-                "recovered_after_failure_count": packages.filter(
-                    recovered_after_failure=True
-                ).count(),
-                "alert_after_success_count": packages.filter(
-                    alert_after_success=True
-                ).count(),
-                "failure_before_success_count": packages.aggregate(
-                    total=Avg("failure_before_success_count")
-                )["total"]
-                or 0,
-                "cities_after_failure_avg": packages.aggregate(
-                    avg=Avg("cities_after_failure_count")
-                )["avg"]
-                or 0,
-            },
-        )
+    return _compute_stats(
+        State.objects.all(), "state", StateStats, date_filter, state_ids
+    )
@@ -0,0 +1,260 @@
+import logging
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from core.models import Bag, BagEvent, Package, PackageEvent, PackageTransition
+from core.utils.keyset_pagination import (
+    DEFAULT_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+)
+
+logger = logging.getLogger(__name__)
+
+# Most packages / bags of one batch request
+MAX_TIMELINE_BATCH = 1000
+
+# Office / state names, joined through the resolved foreign keys
+NAME_FIELDS = {
+    "office_name": F("office__name"),
+    "state_name": F("state__name"),
+    "next_office_name": F("next_office__name"),
+    "next_state_name": F("next_state__name"),
+}
+DURATION_FIELDS = ("duration_to_next_step", "total_duration")
+# Event order within a timeline, served by the (fid, date) indexes
+KEYSET_FIELDS = ["date", "id"]
+
+TIMELINES = {
+    "package": {
+        "owner": Package,
+        "events": PackageEvent,
+        "fid": "mailitm_fid",
+        "fields": [
+            "date",
+            "event_type_cd",
+            "etablissement_postal",
+            "next_etablissement_postal",
+            "duration_to_next_step",
+        ],
+    },
+    "bag": {
+        "owner": Bag,
+        "events": BagEvent,
+        "fid": "receptacle_fid",
+        "fields": [
+            "date",
+            "event_typecd",
+            "etablissement_postal",
+            "nextetablissement_postal",
+            "country",
+            "duration_to_next_step",
+            "total_duration",
+        ],
+    },
+}
+
+
+def _duration(value):
+    return str(value) if value is not None else None
+
+
+def _events(kind, fids):
+    spec = TIMELINES[kind]
+    return (
+        spec["events"]
+        .objects.filter(**{f"{spec['fid']}__in": fids})
+        .values("id", spec["fid"], *spec["fields"], **NAME_FIELDS)
+    )
+
+
+def _timeline_events(kind, rows, first_date, previous_date=None):
+    """
+    Event rows with their durations as strings, plus the time elapsed since
+    the first event of the timeline and since the previous event.
+    """
+    fid = TIMELINES[kind]["fid"]
+    events = []
+    for row in rows:
+        event = {key: value for key, value in row.items() if key != fid}
+        for field in DURATION_FIELDS:
+            if field in event:
+                event[field] = _duration(event[field])
+        event["since_previous"] = (
+            _duration(row["date"] - previous_date) if previous_date else None
+        )
+        event["elapsed"] = _duration(row["date"] - first_date)
+        previous_date = row["date"]
+        events.append(event)
+    return events
+
+
+# ----------------------------
+# Transitions
+# ----------------------------
+def _package_transitions(fids):
+    """{mailitm_fid: PackageTransition rows}, in chronological order."""
+    transitions = defaultdict(list)
+    rows = (
+        PackageTransition.objects.filter(package__mailitm_fid__in=fids)
+        .order_by("package_id", "id")
+        .values(
+            "origin_upw",
+            "dest_upw",
+            "actual_duration",
+            "allowed_duration",
+            "late",
+            mailitm_fid=F("package__mailitm_fid"),
+        )
+    )
+    for row in rows:
+        transitions[row.pop("mailitm_fid")].append(
+            {
+                **row,
+                "actual_duration": _duration(row["actual_duration"]),
+                "allowed_duration": _duration(row["allowed_duration"]),
+            }
+        )
+    return transitions
+
+
+def _office_moves(events):
+    """
+    Moves of one bag between établissements: the last event of each stay to
+    the first event of the next one.
+    """
+    stays = [
+        list(stay)
+        for _, stay in groupby(events, key=itemgetter("etablissement_postal"))
+    ]
+    return [
+        {
+            "origin": origin[-1]["etablissement_postal"],
+            "origin_state": origin[-1]["state_name"],
+            "destination": destination[0]["etablissement_postal"],
+            "destination_state": destination[0]["state_name"],
+            "departed_at": origin[-1]["date"],
+            "arrived_at": destination[0]["date"],
+            "actual_duration": _duration(destination[0]["date"] - origin[-1]["date"]),
+        }
+        for origin, destination in zip(stays, stays[1:])
+    ]
+
+
+def _bag_transitions(fids):
+    """{receptacle_fid: moves between établissements}, in chronological order."""
+    rows = (
+        BagEvent.objects.filter(
+            receptacle_fid__in=fids, etablissement_postal__isnull=False
+        )
+        .order_by("receptacle_fid", *KEYSET_FIELDS)
+        .values(
+            "receptacle_fid",
+            "date",
+            "etablissement_postal",
+            state_name=F("state__name"),
+        )
+    )
+    return {
+        fid: _office_moves(events)
+        for fid, events in groupby(rows, key=itemgetter("receptacle_fid"))
+    }
+
+
+TRANSITIONS = {"package": _package_transitions, "bag": _bag_transitions}
+
+
+# ----------------------------
+# Timelines
+# ----------------------------
+def _decode_timeline_cursor(cursor):
+    """(first event date, last served date, last served id) of a page cursor."""
+    values = decode_cursor(cursor)
+    try:
+        first, last, last_id = values
+        first_date, last_date = parse_datetime(first), parse_datetime(last)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if first_date is None or last_date is None or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    return first_date, last_date, last_id
+
+
+def timeline_page(kind, fid, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the events of a package / bag ("kind"), in date order.
+
+    Pages are read by keyset (after the last served date and id) and the
+    cursor carries the timeline's first date, so durations are computed
+    without reading earlier pages. The first page also holds the transitions.
+
+    Returns (timeline, next cursor or None), or None for an unknown fid.
+    Raises ValueError for a malformed cursor.
+    """
+    spec = TIMELINES[kind]
+    if cursor:
+        first_date, last_date, last_id = _decode_timeline_cursor(cursor)
+        rows, has_more = keyset_page(
+            _events(kind, [fid]), KEYSET_FIELDS, [last_date, last_id], limit
+        )
+        timeline = {
+            spec["fid"]: fid,
+            "events": _timeline_events(kind, rows, first_date, last_date),
+        }
+    else:
+        rows, has_more = keyset_page(_events(kind, [fid]), KEYSET_FIELDS, limit=limit)
+        if not rows and not spec["owner"].objects.filter(**{spec["fid"]: fid}).exists():
+            return None
+        first_date = rows[0]["date"] if rows else None
+        timeline = {
+            spec["fid"]: fid,
+            "events": _timeline_events(kind, rows, first_date),
+            "transitions": TRANSITIONS[kind]([fid]).get(fid, []),
+        }
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [first_date.isoformat(), last["date"].isoformat(), last["id"]]
+        )
+    return timeline, next_cursor
+
+
+def timelines(kind, fids):
+    """
+    Whole timelines of up to MAX_TIMELINE_BATCH packages / bags, read in one
+    events query and one transitions query.
+
+    Returns {fid: timeline}; unknown fids are left out.
+    """
+    spec = TIMELINES[kind]
+    fids = list(dict.fromkeys(fids))
+    if len(fids) > MAX_TIMELINE_BATCH:
+        raise ValueError(f"At most {MAX_TIMELINE_BATCH} ids per request")
+
+    transitions = TRANSITIONS[kind](fids)
+    rows = _events(kind, fids).order_by(spec["fid"], *KEYSET_FIELDS)
+    result = {}
+    for fid, group in groupby(rows, key=itemgetter(spec["fid"])):
+        events = list(group)
+        result[fid] = {
+            spec["fid"]: fid,
+            "events": _timeline_events(kind, events, events[0]["date"]),
+            "transitions": transitions.get(fid, []),
+        }
+
+    # Bags created by package uploads have no events yet
+    empty = spec["owner"].objects.filter(
+        **{f"{spec['fid']}__in": [fid for fid in fids if fid not in result]}
+    )
+    for fid in empty.values_list(spec["fid"], flat=True):
+        result[fid] = {spec["fid"]: fid, "events": [], "transitions": []}
+
+    logger.debug(f"🕓 {len(result)} of {len(fids)} {kind} timelines found")
+    return result
@@ -1,39 +1,13 @@
+import logging
+
 import pandas as pd
 import numpy as np
-from core.models import Package, PackageTransition
-
-# ---------------------------
-
-df_etab = pd.read_csv("core/data/code_etablissement.csv")
-# Load duration matrix (SLA baselines)
-# ---------------------------
-def load_duration_matrix(path="core/data/wilayas_cleaned.csv"):
-    duration_matrix = pd.read_csv(path, index_col=0)
-
-    # Convert all values into Timedelta safely
-    def to_timedelta_or_nat(x):
-        if pd.isna(x):
-            return pd.NaT
-        if isinstance(x, pd.Timedelta):
-            return x
-        if isinstance(x, (int, float, np.integer, np.floating)):
-            return pd.to_timedelta(float(x), unit="D")
-        try:
-            return pd.to_timedelta(str(x))
-        except Exception:
-            return pd.NaT
-
-    duration_matrix = duration_matrix.applymap(to_timedelta_or_nat)
-
-    # Harmonize indices/columns → int
-    duration_matrix.index = pd.to_numeric(duration_matrix.index, errors="coerce")
-    duration_matrix.columns = pd.to_numeric(duration_matrix.columns, errors="coerce")
-    duration_matrix = duration_matrix.dropna(axis=0, how="all").dropna(axis=1, how="all")
-    duration_matrix.index = duration_matrix.index.astype(int)
-    duration_matrix.columns = duration_matrix.columns.astype(int)
-
-    return duration_matrix
+from django.db import transaction
+from core.models import PackageEvent, PackageTransition
+from core.utils.bulk_loader import bulk_insert
+from core.utils.reference_data import get_reference, sla_array
 
+logger = logging.getLogger(__name__)
 
 # ---------------------------
 # New → Old wilaya mapping
@@ -57,93 +31,146 @@ def canonical_old_wilaya(code_upw):
     return new_to_old.get(n, n)
 
 
+def canonical_old_wilayas(codes_upw):
+    """canonical_old_wilaya() of a whole column (Int64, <NA> if not mappable)"""
+    codes = np.trunc(pd.to_numeric(codes_upw, errors="coerce"))
+    return codes.replace(new_to_old).astype("Int64")
+
+
 # ---------------------------
 # Build transitions
 # ---------------------------
-def build_transitions(df_clean, df_etab, duration_matrix=None):
-    """
-    Build PackageTransition rows based on block-to-block transitions.
-    df_clean : cleaned package events (DataFrame)
-    df_etab  : postal office lookup (DataFrame with bp_nm → code_upw)
-    duration_matrix : SLA baseline matrix (DataFrame)
-    """
+TRANSITION_FIELDS = [
+    "package_id",
+    "origin_upw",
+    "dest_upw",
+    "actual_duration",
+    "allowed_duration",
+    "late",
+]
 
-    if duration_matrix is None:
-        duration_matrix = load_duration_matrix()
 
-    print(">>> build_transitions CALLED with", len(df_clean), "rows")
+TRANSITION_BATCH_SIZE = 1000
 
-    transitions_to_create = []
 
-    # Merge postal office → UPW
-    df_clean = df_clean.merge(
+def _blocks(events, df_etab):
+    """
+    One row per (package, UPW) "block" with its first & last timestamps,
+    ordered within each package by the block's first row in `events`.
+    """
+    events = events[["package_id", "date", "etablissement_postal"]].merge(
         df_etab[["bp_nm", "code_upw"]],
-        left_on="établissement_postal",
+        left_on="etablissement_postal",
         right_on="bp_nm",
-        how="left"
+        how="left",
     )
-
-    # Preload Package.id lookup
-    unique_ids = df_clean["MAILITM_FID"].unique()
-    package_map = dict(
-        Package.objects.filter(mailitm_fid__in=unique_ids)
-        .values_list("mailitm_fid", "id")
+    events = events.assign(
+        date=pd.to_datetime(events["date"]),
+        missing_date=events["date"].isna(),
+        row=np.arange(len(events)),
+    ).dropna(subset=["package_id", "code_upw"])
+
+    blocks = (
+        events.groupby(["package_id", "code_upw"], sort=False)
+        .agg(
+            first_time=("date", "min"),
+            last_time=("date", "max"),
+            missing_date=("missing_date", "any"),
+            first_row=("row", "min"),
+        )
+        .reset_index()
+        .sort_values(["package_id", "first_row"], kind="mergesort")
     )
+    # A missing date sorts last, it is the block's last timestamp
+    blocks["last_time"] = blocks["last_time"].mask(blocks["missing_date"])
+    return blocks
 
-    for pkg_id, df_pkg in df_clean.groupby("MAILITM_FID"):
-        package_id = package_map.get(pkg_id)
-        if not package_id:
-            continue
-
-        # ensure datetime
-        df_pkg["date"] = pd.to_datetime(df_pkg["date"])
-
-        # ---------------------------
-        # Build "blocks" per UPW (first & last timestamps)
-        # ---------------------------
-        blocks = []
-        for code_upw, group in df_pkg.groupby("code_upw", sort=False):
-            times = group["date"].sort_values()
-            blocks.append({
-                "code_upw": code_upw,
-                "first_time": times.iloc[0],
-                "last_time": times.iloc[-1],
-            })
-
-        # ---------------------------
-        # Evaluate transitions block → block
-        # ---------------------------
-        for i in range(len(blocks) - 1):
-            prev, nxt = blocks[i], blocks[i + 1]
-            o_raw, d_raw = prev["code_upw"], nxt["code_upw"]
-            o_can, d_can = canonical_old_wilaya(o_raw), canonical_old_wilaya(d_raw)
-            actual = nxt["first_time"] - prev["last_time"]
-
-            allowed, late = None, None
-
-            if o_can is not None and d_can is not None:
-                if (o_can in duration_matrix.index) and (d_can in duration_matrix.columns):
-                    allowed_val = duration_matrix.loc[o_can, d_can]
-                    if pd.notna(allowed_val):
-                        allowed = allowed_val
-                        late = actual > allowed
-
-            transitions_to_create.append(
-                PackageTransition(
-                    package_id=package_id,
-                    origin_upw=o_can,
-                    dest_upw=d_can,
-                    actual_duration=actual,
-                    allowed_duration=allowed,
-                    late=bool(late) if late is not None else False,
-                )
-            )
+
+def transitions_frame(events, df_etab=None, duration_matrix=None):
+    """
+    PackageTransition rows (TRANSITION_FIELDS columns) of package events.
+    events : package_id, date, etablissement_postal; each package's events
+             in chronological order
+    df_etab  : postal office lookup (DataFrame with bp_nm → code_upw),
+               defaults to the "establishments" reference data
+    duration_matrix : SLA baseline matrix (DataFrame), defaults to the
+               "sla_matrix" reference data
+
+    A package's events are grouped into one block per UPW, and each block
+    transitions to the package's next block. Everything is computed
+    column-wise over the whole frame.
+    """
+    if df_etab is None:
+        df_etab = get_reference("establishments")
+    if duration_matrix is None:
+        sla = get_reference("sla_matrix")
+    else:
+        sla = sla_array(duration_matrix)
 
     # ---------------------------
-    # Bulk insert
+    # Pair every block with the next block of its package
     # ---------------------------
-    if transitions_to_create:
-        PackageTransition.objects.bulk_create(transitions_to_create, batch_size=1000)
-        print(f">>> {len(transitions_to_create)} transitions created")
-    else:
-        print(">>> No transitions created")
+    blocks = _blocks(events, df_etab)
+    nxt = blocks.groupby("package_id", sort=False)[["code_upw", "first_time"]].shift(-1)
+    has_next = nxt["code_upw"].notna()
+    prev, nxt = blocks[has_next], nxt[has_next]
+
+    origin = canonical_old_wilayas(prev["code_upw"])
+    dest = canonical_old_wilayas(nxt["code_upw"])
+    actual = nxt["first_time"] - prev["last_time"]
+
+    # ---------------------------
+    # SLA lookup: index straight into the matrix array
+    # ---------------------------
+    o = origin.fillna(-1).to_numpy(dtype=int)
+    d = dest.fillna(-1).to_numpy(dtype=int)
+    found = (o >= 0) & (o < len(sla)) & (d >= 0) & (d < len(sla))
+    allowed = pd.Series(pd.NaT, index=prev.index, dtype="timedelta64[ns]")
+    allowed[found] = sla[o[found], d[found]]
+    late = (actual > allowed) & allowed.notna()
+
+    return pd.DataFrame(
+        {
+            "package_id": prev["package_id"],
+            "origin_upw": origin,
+            "dest_upw": dest,
+            "actual_duration": actual,
+            "allowed_duration": allowed,
+            "late": late,
+        }
+    )
+
+
+def rebuild_transitions(package_ids, df_etab=None, duration_matrix=None):
+    """
+    Recompute the transitions of these packages from all of their stored
+    events and replace their PackageTransition rows, in one transaction.
+    Re-uploading the same events leaves the table unchanged.
+    Returns the number of transitions written.
+    """
+    package_ids = sorted(set(package_ids))
+    logger.info(f"Rebuilding transitions of {len(package_ids)} packages...")
+    created = 0
+    for i in range(0, len(package_ids), TRANSITION_BATCH_SIZE):
+        batch = package_ids[i : i + TRANSITION_BATCH_SIZE]
+        events = pd.DataFrame.from_records(
+            list(
+                PackageEvent.objects.filter(package_id__in=batch)
+                .order_by("package_id", "date", "id")
+                .values_list("package_id", "date", "etablissement_postal")
+            ),
+            columns=["package_id", "date", "etablissement_postal"],
+        )
+        transitions = transitions_frame(events, df_etab, duration_matrix)
+
+        with transaction.atomic():
+            PackageTransition.objects.filter(package_id__in=batch).delete()
+            bulk_insert(
+                PackageTransition,
+                transitions,
+                {field: field for field in TRANSITION_FIELDS},
+            )
+        created += len(transitions)
+
+    logger.info(f"✅ {created} transitions written")
+    return created
@@ -0,0 +1,93 @@
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Staging
+# ----------------------------
+def stage_upload(file_obj, kind):
+    """
+    Write an uploaded file to UPLOAD_STAGING_DIR and create its queued UploadJob.
+    """
+    staging_dir = settings.UPLOAD_STAGING_DIR
+    os.makedirs(staging_dir, exist_ok=True)
+
+    filename = os.path.basename(getattr(file_obj, "name", "") or "upload.csv")
+    file_path = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{filename}")
+    with open(file_path, "wb") as out:
+        for chunk in file_obj.chunks():
+            out.write(chunk)
+
+    job = UploadJob.objects.create(
+        kind=kind,
+        filename=filename,
+        file_size_bytes=getattr(file_obj, "size", 0) or 0,
+        file_path=file_path,
+    )
+    logger.info(f"📥 Staged {filename} as {kind} job #{job.id} ({file_path})")
+    return job
+
+
+def discard_staged_file(job):
+    try:
+        os.remove(job.file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"⚠️ Could not remove staged file {job.file_path}: {e}")
+
+
+# ----------------------------
+# Progress reporting (no-ops when job is None)
+# ----------------------------
+@contextmanager
+def track_phase(job, phase):
+    """Mark `phase` as current on the job and record how long it took."""
+    start = time.time()
+    if job is not None:
+        job.phase = phase
+        job.save(update_fields=["phase"])
+    logger.debug(f"▶️ Phase '{phase}' started")
+    yield
+    elapsed = round(time.time() - start, 3)
+    logger.debug(f"⏱️ Phase '{phase}' finished in {elapsed}s")
+    if job is not None:
+        # Phases repeat once per chunk when streaming: keep the running total
+        total = round(job.phase_timings.get(phase, 0) + elapsed, 3)
+        job.phase_timings = {**job.phase_timings, phase: total}
+        job.save(update_fields=["phase_timings"])
+
+
+def report_rows(job, rows_processed, rows_total=None):
+    if job is None:
+        return
+    job.rows_processed = rows_processed
+    fields = ["rows_processed"]
+    if rows_total is not None:
+        job.rows_total = rows_total
+        fields.append("rows_total")
+    job.save(update_fields=fields)
+
+
+def mark_running(job):
+    job.status = UploadJob.Status.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "started_at"])
+
+
+def mark_finished(job, result=None, error=None):
+    job.status = UploadJob.Status.FAILURE if error else UploadJob.Status.SUCCESS
+    job.result = result
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "error", "finished_at"])
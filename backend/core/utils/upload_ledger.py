@@ -0,0 +1,69 @@
+import hashlib
+import logging
+
+import pandas as pd
+
+from core.models import UploadChunk
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# ----------------------------
+# Hashing
+# ----------------------------
+def file_sha256(file_obj):
+    """sha256 of a file's content, read in blocks; the file is rewound."""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def frame_sha256(df):
+    """sha256 of a frame's rows (values and index, not dtypes)."""
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(df).to_numpy().tobytes()
+    ).hexdigest()
+
+
+def find_duplicate_upload(metadata_model, content_hash):
+    """Metadata of an earlier, completed upload of the same content, if any."""
+    return (
+        metadata_model.objects.filter(content_hash=content_hash)
+        .order_by("-upload_timestamp")
+        .first()
+    )
+
+
+# ----------------------------
+# Chunk ledger (resumable streaming)
+# ----------------------------
+def committed_chunk_counts(kind, content_hash, chunk_index, chunk_hash):
+    """
+    Counts recorded for this chunk by an earlier run of the same file, or
+    None when it still has to be loaded.
+    """
+    chunk = UploadChunk.objects.filter(
+        kind=kind, content_hash=content_hash, chunk_index=chunk_index
+    ).first()
+    if chunk is None or chunk.chunk_hash != chunk_hash:
+        return None
+    return chunk.counts
+
+
+def record_chunk(kind, content_hash, chunk_index, chunk_hash, counts):
+    UploadChunk.objects.update_or_create(
+        kind=kind,
+        content_hash=content_hash,
+        chunk_index=chunk_index,
+        defaults={"chunk_hash": chunk_hash, "counts": counts},
+    )
+
+
+def clear_chunks(kind, content_hash):
+    """Forget the chunks of a file once its upload completed."""
+    UploadChunk.objects.filter(kind=kind, content_hash=content_hash).delete()
@@ -5,6 +5,13 @@ from .refresh import RefreshDashboard
 from .upload import UploadCSVAndSave, PackageStatsAPIView, TransitionReportAPIView
 from .rebuild_kpi_snapshots import RebuildSnapshotsAPIView
 from .upload_bags import UploadBagsCSV
+from .jobs import UploadJobAPIView
+from .timeline import (
+    BagTimelineAPIView,
+    BagTimelineBatchAPIView,
+    PackageTimelineAPIView,
+    PackageTimelineBatchAPIView,
+)
 
 __all__ = [
     "DashboardApiView",
@@ -17,4 +24,9 @@ __all__ = [
     "TransitionReportAPIView",
     "RebuildSnapshotsAPIView",
     "UploadBagsCSV",
+    "UploadJobAPIView",
+    "PackageTimelineAPIView",
+    "PackageTimelineBatchAPIView",
+    "BagTimelineAPIView",
+    "BagTimelineBatchAPIView",
 ]
@@ -1,7 +1,5 @@
 import logging
 from datetime import datetime
-from django.db.models import Avg
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,6 +7,7 @@ from rest_framework import status
 
 from core.models import Dashboard
 from core.serializers.dashboard import DashboardSerializer
+from core.utils.kpi_rollups import INTERVALS, kpi_series
 
 logger = logging.getLogger(__name__)
 
@@ -30,17 +29,26 @@ class DashboardApiView(APIView):
             )
 
     def post(self, request):
-        kpi_field_name = request.data.get("kpi_field_name")
+        """
+        Average of a KPI per day / week / month. Send "kpi_field_names" (a
+        list) instead of "kpi_field_name" to get several KPIs at once.
+        """
+        kpi_field_names = request.data.get("kpi_field_names")
+        batch = bool(kpi_field_names)
+        if not batch:
+            kpi_field_names = [request.data.get("kpi_field_name")]
         start_date = request.data.get("start_date")
         end_date = request.data.get("end_date")
         interval = request.data.get("interval", "daily")
 
         # --- Validate required fields ---
         missing_fields = [
-            field
-            for field in ["kpi_field_name", "start_date", "end_date"]
-            if not request.data.get(field)
+            field for field in ["start_date", "end_date"] if not request.data.get(field)
         ]
+        if not isinstance(kpi_field_names, list) or not all(
+            isinstance(name, str) and name for name in kpi_field_names
+        ):
+            missing_fields.insert(0, "kpi_field_name")
         if missing_fields:
             logger.error(
                 f"[POST:dashboard/] Missing fields: {', '.join(missing_fields)}"
@@ -50,7 +58,7 @@ class DashboardApiView(APIView):
                     "success": False,
                     "message": (
                         "Missing fields. Expected payload: "
-                        "{ kpi_field_name: str, start_date: ISODate, end_date: ISODate, interval?: daily|weekly|monthly }"
+                        "{ kpi_field_name: str | kpi_field_names: str[], start_date: ISODate, end_date: ISODate, interval?: daily|weekly|monthly }"
                     ),
                 },
                 status=status.HTTP_400_BAD_REQUEST,
@@ -67,16 +75,20 @@ class DashboardApiView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # --- Validate KPI field ---
-        if not hasattr(Dashboard, kpi_field_name):
-            logger.warning(f"Invalid KPI field requested: {kpi_field_name}")
-            return Response(
-                {"success": False, "message": f"Invalid KPI field '{kpi_field_name}'."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        # --- Validate KPI fields ---
+        for kpi_field_name in kpi_field_names:
+            if not hasattr(Dashboard, kpi_field_name):
+                logger.warning(f"Invalid KPI field requested: {kpi_field_name}")
+                return Response(
+                    {
+                        "success": False,
+                        "message": f"Invalid KPI field '{kpi_field_name}'.",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
         # --- Validate interval ---
-        valid_intervals = ["daily", "weekly", "monthly"]
+        valid_intervals = list(INTERVALS)
         if interval not in valid_intervals:
             logger.warning(f"Invalid interval: {interval}")
             return Response(
@@ -87,29 +99,19 @@ class DashboardApiView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # --- Choose truncation function ---
-        trunc_map = {
-            "daily": TruncDay("timestamp"),
-            "weekly": TruncWeek("timestamp"),
-            "monthly": TruncMonth("timestamp"),
-        }
-        trunc_func = trunc_map[interval]
-
-        # --- Query Dashboard directly ---
-        queryset = (
-            Dashboard.objects.filter(timestamp__range=(start_date, end_date))
-            .annotate(period=trunc_func)
-            .values("period")
-            .annotate(avg_value=Avg(kpi_field_name))
-            .order_by("period")
+        # --- Read the pre-aggregated (and cached) series ---
+        series = kpi_series(
+            "dashboard", kpi_field_names, start_date, end_date, interval
         )
 
-        if not queryset.exists():
-            logger.info(f"No Dashboard data found for {kpi_field_name} in given range.")
+        if not any(series.values()):
+            logger.info(
+                f"No Dashboard data found for {kpi_field_names} in given range."
+            )
             return Response(
                 {
                     "success": False,
-                    "message": f"No data found for '{kpi_field_name}' in that date range.",
+                    "message": f"No data found for '{', '.join(kpi_field_names)}' in that date range.",
                 },
                 status=status.HTTP_404_NOT_FOUND,
             )
@@ -124,25 +126,37 @@ class DashboardApiView(APIView):
                 return dt.strftime("%d/%m")
 
         # --- Format results ---
-        data = []
-        for item in queryset:
-            period: datetime = item["period"]
-            data.append(
+        data = {
+            kpi_field_name: [
                 {
                     "timestamp": period.isoformat(),
-                    "value": item["avg_value"],
+                    "value": value,
                     "kpi_name": kpi_field_name,
                     "name": format_name(period, interval),
                 }
-            )
+                for period, value in points
+            ]
+            for kpi_field_name, points in series.items()
+        }
 
+        if batch:
+            return Response(
+                {
+                    "success": True,
+                    "kpis": kpi_field_names,
+                    "interval": interval,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "data": data,
+                }
+            )
         return Response(
             {
                 "success": True,
-                "kpi": kpi_field_name,
+                "kpi": kpi_field_names[0],
                 "interval": interval,
                 "start_date": start_date,
                 "end_date": end_date,
-                "data": data,
+                "data": data[kpi_field_names[0]],
             }
         )
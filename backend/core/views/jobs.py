@@ -0,0 +1,58 @@
+import logging
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.models import UploadJob
+from core.serializers import UploadJobSerializer
+from core.tasks import run_upload_job
+from core.utils.upload_jobs import mark_finished, stage_upload
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_upload(file_obj, kind):
+    """Stage an uploaded file, queue its ingestion and answer with the job id."""
+    return enqueue_job(stage_upload(file_obj, kind), run_upload_job)
+
+
+def enqueue_job(job, task):
+    """Queue `task` for an UploadJob and answer 202 with the job id."""
+    try:
+        task.delay(job.id)
+    except Exception as e:
+        logger.exception(f"❌ Could not queue {job.kind} job #{job.id}")
+        mark_finished(job, error=f"Could not queue job: {e}")
+        return Response(
+            {"error": str(e), "job_id": job.id},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    job.refresh_from_db()
+    return Response(
+        {
+            "status": job.status,
+            "job_id": job.id,
+            "job_url": f"/jobs/{job.id}/",
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+class UploadJobAPIView(APIView):
+    """
+    GET /jobs/<int:job_id>/
+
+    Reports phase, row progress, per-phase timings and final counts of an upload
+    or a snapshots rebuild.
+    """
+
+    def get(self, request, job_id, format=None):
+        try:
+            job = UploadJob.objects.get(pk=job_id)
+        except UploadJob.DoesNotExist:
+            return Response(
+                {"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(UploadJobSerializer(job).data, status=status.HTTP_200_OK)
@@ -3,17 +3,16 @@ from datetime import datetime
 import logging
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Avg
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
 from core.models import AirportStats, CPXStats, CTNIStats
 from core.serializers import (
     AirportStatsSerializer,
     CPXStatsSerializer,
     CTNIStatsSerializer,
 )
+from core.utils.kpi_rollups import INTERVALS, kpi_series
 
 logger = logging.getLogger(__name__)
 
@@ -87,17 +86,24 @@ class MajorCentersAPIView(APIView):
     # 📊 POST: Historical KPI Aggregation
     # ─────────────────────────────────────────────
     def post(self, request, centerID):
-        kpi_field_name = request.data.get("kpi_field_name")
+        """
+        Average of a KPI per day / week / month. Send "kpi_field_names" (a
+        list) instead of "kpi_field_name" to get several KPIs at once.
+        """
+        kpi_field_names = request.data.get("kpi_field_names")
+        batch = bool(kpi_field_names)
+        if not batch:
+            kpi_field_names = [request.data.get("kpi_field_name")]
         start_date = request.data.get("start_date")
         end_date = request.data.get("end_date")
         interval = request.data.get("interval", "daily")
         logger.debug(f"post request with the following data: {request.data}")
         # Validate payload
-        missing = [
-            f
-            for f in ["kpi_field_name", "start_date", "end_date"]
-            if not request.data.get(f)
-        ]
+        missing = [f for f in ["start_date", "end_date"] if not request.data.get(f)]
+        if not isinstance(kpi_field_names, list) or not all(
+            isinstance(name, str) and name for name in kpi_field_names
+        ):
+            missing.insert(0, "kpi_field_name")
         if missing:
             logger.error(f"Missing body fields: {missing}")
             return Response(
@@ -105,7 +111,7 @@ class MajorCentersAPIView(APIView):
                     "success": False,
                     "message": (
                         f"Missing fields: {', '.join(missing)}. "
-                        "Expected payload: { kpi_field_name, start_date, end_date, interval? }"
+                        "Expected payload: { kpi_field_name | kpi_field_names, start_date, end_date, interval? }"
                     ),
                 },
                 status=status.HTTP_400_BAD_REQUEST,
@@ -143,16 +149,20 @@ class MajorCentersAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Check KPI field
-        if not hasattr(Model, kpi_field_name):
-            logger.error(f"Non-existant field name: {kpi_field_name}")
-            return Response(
-                {"success": False, "message": f"Invalid KPI field '{kpi_field_name}'."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        # Check KPI fields
+        for kpi_field_name in kpi_field_names:
+            if not hasattr(Model, kpi_field_name):
+                logger.error(f"Non-existant field name: {kpi_field_name}")
+                return Response(
+                    {
+                        "success": False,
+                        "message": f"Invalid KPI field '{kpi_field_name}'.",
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
         # Validate interval
-        valid_intervals = ["daily", "weekly", "monthly"]
+        valid_intervals = list(INTERVALS)
         if interval not in valid_intervals:
             logger.error(
                 f"invalid interval, you: {interval}, available options: daily, weekly, monthly"
@@ -165,27 +175,14 @@ class MajorCentersAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        trunc_map = {
-            "daily": TruncDay("timestamp"),
-            "weekly": TruncWeek("timestamp"),
-            "monthly": TruncMonth("timestamp"),
-        }
-        trunc_func = trunc_map[interval]
-
-        # Query aggregation
-        queryset = (
-            Model.objects.filter(timestamp__range=(start_date, end_date))
-            .annotate(period=trunc_func)
-            .values("period")
-            .annotate(avg_value=Avg(kpi_field_name))
-            .order_by("period")
-        )
+        # Pre-aggregated (and cached) series
+        series = kpi_series(centerID, kpi_field_names, start_date, end_date, interval)
 
-        if not queryset.exists():
+        if not any(series.values()):
             return Response(
                 {
                     "success": False,
-                    "message": f"No data found for '{kpi_field_name}' in that range.",
+                    "message": f"No data found for '{', '.join(kpi_field_names)}' in that range.",
                 },
                 status=status.HTTP_404_NOT_FOUND,
             )
@@ -199,24 +196,39 @@ class MajorCentersAPIView(APIView):
             else:
                 return dt.strftime("%d/%m")
 
-        data = [
-            {
-                "timestamp": item["period"].isoformat(),
-                "value": item["avg_value"],
-                "kpi_name": kpi_field_name,
-                "name": format_name(item["period"], interval),
-            }
-            for item in queryset
-        ]
+        data = {
+            kpi_field_name: [
+                {
+                    "timestamp": period.isoformat(),
+                    "value": value,
+                    "kpi_name": kpi_field_name,
+                    "name": format_name(period, interval),
+                }
+                for period, value in points
+            ]
+            for kpi_field_name, points in series.items()
+        }
 
+        if batch:
+            return Response(
+                {
+                    "success": True,
+                    "center": centerID,
+                    "kpis": kpi_field_names,
+                    "interval": interval,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "data": data,
+                }
+            )
         return Response(
             {
                 "success": True,
                 "center": centerID,
-                "kpi": kpi_field_name,
+                "kpi": kpi_field_names[0],
                 "interval": interval,
                 "start_date": start_date,
                 "end_date": end_date,
-                "data": data,
+                "data": data[kpi_field_names[0]],
             }
         )
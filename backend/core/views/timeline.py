@@ -0,0 +1,107 @@
+import logging
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.utils.keyset_pagination import page_size
+from core.utils.timeline import MAX_TIMELINE_BATCH, timeline_page, timelines
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineAPIView(APIView):
+    """
+    GET /<kind>s/<fid>/timeline?limit=200&cursor=...
+
+    Events of one package / bag in date order, with the time since the first
+    and the previous event and the office / state names. Pages are keyset
+    paginated: pass the returned next_cursor to get the following page. The
+    first page also lists the transitions.
+    """
+
+    kind = None
+
+    def get(self, request, fid, format=None):
+        try:
+            limit = page_size(request.query_params.get("limit"))
+            page = timeline_page(
+                self.kind, fid, request.query_params.get("cursor"), limit
+            )
+        except ValueError as e:
+            logger.warning(f"Invalid {self.kind} timeline request: {e}")
+            return Response(
+                {"success": False, "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if page is None:
+            return Response(
+                {"success": False, "message": f"No {self.kind} {fid!r}."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        timeline, next_cursor = page
+        return Response(
+            {"success": True, "data": timeline, "next_cursor": next_cursor},
+            status=status.HTTP_200_OK,
+        )
+
+
+class TimelineBatchAPIView(APIView):
+    """
+    POST /<kind>s/timelines  { ids: str[] }
+
+    Whole timelines of up to MAX_TIMELINE_BATCH packages / bags, keyed by id.
+    Unknown ids are listed in "missing".
+    """
+
+    kind = None
+
+    def post(self, request, format=None):
+        ids = request.data.get("ids")
+        if (
+            not isinstance(ids, list)
+            or not ids
+            or not all(isinstance(fid, str) and fid for fid in ids)
+        ):
+            return Response(
+                {
+                    "success": False,
+                    "message": "Missing fields. Expected payload: { ids: str[] }",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(ids) > MAX_TIMELINE_BATCH:
+            return Response(
+                {
+                    "success": False,
+                    "message": f"At most {MAX_TIMELINE_BATCH} ids per request.",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        data = timelines(self.kind, ids)
+        return Response(
+            {
+                "success": True,
+                "data": data,
+                "missing": [fid for fid in dict.fromkeys(ids) if fid not in data],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class PackageTimelineAPIView(TimelineAPIView):
+    kind = "package"
+
+
+class BagTimelineAPIView(TimelineAPIView):
+    kind = "bag"
+
+
+class PackageTimelineBatchAPIView(TimelineBatchAPIView):
+    kind = "package"
+
+
+class BagTimelineBatchAPIView(TimelineBatchAPIView):
+    kind = "bag"